@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the two agent chains writing a trip: the two step chain (itinerary,
+then the list of places extracted from it) and the single call chain writing
+both at once.
+
+Each query is run --repeats times through each chain, without validation, and
+the median latency, number of LLM calls and mean token usage are reported. This
+calls the live LLM APIs, so it needs the keys of load_secrets and costs tokens.
+Token usage is only reported for OpenAI models.
+
+    python -m benchmarks.run_agent_benchmarks
+    python -m benchmarks.run_agent_benchmarks --model gpt-4 --output agent.json
+"""
+
+from travel_mapper.agent.Agent import Agent
+from travel_mapper.TravelMapper import load_secrets, assert_secrets
+from travel_mapper.user_interface.constants import EXAMPLE_QUERY
+from travel_mapper.constants import MODEL_NAME
+from langchain.callbacks import get_openai_callback
+from langchain.callbacks.base import BaseCallbackHandler
+import numpy as np
+import argparse
+import logging
+import json
+import time
+
+QUERIES = (
+    EXAMPLE_QUERY,
+    "A 3 day walking tour of Rome, starting at the Colosseum and ending at the Vatican.",
+    "I want to drive from Seattle to Vancouver over a weekend and see some nature on the way.",
+)
+REPEATS = 3
+CHAINS = {"two_step": False, "single_call": True}
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.calls += 1
+
+
+def run_chain(agent, query, single_call):
+    """
+
+    Parameters
+    ----------
+    agent
+    query
+    single_call
+
+    Returns
+    -------
+    dict of metrics of a single run
+    """
+    counter = LLMCallCounter()
+    with get_openai_callback() as token_usage:
+        t1 = time.time()
+        agent._get_suggestions(query, callbacks=[counter], single_call=single_call)
+        wall_time = time.time() - t1
+    return {
+        "wall_time_s": wall_time,
+        "llm_calls": counter.calls,
+        "prompt_tokens": token_usage.prompt_tokens,
+        "completion_tokens": token_usage.completion_tokens,
+        "total_tokens": token_usage.total_tokens,
+    }
+
+
+def run_benchmarks(agent, queries=QUERIES, repeats=REPEATS):
+    """
+
+    Parameters
+    ----------
+    agent
+    queries
+    repeats
+
+    Returns
+    -------
+    dict of chain name to its metrics over all the runs
+    """
+    results = {}
+    for name, single_call in CHAINS.items():
+        runs = []
+        for query in queries:
+            for _ in range(repeats):
+                try:
+                    runs.append(run_chain(agent, query, single_call))
+                except Exception as e:
+                    # e.g. output the parser could not read
+                    print("{} failed on {!r}: {}".format(name, query[:40], e))
+        if not runs:
+            continue
+        results[name] = {
+            "runs": len(runs),
+            "failures": len(queries) * repeats - len(runs),
+            "median_wall_time_s": float(np.median([r["wall_time_s"] for r in runs])),
+        }
+        for metric in [
+            "llm_calls",
+            "prompt_tokens",
+            "completion_tokens",
+            "total_tokens",
+        ]:
+            results[name]["mean_" + metric] = float(np.mean([r[metric] for r in runs]))
+        print_metrics(name, results[name])
+    return results
+
+
+def print_metrics(name, metrics):
+    print(
+        "{:<12} {:>10.2f} s {:>10.1f} {:>12.0f} {:>12.0f} {:>8}".format(
+            name,
+            metrics["median_wall_time_s"],
+            metrics["mean_llm_calls"],
+            metrics["mean_prompt_tokens"],
+            metrics["mean_completion_tokens"],
+            metrics["failures"],
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the latency and token usage of the agent chains"
+    )
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", help="optional path of a json of the results")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    secrets = load_secrets()
+    assert_secrets(secrets)
+    # token usage is not reported for streamed responses, and cached responses
+    # would make every repeat after the first free
+    agent = Agent(
+        open_ai_api_key=secrets["OPENAI_API_KEY"],
+        google_palm_api_key=secrets["GOOGLE_PALM_API_KEY"],
+        model=args.model,
+        debug=False,
+        streaming=False,
+        cache_responses=False,
+        cache_similar_queries=False,
+    )
+
+    print(
+        "{:<12} {:>12} {:>10} {:>12} {:>12} {:>8}".format(
+            "chain", "median time", "LLM calls", "prompt tok", "output tok", "failed"
+        )
+    )
+    results = run_benchmarks(agent, repeats=args.repeats)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"model": args.model, "results": results}, f, indent=2)
+        print("Saved results to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
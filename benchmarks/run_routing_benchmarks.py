@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks of the routing pipeline on synthetic trips, served by a local
+MapsStandInServer so that no API key or network access is needed.
+
+Each stage is timed (median of --repeats runs) and run once more under
+tracemalloc to record its peak allocations; the map stages also report the size
+of the html they produce. Allocations and html sizes are compared with a saved
+baseline and the run fails if any of them regressed beyond the tolerances below.
+Wall times depend on the machine the baseline was saved on, so they are only
+reported.
+
+    python -m benchmarks.run_routing_benchmarks
+    python -m benchmarks.run_routing_benchmarks --save-baseline
+"""
+
+from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.models import Route
+from travel_mapper.routing.MapsStandInServer import MapsStandInServer
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from travel_mapper.mapping.RouteMapper import RouteMapper
+from travel_mapper.user_interface.utils import generate_leafmap
+from urllib.request import urlopen
+import numpy as np
+import googlemaps
+import subprocess
+import tracemalloc
+import argparse
+import platform
+import tempfile
+import logging
+import socket
+import json
+import time
+import sys
+import os
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+WAYPOINT_COUNTS = (2, 10, 50, 100, 500)
+REPEATS = 3
+DISTANCE_PER_POINT_IN_KM = 0.25
+FAKE_API_KEY = "AIzaBenchmarkKey"
+
+# a metric regresses when it exceeds its baseline times the tolerance. Wall times
+# are not gated, a baseline saved on another machine says little about them
+TOLERANCES = {"peak_alloc_bytes": 1.25, "html_bytes": 1.1}
+
+
+def synthetic_trip(n_waypoints, seed=0, km_between_stops=80):
+    """
+    A trip as a random walk, with stops given as "lat,lng" strings that the
+    stand-in server geocodes to themselves
+
+    Parameters
+    ----------
+    n_waypoints
+    seed
+    km_between_stops
+
+    Returns
+    -------
+    list_of_places dict with start, end and waypoints
+    """
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(0, 2 * np.pi, n_waypoints + 1)
+    steps = km_between_stops / 111 * np.column_stack((np.sin(angles), np.cos(angles)))
+    stops = np.array([37.87, -122.27]) + np.vstack(([0, 0], np.cumsum(steps, axis=0)))
+    stops = ["{:.5f},{:.5f}".format(lat, lng) for lat, lng in stops]
+    return {"start": stops[0], "end": stops[-1], "waypoints": stops[1:-1]}
+
+
+def start_stand_in():
+    """
+    Run the stand-in in a subprocess, so that it neither competes for the GIL
+    nor shows up in the allocations of the benchmarks
+
+    Returns
+    -------
+    the process and its base url
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "travel_mapper.routing.MapsStandInServer",
+            "--port",
+            str(port),
+        ],
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = "http://127.0.0.1:{}".format(port)
+    for _ in range(100):
+        try:
+            urlopen(base_url + "/maps/api/geocode/json?address=ping").read()
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The maps stand-in server did not start")
+
+
+def make_route_finder(base_url, cache_dir):
+    route_finder = RouteFinder(
+        google_maps_api_key=FAKE_API_KEY,
+        base_url=base_url,
+        geocode_cache=GeocodeCache(path=os.path.join(cache_dir, "geocode.sqlite")),
+        directions_cache=DirectionsCache(
+            path=os.path.join(cache_dir, "directions.sqlite")
+        ),
+        # the quota is not what is being measured
+        requests_per_second=10**6,
+    )
+    route_finder.gmaps = googlemaps.Client(
+        key=FAKE_API_KEY,
+        base_url=base_url,
+        queries_per_second=10**6,
+        retry_over_query_limit=False,
+    )
+    route_finder.mapper.save_map = False
+    return route_finder
+
+
+def measure(run, setup=None, repeats=REPEATS):
+    """
+
+    Parameters
+    ----------
+    run: callable taking the output of setup. If it returns a string, that is
+        taken to be html and its size is reported
+    setup: optional callable run before each call of run, outside the timings
+    repeats
+
+    Returns
+    -------
+    dict of metrics
+    """
+    setup = setup or (lambda: None)
+    wall_times = []
+    for _ in range(repeats):
+        state = setup()
+        t1 = time.perf_counter()
+        run(state)
+        wall_times.append(time.perf_counter() - t1)
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        output = run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    metrics = {"wall_time_s": float(np.median(wall_times)), "peak_alloc_bytes": peak}
+    if isinstance(output, str):
+        metrics["html_bytes"] = len(output.encode())
+    return metrics
+
+
+def benchmark_trip(n_waypoints, base_url, repeats=REPEATS):
+    """
+
+    Parameters
+    ----------
+    n_waypoints
+    base_url
+    repeats
+
+    Returns
+    -------
+    dict of stage name to metrics
+    """
+    list_of_places = synthetic_trip(n_waypoints)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        n_runs = [0]
+
+        def cold_finder():
+            # fresh caches for every run, so that every request is made
+            n_runs[0] += 1
+            return make_route_finder(
+                base_url, os.path.join(tmp_dir, "cold_{}".format(n_runs[0]))
+            )
+
+        def build(route_finder):
+            return route_finder.build_route_segments(
+                list_of_places,
+                verbose=False,
+                distance_per_point_in_km=DISTANCE_PER_POINT_IN_KM,
+            )
+
+        results["build_route_segments_cold"] = measure(build, cold_finder, repeats)
+        warm_finder = make_route_finder(base_url, os.path.join(tmp_dir, "warm"))
+        route, sampled_route, _ = build(warm_finder)
+        results["build_route_segments_warm"] = measure(
+            build, lambda: warm_finder, repeats
+        )
+
+    # the raw payload of the whole trip, as a single directions call would give it
+    stand_in = MapsStandInServer()
+    stand_in.httpd.server_close()
+    stops = [list_of_places["start"]] + list_of_places["waypoints"]
+    directions_result = stand_in.synthetic_directions(
+        {
+            "origin": stops[0],
+            "destination": list_of_places["end"],
+            "waypoints": "|".join(stops[1:]),
+        }
+    )["routes"]
+
+    results["get_route"] = measure(
+        lambda _: RouteFinder.get_route(directions_result), repeats=repeats
+    )
+    results["sample_route_with_legs"] = measure(
+        lambda _: RouteFinder.sample_route_with_legs(route, DISTANCE_PER_POINT_IN_KM),
+        repeats=repeats,
+    )
+
+    # split the trip into segments the way build_route_segments does
+    segment_size = RouteFinder.MAX_WAYPOINTS_API_CALL + 1
+    segment_mapping_dicts = []
+    sampled_segments = []
+    for first_leg in range(0, len(route), segment_size):
+        legs = route.legs[first_leg : first_leg + segment_size]
+        mapping_dict = {"start": legs[0].start, "end": legs[-1].end}
+        for i, leg in enumerate(legs[1:]):
+            mapping_dict["waypoint_{}".format(i)] = leg.start
+        segment_mapping_dicts.append(mapping_dict)
+        sampled_segments.append(
+            Route(sampled_route.legs[first_leg : first_leg + segment_size])
+        )
+    results["assemble_final_route_from_segments"] = measure(
+        lambda _: RouteFinder.assemble_final_route_from_segments(
+            segment_mapping_dicts, sampled_segments
+        ),
+        repeats=repeats,
+    )
+
+    def folium_map(_):
+        mapper = RouteMapper()
+        mapper.save_map = False
+        mapper.generate_route_map(route, sampled_route)
+        return mapper.map.get_root().render()
+
+    results["map_folium"] = measure(folium_map, repeats=repeats)
+    results["map_leafmap"] = measure(
+        lambda _: generate_leafmap(route, sampled_route), repeats=repeats
+    )
+    return results
+
+
+def run_benchmarks(waypoint_counts=WAYPOINT_COUNTS, repeats=REPEATS):
+    """
+
+    Parameters
+    ----------
+    waypoint_counts
+    repeats
+
+    Returns
+    -------
+    dict of "stage/n_waypoints" to metrics
+    """
+    process, base_url = start_stand_in()
+    try:
+        results = {}
+        for n_waypoints in waypoint_counts:
+            for stage, metrics in benchmark_trip(
+                n_waypoints, base_url, repeats
+            ).items():
+                results["{}/{}".format(stage, n_waypoints)] = metrics
+                print_metrics("{}/{}".format(stage, n_waypoints), metrics)
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+
+def compare_to_baseline(results, baseline):
+    """
+
+    Parameters
+    ----------
+    results
+    baseline: results of an earlier run
+
+    Returns
+    -------
+    list of messages, one per regressed metric that has a tolerance
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            if metric not in TOLERANCES or metric not in baseline.get(name, {}):
+                continue
+            limit = baseline[name][metric] * TOLERANCES[metric]
+            if value > limit:
+                regressions.append(
+                    "{} {}: {:.4g} > {:.4g} (baseline {:.4g})".format(
+                        name, metric, value, limit, baseline[name][metric]
+                    )
+                )
+    return regressions
+
+
+def print_metrics(name, metrics):
+    print(
+        "{:<45} {:>10.4f} s {:>12.1f} KiB {:>10}".format(
+            name,
+            metrics["wall_time_s"],
+            metrics["peak_alloc_bytes"] / 1024,
+            metrics.get("html_bytes", ""),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the routing pipeline against a baseline"
+    )
+    parser.add_argument("--waypoints", type=int, nargs="+", default=WAYPOINT_COUNTS)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="overwrite the baseline with the results of this run",
+    )
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    print(
+        "{:<45} {:>12} {:>16} {:>10}".format(
+            "stage/waypoints", "wall time", "peak alloc", "html bytes"
+        )
+    )
+    results = run_benchmarks(args.waypoints, args.repeats)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "machine": {
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        print("Saved baseline to {}".format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, run with --save-baseline".format(args.baseline))
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare_to_baseline(results, baseline)
+    if regressions:
+        print("Regressions against {}:".format(args.baseline))
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+    print("No regressions against {}".format(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
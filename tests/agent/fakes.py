@@ -0,0 +1,90 @@
+import os
+import json
+import time
+from typing import Any, List, Optional
+from unittest import mock
+from langchain.llms.base import LLM
+from travel_mapper.agent.Agent import Agent
+
+TRIP_JSON = """```json
+{"start": "Berkeley, CA", "end": "New York, \\"NY\\"",
+ "waypoints": ["Reno, NV", "Salt Lake City, UT", "Chicago, IL"],
+ "transit": "driving"}
+```"""
+
+VALID = '{"plan_is_valid": "yes", "updated_request": ""}'
+NOT_VALID = '{"plan_is_valid": "no", "updated_request": "A shorter trip"}'
+ITINERARY = "- Start in Berkeley, CA\n- Drive to Reno, NV"
+ITINERARY_AND_TRIP_JSON = json.dumps(
+    dict(itinerary=ITINERARY, **json.loads(TRIP_JSON.strip("`json\n")))
+)
+
+
+class FakeAgentLLM(LLM):
+    """
+    Answers each of the agent's prompts after a delay, streaming its answers
+    """
+
+    model_name: str = "fake-agent"
+    temperature: float = 0
+    validation: str = VALID
+    delay_seconds: float = 0.3
+    validation_delay_seconds: float = 0.3
+    calls: List[str] = []
+
+    @property
+    def _llm_type(self):
+        return "fake-agent"
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ):
+        if "plan_is_valid" in prompt:
+            call, response = "validation", self.validation
+        elif "list of locations" in prompt:
+            call, response = "mapping", TRIP_JSON
+        elif "list of places" in prompt:
+            call, response = "itinerary_and_mapping", ITINERARY_AND_TRIP_JSON
+        else:
+            call, response = "itinerary", ITINERARY
+        self.calls.append(call)
+        if call == "validation":
+            time.sleep(self.validation_delay_seconds)
+        else:
+            time.sleep(self.delay_seconds)
+        for char in response:
+            run_manager.on_llm_new_token(char)
+        return response
+
+
+def make_fake_agent(
+    speculative,
+    validation=VALID,
+    validation_delay_seconds=0.3,
+    response_cache=None,
+    similar_query_cache=None,
+):
+    with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-fake"}):
+        agent = Agent(
+            open_ai_api_key="sk-fake",
+            google_palm_api_key=None,
+            debug=False,
+            speculative=speculative,
+            cache_responses=response_cache is not None,
+            response_cache=response_cache,
+            cache_similar_queries=similar_query_cache is not None,
+            similar_query_cache=similar_query_cache,
+        )
+    agent.chat_model = FakeAgentLLM(
+        validation=validation,
+        validation_delay_seconds=validation_delay_seconds,
+        calls=[],
+    )
+    agent.validation_chain = agent._set_up_validation_chain(debug=False)
+    agent.agent_chain = agent._set_up_agent_chain(debug=False)
+    agent.single_call_chain = agent._set_up_single_call_chain(debug=False)
+    return agent
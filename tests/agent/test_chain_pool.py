@@ -0,0 +1,98 @@
+import os
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from travel_mapper.agent.Agent import Agent
+from tests.agent.fakes import make_fake_agent, FakeAgentLLM, ITINERARY
+
+
+def make_pooled_agent():
+    agent = make_fake_agent(speculative=False)
+    built = []
+
+    def make_chat_model(model_name):
+        built.append(model_name)
+        # a slow build, so that concurrent first requests overlap
+        time.sleep(0.1)
+        return FakeAgentLLM(
+            model_name=model_name,
+            delay_seconds=0,
+            validation_delay_seconds=0,
+            calls=[],
+        )
+
+    agent._make_chat_model = mock.Mock(side_effect=make_chat_model)
+    return agent, built
+
+
+class TestAgentChainPoolMethods(unittest.TestCase):
+    def test_chains_are_built_once_per_model(self):
+        agent, built = make_pooled_agent()
+        chains = agent.chains("model-a")
+        self.assertIs(agent.chains("model-a"), chains)
+        self.assertIsNot(agent.chains("model-b"), chains)
+        self.assertEqual(built, ["model-a", "model-b"])
+
+        # the chains call the LLM of their model
+        for name in ["validation_chain", "agent_chain", "single_call_chain"]:
+            self.assertEqual(chains[name].chains[0].llm.model_name, "model-a")
+
+    def test_requests_use_the_chains_of_their_model(self):
+        agent, built = make_pooled_agent()
+        itinerary, _, _ = agent.suggest_travel(
+            "from Berkeley to Reno", model_name="model-a"
+        )
+        self.assertEqual(itinerary, ITINERARY)
+        self.assertEqual(
+            agent.chains("model-a")["chat_model"].calls,
+            ["validation", "itinerary", "mapping"],
+        )
+        # the default model was not called, nor changed
+        self.assertEqual(agent.chat_model.calls, [])
+        self.assertEqual(agent.chat_model.model_name, "fake-agent")
+
+        agent.suggest_travel("from Berkeley to Reno", model_name="model-a")
+        self.assertEqual(built, ["model-a"])
+
+    def test_concurrent_requests_share_the_chains(self):
+        agent, built = make_pooled_agent()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            chain_sets = list(executor.map(agent.chains, ["model-a"] * 8))
+        self.assertEqual(built, ["model-a"])
+        self.assertTrue(all(c is chain_sets[0] for c in chain_sets))
+
+    def test_use_model(self):
+        agent, built = make_pooled_agent()
+        agent.use_model("model-a")
+        self.assertIs(agent.chat_model, agent.chains("model-a")["chat_model"])
+        self.assertIs(agent.agent_chain, agent.chains("model-a")["agent_chain"])
+        self.assertEqual(agent.chains()["chat_model"].model_name, "model-a")
+        self.assertEqual(built, ["model-a"])
+
+    def test_models_that_fail_to_build_are_not_preloaded(self):
+        def make_chat_model(model_name):
+            if "bison" in model_name:
+                raise ImportError("No module named 'google.generativeai'")
+            return FakeAgentLLM(model_name=model_name, calls=[])
+
+        with mock.patch.object(
+            Agent, "_make_chat_model", side_effect=make_chat_model
+        ), mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-fake"}):
+            agent = Agent(
+                open_ai_api_key="sk-fake",
+                google_palm_api_key=None,
+                model="model-a",
+                debug=False,
+                cache_responses=False,
+                cache_similar_queries=False,
+                preload_models=["model-a", "text-bison-001", "model-b"],
+            )
+            self.assertEqual(sorted(agent._chain_sets), ["model-a", "model-b"])
+            # the model still fails when it is picked
+            with self.assertRaises(ImportError):
+                agent.chains("text-bison-001")
+
+
+if __name__ == "__main__":
+    unittest.main()
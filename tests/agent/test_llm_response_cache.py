@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from travel_mapper.agent.LLMResponseCache import LLMResponseCache
+from travel_mapper.agent.templates import ValidationTemplate, Validation
+from tests.agent.fakes import make_fake_agent
+
+
+class TestLLMResponseCacheMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = LLMResponseCache(
+            path=os.path.join(self.tmp_dir.name, "llm_responses.sqlite")
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_make_key(self):
+        prompt = ValidationTemplate().chat_prompt
+        key = self.cache.make_key(
+            "validation_output", {"query": "From Berkeley\n to Reno"}, "gpt", prompt, 0
+        )
+        self.assertEqual(
+            key,
+            self.cache.make_key(
+                "validation_output",
+                {"query": "from berkeley to reno "},
+                "gpt",
+                prompt,
+                0,
+            ),
+        )
+        for changed in [
+            ("mapping_list", {"query": "from berkeley to reno"}, "gpt", prompt, 0),
+            ("validation_output", {"query": "from berkeley to elko"}, "gpt", prompt, 0),
+            (
+                "validation_output",
+                {"query": "from berkeley to reno"},
+                "gpt-4",
+                prompt,
+                0,
+            ),
+            ("validation_output", {"query": "from berkeley to reno"}, "gpt", prompt, 1),
+        ]:
+            self.assertNotEqual(key, self.cache.make_key(*changed))
+
+    def test_parsed_responses(self):
+        self.assertIsNone(self.cache.get_response("validation_output", "key"))
+        validation = Validation(plan_is_valid="yes", updated_request="")
+        self.cache.set_response("key", validation)
+        self.assertEqual(
+            self.cache.get_response("validation_output", "key", Validation), validation
+        )
+        self.cache.set_response("other_key", "- Day 1")
+        self.assertEqual(
+            self.cache.get_response("agent_suggestion", "other_key"), "- Day 1"
+        )
+        stages = self.cache.stats()["stages"]
+        self.assertEqual(
+            stages["validation_output"], {"hits": 1, "misses": 1, "hit_rate": 0.5}
+        )
+
+    def test_agent_reuses_responses(self):
+        agent = make_fake_agent(speculative=False, response_cache=self.cache)
+        first = agent.suggest_travel("from Berkeley to Reno")
+        self.assertEqual(agent.chat_model.calls, ["validation", "itinerary", "mapping"])
+
+        agent.chat_model.calls = []
+        places = []
+        second = agent.suggest_travel("From Berkeley to Reno ", on_place=places.append)
+        self.assertEqual(agent.chat_model.calls, [])
+        self.assertEqual(second[:2], first[:2])
+        self.assertEqual(second[2]["validation_output"], first[2]["validation_output"])
+        # places of cached trips are still reported
+        self.assertEqual(len(places), 5)
+        stats = agent.response_cache_stats()
+        self.assertEqual(stats["hits"], 3)
+        self.assertEqual(stats["stages"]["mapping_list"]["hit_rate"], 0.5)
+
+        # another model has its own entries
+        agent.chat_model.model_name = "other-model"
+        agent.suggest_travel("from Berkeley to Reno")
+        self.assertEqual(agent.chat_model.calls, ["validation", "itinerary", "mapping"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+from travel_mapper.agent.SimilarQueryCache import (
+    SimilarQueryCache,
+    query_features,
+    query_constraints,
+)
+from travel_mapper.user_interface.constants import EXAMPLE_QUERY
+from tests.agent.fakes import make_fake_agent, NOT_VALID
+
+QUERY = "2 week trip Berkeley to NYC, national parks"
+OTHER_QUERIES = [
+    "3 day walking tour of Rome, museums and food",
+    "Weekend in London with the kids",
+    "5 day drive from Seattle to Vancouver, beaches",
+    "1 week train trip through the Swiss alps",
+]
+
+
+class TestSimilarQueryCacheMethods(unittest.TestCase):
+    def setUp(self):
+        self.cache = SimilarQueryCache(threshold=0.8, max_entries=10)
+        for i, query in enumerate(OTHER_QUERIES):
+            self.cache.set(query, i)
+        self.cache.set(QUERY, "trip")
+
+    def test_query_features(self):
+        indices, term_frequencies = query_features("Berkeley, berkeley  NYC!")
+        self.assertEqual(len(indices), len(set(indices)))
+        self.assertTrue((indices[1:] > indices[:-1]).all())
+        same_indices, _ = query_features("berkeley berkeley nyc")
+        self.assertEqual(indices.tolist(), same_indices.tolist())
+        self.assertGreater(term_frequencies.max(), 1)
+
+    def test_reworded_queries(self):
+        for query in [
+            QUERY,
+            "2 week trip from Berkeley to NYC, national parks",
+            "2 weeks trip: Berkeley to NYC. National parks!",
+        ]:
+            value, similarity = self.cache.get(query)
+            self.assertEqual(value, "trip", query)
+            self.assertGreaterEqual(similarity, 0.8)
+
+    def test_different_queries(self):
+        for query in [
+            # same words, but another duration
+            "3 week trip Berkeley to NYC, national parks",
+            "Museums of Paris in 4 days",
+        ]:
+            self.assertEqual(self.cache.get(query), (None, None), query)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_query_constraints(self):
+        numbers, start, end, modes, negations = query_constraints(EXAMPLE_QUERY)
+        self.assertEqual(numbers, ("3", "3"))
+        self.assertEqual((start, end), ("berkeley ca", "new york city"))
+        self.assertEqual(modes, ("driving",))
+        self.assertEqual(negations, ("no",))
+        self.assertEqual(query_constraints(QUERY)[1:3], ("berkeley", "nyc"))
+
+    def test_queries_asking_for_other_trips(self):
+        self.cache.set(EXAMPLE_QUERY, "example trip")
+        for query in [
+            # reversed
+            EXAMPLE_QUERY.replace(
+                "from Berkeley CA to New York City", "from New York City to Berkeley CA"
+            ),
+            EXAMPLE_QUERY.replace("New York City", "Boston"),
+            EXAMPLE_QUERY.replace("visit national parks", "avoid national parks"),
+            EXAMPLE_QUERY.replace("rental car and drive", "train"),
+            "2 week trip NYC to Berkeley, national parks",
+        ]:
+            self.assertEqual(self.cache.get(query), (None, None), query)
+        self.assertEqual(
+            self.cache.get(EXAMPLE_QUERY.replace("I want to do", "I'd like"))[0],
+            "example trip",
+        )
+
+    def test_namespaces(self):
+        self.assertEqual(self.cache.get(QUERY, namespace="gpt-4"), (None, None))
+        self.cache.set(QUERY, "gpt-4 trip", namespace="gpt-4")
+        self.assertEqual(self.cache.get(QUERY, namespace="gpt-4")[0], "gpt-4 trip")
+        self.assertEqual(self.cache.get(QUERY)[0], "trip")
+
+    def test_oldest_entries_are_evicted(self):
+        for i in range(10):
+            self.cache.set("query number {}".format(i), i)
+        self.assertEqual(len(self.cache), 10)
+        self.assertEqual(self.cache.get(QUERY), (None, None))
+        self.assertEqual(self.cache.get("query number 3")[0], 3)
+        # evicted entries are gone from the buckets too
+        for table in self.cache._tables:
+            self.assertEqual(sum(len(bucket) for bucket in table.values()), 10)
+
+
+class TestAgentSimilarQueriesMethods(unittest.TestCase):
+    def test_reworded_query_skips_the_agent(self):
+        agent = make_fake_agent(
+            speculative=False, similar_query_cache=SimilarQueryCache()
+        )
+        first = agent.suggest_travel("2 day drive from Berkeley to Reno")
+        agent.chat_model.calls = []
+        places = []
+        second = agent.suggest_travel(
+            "2 day drive: from Berkeley to Reno!", on_place=places.append
+        )
+        # only validated
+        self.assertEqual(agent.chat_model.calls, ["validation"])
+        self.assertEqual(second[:2], first[:2])
+        self.assertEqual(second[2]["validation_output"].plan_is_valid, "yes")
+        self.assertEqual(len(places), 5)
+
+    def test_invalid_query_is_not_answered_from_the_cache(self):
+        cache = SimilarQueryCache()
+        agent = make_fake_agent(speculative=False, similar_query_cache=cache)
+        agent.suggest_travel("2 day drive from Berkeley to Reno")
+        for speculative in [False, True]:
+            agent = make_fake_agent(
+                speculative=speculative,
+                validation=NOT_VALID,
+                validation_delay_seconds=0.05,
+                similar_query_cache=cache,
+            )
+            itinerary, list_of_places, validation = agent.suggest_travel(
+                "2 day drive: from Berkeley to Reno!"
+            )
+            self.assertIsNone(itinerary)
+            self.assertIsNone(list_of_places)
+            self.assertEqual(validation["validation_output"].plan_is_valid, "no")
+        self.assertEqual(cache.stats()["hits"], 0)
+
+    def test_speculative_run_is_cancelled_on_a_hit(self):
+        cache = SimilarQueryCache()
+        agent = make_fake_agent(speculative=False, similar_query_cache=cache)
+        first = agent.suggest_travel("2 day drive from Berkeley to Reno")
+        agent = make_fake_agent(
+            speculative=True, validation_delay_seconds=0.05, similar_query_cache=cache
+        )
+        second = agent.suggest_travel("2 day drive: from Berkeley to Reno!")
+        self.assertEqual(second[:2], first[:2])
+        agent._executor.shutdown(wait=True)
+        self.assertEqual(agent.speculation_stats()["discarded"], 1)
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
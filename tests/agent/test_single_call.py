@@ -0,0 +1,25 @@
+import unittest
+from tests.agent.fakes import make_fake_agent, ITINERARY
+
+
+class TestAgentSingleCallMethods(unittest.TestCase):
+    def test_single_call_matches_two_step_chain(self):
+        agent = make_fake_agent(speculative=False)
+        two_step = agent.suggest_travel("from Berkeley to Reno")
+        self.assertEqual(agent.chat_model.calls, ["validation", "itinerary", "mapping"])
+
+        agent.chat_model.calls = []
+        places = []
+        single_call = agent.suggest_travel(
+            "from Berkeley to Reno", on_place=places.append, single_call=True
+        )
+        self.assertEqual(
+            agent.chat_model.calls, ["validation", "itinerary_and_mapping"]
+        )
+        self.assertEqual(single_call[0], ITINERARY)
+        self.assertEqual(single_call[1], two_step[1])
+        self.assertEqual(len(places), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import time
+import unittest
+from tests.agent.fakes import make_fake_agent, NOT_VALID
+
+
+class TestAgentSpeculationMethods(unittest.TestCase):
+    def test_valid_query_overlaps_validation(self):
+        agent = make_fake_agent(speculative=False)
+        t1 = time.time()
+        expected = agent.suggest_travel("from Berkeley to Reno")
+        sequential_time = time.time() - t1
+
+        agent = make_fake_agent(speculative=True)
+        places = []
+        t1 = time.time()
+        itinerary, list_of_places, _ = agent.suggest_travel(
+            "from Berkeley to Reno", on_place=places.append
+        )
+        speculative_time = time.time() - t1
+
+        self.assertEqual((itinerary, list_of_places), expected[:2])
+        self.assertEqual(len(places), 5)
+        # validation ran alongside the itinerary
+        self.assertGreater(sequential_time, 0.85)
+        self.assertLess(speculative_time, 0.85)
+        self.assertEqual(
+            agent.speculation_stats(),
+            {"runs": 1, "discarded": 0, "cancelled": 0, "wasted_seconds": 0},
+        )
+
+    def test_invalid_query_cancels_agent(self):
+        agent = make_fake_agent(
+            speculative=True, validation=NOT_VALID, validation_delay_seconds=0.05
+        )
+        itinerary, list_of_places, validation = agent.suggest_travel(
+            "a day trip to the moon"
+        )
+        self.assertIsNone(itinerary)
+        self.assertIsNone(list_of_places)
+        self.assertEqual(validation["validation_output"].plan_is_valid, "no")
+
+        agent._executor.shutdown(wait=True)
+        stats = agent.speculation_stats()
+        self.assertEqual(
+            {k: stats[k] for k in ["runs", "discarded", "cancelled"]},
+            {"runs": 1, "discarded": 1, "cancelled": 1},
+        )
+        self.assertGreater(stats["wasted_seconds"], 0)
+        # the run stopped while writing the itinerary
+        self.assertNotIn("mapping", agent.chat_model.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from typing import Any, List, Optional
+from langchain.chains import LLMChain, SequentialChain
+from langchain.llms.base import LLM
+from langchain.llms.fake import FakeListLLM
+from travel_mapper.agent.streaming import TripStreamParser, TripStreamHandler
+from travel_mapper.agent.templates import ItineraryTemplate, MappingTemplate
+from tests.agent.fakes import TRIP_JSON
+
+
+class FakeStreamingLLM(LLM):
+    """
+    Returns its responses in turn, one character per token
+    """
+
+    responses: List[str]
+    i: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-streaming"
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ):
+        response = self.responses[self.i % len(self.responses)]
+        self.i += 1
+        for char in response:
+            run_manager.on_llm_new_token(char)
+        return response
+
+
+class TestTripStreamParserMethods(unittest.TestCase):
+    def test_places_reported_as_they_complete(self):
+        places = []
+        parser = TripStreamParser(places.append)
+        # the start is complete once its closing quote arrives
+        self.assertEqual(parser.feed('{"start": "Berkeley, CA'), [])
+        self.assertEqual(parser.feed('", "waypoints": ["Reno'), ["Berkeley, CA"])
+        self.assertEqual(parser.feed(', NV"'), ["Reno, NV"])
+        self.assertFalse(parser.done)
+        parser.feed('], "transit": "driving", "end": "Boston"} trailing "text"')
+        self.assertTrue(parser.done)
+        self.assertEqual(places, ["Berkeley, CA", "Reno, NV", "Boston"])
+
+    def test_chunking_does_not_matter(self):
+        expected = [
+            "Berkeley, CA",
+            'New York, "NY"',
+            "Reno, NV",
+            "Salt Lake City, UT",
+            "Chicago, IL",
+        ]
+        for chunk_size in [1, 2, 7, len(TRIP_JSON)]:
+            parser = TripStreamParser()
+            for i in range(0, len(TRIP_JSON), chunk_size):
+                parser.feed(TRIP_JSON[i : i + chunk_size])
+            self.assertEqual(parser.places, expected)
+
+    def test_nested_values_are_not_places(self):
+        parser = TripStreamParser()
+        parser.feed(
+            '{"notes": {"start": "x"}, "waypoints": [["y"], "Reno"], "transit": "z"}'
+        )
+        self.assertEqual(parser.places, ["Reno"])
+
+
+class TestTripStreamHandlerMethods(unittest.TestCase):
+    def run_agent_chain(self, llm):
+        itinerary_prompt = ItineraryTemplate()
+        mapping_prompt = MappingTemplate()
+        chain = SequentialChain(
+            chains=[
+                LLMChain(
+                    llm=llm,
+                    prompt=itinerary_prompt.chat_prompt,
+                    output_key="agent_suggestion",
+                ),
+                LLMChain(
+                    llm=llm,
+                    prompt=mapping_prompt.chat_prompt,
+                    output_parser=mapping_prompt.parser,
+                    output_key="mapping_list",
+                ),
+            ],
+            input_variables=["query", "format_instructions"],
+            output_variables=["agent_suggestion", "mapping_list"],
+        )
+        places = []
+        result = chain(
+            {
+                "query": "from Berkeley to New York",
+                "format_instructions": mapping_prompt.parser.get_format_instructions(),
+            },
+            callbacks=[TripStreamHandler(places.append)],
+        )
+        return places, result["mapping_list"].dict()
+
+    def test_streaming_model(self):
+        itinerary = "- Start in Berkeley {CA}\n- Drive to Reno, NV"
+        places, trip = self.run_agent_chain(
+            FakeStreamingLLM(responses=[itinerary, TRIP_JSON])
+        )
+        self.assertEqual(places, [trip["start"], trip["end"]] + trip["waypoints"])
+
+    def test_model_without_streaming(self):
+        places, trip = self.run_agent_chain(
+            FakeListLLM(responses=["- Start in Berkeley", TRIP_JSON])
+        )
+        self.assertEqual(places, [trip["start"], trip["end"]] + trip["waypoints"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+import unittest
+from travel_mapper.caching.DiskCache import DiskCache
+
+
+class TestDiskCacheMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_set(self):
+        cache = DiskCache(self.path)
+        self.assertIsNone(cache.get("missing"))
+        cache.set("key", {"lat": 1.0, "lng": 2.0})
+        self.assertEqual(cache.get("key"), {"lat": 1.0, "lng": 2.0})
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_shared_across_instances(self):
+        DiskCache(self.path).set("key", [1, 2, 3])
+        self.assertEqual(DiskCache(self.path).get("key"), [1, 2, 3])
+
+    def test_ttl(self):
+        cache = DiskCache(self.path, ttl_seconds=0.05)
+        cache.set("key", "value")
+        self.assertEqual(cache.values(), ["value"])
+        time.sleep(0.1)
+        self.assertEqual(cache.values(), [])
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = DiskCache(self.path, max_entries=2)
+        cache.set("a", 1)
+        time.sleep(0.01)
+        cache.set("b", 2)
+        time.sleep(0.01)
+        # touch a so that b becomes the least recently used entry
+        cache.get("a")
+        time.sleep(0.01)
+        cache.set("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_contains_and_items(self):
+        cache = DiskCache(self.path, ttl_seconds=0.05)
+        cache.set("key", "value")
+        self.assertIn("key", cache)
+        self.assertNotIn("missing", cache)
+        self.assertEqual(cache.items(), [("key", "value")])
+        # neither counts as a lookup
+        self.assertEqual(cache.stats()["hits"] + cache.stats()["misses"], 0)
+        time.sleep(0.1)
+        self.assertNotIn("key", cache)
+        self.assertEqual(cache.items(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
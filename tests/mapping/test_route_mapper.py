@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from travel_mapper.mapping.RouteMapper import RouteMapper
+from travel_mapper.routing.models import Place, Leg, Route
+
+
+class TestRouteMapperMethods(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        path = np.cumsum(rng.normal(scale=0.01, size=(20000, 2)), axis=0)
+        path += [37.87, -122.27]
+        leg = Leg(
+            start=Place("Berkeley, CA", 37.87, -122.27),
+            end=Place("New York, NY", 40.71, -74.0),
+            distance=4600000,
+            duration=172800,
+            distance_text="4,600 km",
+            duration_text="2 days",
+            path=path,
+        )
+        self.route = Route([leg])
+
+    def render(self, mapper):
+        mapper.save_map = False
+        mapper.generate_route_map(self.route, self.route)
+        return mapper.map.get_root().render()
+
+    def test_route_points_budget(self):
+        full_html = self.render(
+            RouteMapper(simplify_tolerance_km=0, max_route_points=None)
+        )
+        simplified_html = self.render(RouteMapper(max_route_points=1000))
+        self.assertIn("Berkeley, CA", simplified_html)
+        self.assertLess(len(simplified_html), len(full_html) / 10)
+
+    def test_empty_route(self):
+        self.route = Route([])
+        html = self.render(RouteMapper())
+        self.assertNotIn("Click for address", html)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import zlib
+from googlemaps.convert import encode_polyline
+
+FAKE_API_KEY = "AIzaFakeKeyForTesting"
+
+
+class FakeMapsClient(object):
+    """
+    Stands in for googlemaps.Client, placing every address at a deterministic
+    location and joining consecutive places with straight line legs
+    """
+
+    def __init__(self):
+        self.geocode_calls = []
+        self.directions_calls = []
+        self.locations = {}
+
+    def geocode(self, address):
+        self.geocode_calls.append(address)
+        if "nowhere" in address.lower():
+            return []
+        place_id = "pid_" + address.lower().replace(" ", "_")
+        seed = zlib.crc32(address.encode())
+        location = {
+            "lat": 30 + (seed % 1000) / 100,
+            "lng": -120 + (seed // 1000 % 1000) / 100,
+        }
+        self.locations["place_id:" + place_id] = (address, location)
+        return [
+            {
+                "formatted_address": address,
+                "place_id": place_id,
+                "geometry": {"location": location},
+            }
+        ]
+
+    def directions(self, origin, destination, waypoints=None, **kwargs):
+        self.directions_calls.append((origin, destination, waypoints or []))
+        points = [origin] + list(waypoints or []) + [destination]
+        if any("unroutable" in self.locations[p][0].lower() for p in points):
+            return []
+        legs = []
+        for p0, p1 in zip(points[:-1], points[1:]):
+            (a0, l0), (a1, l1) = self.locations[p0], self.locations[p1]
+            midpoint = {"lat": (l0["lat"] + l1["lat"]) / 2, "lng": l0["lng"]}
+            legs.append(
+                {
+                    "start_address": a0,
+                    "end_address": a1,
+                    "start_location": l0,
+                    "end_location": l1,
+                    "distance": {"text": "100 km", "value": 100000},
+                    "duration": {"text": "1 hour", "value": 3600},
+                    "steps": [
+                        {"polyline": {"points": encode_polyline([l0, midpoint])}},
+                        {"polyline": {"points": encode_polyline([midpoint, l1])}},
+                    ],
+                }
+            )
+        return [{"legs": legs}]
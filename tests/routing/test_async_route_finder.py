@@ -0,0 +1,249 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+import googlemaps
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from travel_mapper.routing.AsyncRouteFinder import AsyncRouteFinder
+from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.GeocodeQueue import GeocodeQueue
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from travel_mapper.routing.QuotaScheduler import QuotaScheduler
+from tests.routing.fakes import FakeMapsClient, FAKE_API_KEY
+
+
+def make_maps_app(gmaps, over_query_limit=0):
+    """
+    aiohttp app serving the geocode and directions endpoints of the Maps API
+    from a FakeMapsClient, and a dict recording the requests it received. The
+    first over_query_limit requests are refused.
+    """
+    state = {"refused": 0, "keys": set()}
+
+    def check_quota(request):
+        state["keys"].add(request.query.get("key"))
+        if state["refused"] < over_query_limit:
+            state["refused"] += 1
+            return web.json_response({"status": "OVER_QUERY_LIMIT", "results": []})
+
+    async def geocode(request):
+        refused = check_quota(request)
+        if refused is not None:
+            return refused
+        results = gmaps.geocode(request.query["address"])
+        return web.json_response(
+            {"status": "OK" if results else "ZERO_RESULTS", "results": results}
+        )
+
+    async def directions(request):
+        refused = check_quota(request)
+        if refused is not None:
+            return refused
+        waypoints = request.query.get("waypoints", "").split("|")
+        waypoints = [w for w in waypoints if w and w != "optimize:true"]
+        routes = gmaps.directions(
+            request.query["origin"], request.query["destination"], waypoints
+        )
+        return web.json_response(
+            {"status": "OK" if routes else "ZERO_RESULTS", "routes": routes}
+        )
+
+    app = web.Application()
+    app.router.add_get("/maps/api/geocode/json", geocode)
+    app.router.add_get("/maps/api/directions/json", directions)
+    return app, state
+
+
+class TestAsyncRouteFinderMethods(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.gmaps = FakeMapsClient()
+        app, self.server_state = make_maps_app(self.gmaps, over_query_limit=2)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.route_finder = AsyncRouteFinder(
+            google_maps_api_key=FAKE_API_KEY,
+            base_url=str(self.server.make_url("")),
+            geocode_cache=GeocodeCache(
+                path=os.path.join(self.tmp_dir.name, "geocode.sqlite")
+            ),
+            directions_cache=DirectionsCache(
+                path=os.path.join(self.tmp_dir.name, "directions.sqlite")
+            ),
+            scheduler=QuotaScheduler(1000, backoff_seconds=0.01),
+        )
+
+    async def asyncTearDown(self):
+        await self.route_finder.close()
+        await self.server.close()
+        self.tmp_dir.cleanup()
+
+    async def test_build_route_segments_over_max_waypoints(self):
+        waypoints = ["Place {}".format(i) for i in range(50)]
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "New York, NY",
+            "waypoints": waypoints,
+        }
+        route, sampled_route, mapping_dict = await self.route_finder.generate_route(
+            list_of_places, itinerary="", include_map=False
+        )
+        self.assertEqual(len(self.gmaps.directions_calls), 3)
+        stops = [stop.address for stop in route.stops]
+        self.assertEqual(stops[0], "Berkeley, CA")
+        self.assertEqual(stops[-1], "New York, NY")
+        self.assertEqual(sorted(stops[1:-1]), sorted(waypoints))
+        self.assertEqual(len(sampled_route), 51)
+        self.assertEqual(mapping_dict["waypoint_49"].address, stops[-2])
+        # the refused requests were retried and the key was sent with each one
+        self.assertEqual(self.server_state["refused"], 2)
+        self.assertEqual(self.server_state["keys"], {FAKE_API_KEY})
+
+    async def test_caches_are_used_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def record(function):
+            def recorded(*args, **kwargs):
+                threads.append(threading.get_ident())
+                return function(*args, **kwargs)
+
+            return recorded
+
+        for cache, names in [
+            (self.route_finder.geocode_cache, ["get_place", "set_place"]),
+            (self.route_finder.directions_cache, ["get_route", "set_route"]),
+        ]:
+            for name in names:
+                setattr(cache, name, record(getattr(cache, name)))
+
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "Reno, NV",
+            "waypoints": ["Sacramento, CA"],
+        }
+        for _ in range(2):
+            await self.route_finder.generate_route(
+                list_of_places, itinerary="", include_map=False
+            )
+        # the 3 places and the route are looked up and set the first time, and
+        # found the second
+        self.assertEqual(len(threads), 2 * (3 + 1) + (3 + 1))
+        self.assertNotIn(loop_thread, threads)
+
+    async def test_places_from_the_geocode_queue(self):
+        route_finder = RouteFinder(
+            google_maps_api_key=FAKE_API_KEY,
+            geocode_cache=self.route_finder.geocode_cache,
+            directions_cache=self.route_finder.directions_cache,
+        )
+        route_finder.gmaps = self.gmaps
+        geocode_queue = GeocodeQueue(route_finder)
+        for place in ["Berkeley, CA", "Sacramento, CA", "Reno, NV"]:
+            geocode_queue.put(place)
+
+        route, _, mapping_dict = await self.route_finder.generate_route(
+            {
+                "start": "Berkeley, CA",
+                "end": "Reno, NV",
+                "waypoints": ["Sacramento, CA"],
+            },
+            itinerary="",
+            include_map=False,
+            geocode_queue=geocode_queue,
+        )
+        geocode_queue.close()
+        self.assertEqual(
+            sorted(self.gmaps.geocode_calls),
+            ["Berkeley, CA", "Reno, NV", "Sacramento, CA"],
+        )
+        self.assertEqual(mapping_dict["waypoint_0"].address, "Sacramento, CA")
+        self.assertEqual(len(route), 2)
+
+    async def test_concurrent_trips_track_dropped_waypoints(self):
+        async def trip(waypoints):
+            route, _, _ = await self.route_finder.build_route_segments(
+                {"start": "Berkeley, CA", "end": "Reno, NV", "waypoints": waypoints},
+                verbose=False,
+            )
+            return route, list(self.route_finder.dropped_waypoints)
+
+        results = await asyncio.gather(
+            trip(["Sacramento, CA", "Nowhere"]),
+            trip(["Davis, CA", "Unroutable island", "Truckee, CA"]),
+            trip(["Auburn, CA"]),
+        )
+        dropped = [dropped for _, dropped in results]
+        self.assertEqual(dropped, [["Nowhere"], ["Unroutable island"], []])
+        self.assertEqual(
+            [stop.address for stop in results[1][0].stops],
+            ["Berkeley, CA", "Davis, CA", "Truckee, CA", "Reno, NV"],
+        )
+
+    async def test_session_reroutes_only_changed_legs(self):
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "Reno, NV",
+            "waypoints": ["Place {}".format(i) for i in range(30)],
+        }
+        await self.route_finder.build_route_segments(
+            list_of_places, verbose=False, session_id="session"
+        )
+        n_calls = len(self.gmaps.directions_calls)
+        list_of_places["waypoints"].append("Unroutable island")
+        route, _, _ = await self.route_finder.build_route_segments(
+            list_of_places, verbose=False, session_id="session"
+        )
+        self.assertEqual(self.route_finder.dropped_waypoints, ["Unroutable island"])
+        self.assertEqual(len(route), 31)
+        # the new waypoint is isolated by bisecting the single run through it
+        self.assertLessEqual(len(self.gmaps.directions_calls) - n_calls, 4)
+
+    async def test_session_drops_unroutable_transit_stops(self):
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "Denver, CO",
+            "waypoints": ["Reno, NV", "Salt Lake City, UT"],
+            "transit": "train",
+        }
+        await self.route_finder.build_route_segments(
+            list_of_places, verbose=False, session_id="session"
+        )
+        list_of_places["waypoints"].insert(1, "Unroutable town")
+        route, _, _ = await self.route_finder.build_route_segments(
+            list_of_places, verbose=False, session_id="session"
+        )
+        self.assertEqual(self.route_finder.dropped_waypoints, ["Unroutable town"])
+        self.assertEqual(len(route), 3)
+        for leg, next_leg in zip(route.legs[:-1], route.legs[1:]):
+            self.assertEqual(leg.end.address, next_leg.start.address)
+
+    async def test_compare_modes(self):
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "Reno, NV",
+            "waypoints": ["Sacramento, CA", "Davis, CA"],
+            "transit": "bus",
+        }
+        route, _, _, summaries = await self.route_finder.compare_modes(
+            list_of_places, modes=["bus", "car", "driving"], verbose=False
+        )
+        self.assertEqual(
+            sorted(summary["mode"] for summary in summaries), ["driving", "transit"]
+        )
+        self.assertEqual(len(route), 3)
+        # one call for driving and one per leg for transit
+        self.assertEqual(len(self.gmaps.directions_calls), 4)
+
+    async def test_api_error_is_raised(self):
+        self.route_finder.scheduler.max_retries = 0
+        with self.assertRaises(googlemaps.exceptions.ApiError) as context:
+            await self.route_finder.convert_to_coords("Berkeley, CA")
+        self.assertIn("OVER_QUERY_LIMIT", str(context.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
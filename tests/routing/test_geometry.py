@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from travel_mapper.routing.geometry import (
+    haversine_km,
+    cumulative_distance_km,
+    resample_path,
+    simplify_path,
+)
+
+
+class TestGeometryMethods(unittest.TestCase):
+    def setUp(self):
+        # a dog-leg path with unevenly spaced vertices
+        self.path = np.array(
+            [[37.87, -122.27], [37.8701, -122.2699], [37.9, -122.0], [38.5, -121.5]]
+        )
+
+    def test_haversine_km(self):
+        # San Francisco to New York City
+        distance = haversine_km(37.7749, -122.4194, 40.7128, -74.0060)
+        self.assertAlmostEqual(float(distance), 4129, delta=5)
+        self.assertEqual(float(haversine_km(10.0, 20.0, 10.0, 20.0)), 0.0)
+
+    def test_resample_path_even_spacing(self):
+        resampled = resample_path(self.path, 40)
+        self.assertEqual(resampled.shape, (41, 2))
+        np.testing.assert_allclose(resampled[0], self.path[0])
+        np.testing.assert_allclose(resampled[-1], self.path[-1])
+
+        # along a straight path with uneven vertices the spacing is exact
+        straight_path = np.array(
+            [[37.0, -122.0], [37.001, -122.0], [37.3, -122.0], [38.0, -122.0]]
+        )
+        spacing = np.diff(cumulative_distance_km(resample_path(straight_path, 40)))
+        total = cumulative_distance_km(straight_path)[-1]
+        np.testing.assert_allclose(spacing, total / 40, rtol=1e-6)
+
+    def test_simplify_path_tolerance(self):
+        # a straight line with a single 5 km detour
+        lats = np.linspace(37.0, 38.0, 101)
+        path = np.column_stack((lats, np.full(101, -122.0)))
+        path[50, 1] += 0.06
+        simplified = simplify_path(path, tolerance_km=0.5)
+        np.testing.assert_allclose(simplified, path[[0, 49, 50, 51, 100]])
+        # with a large tolerance only the ends are left
+        self.assertEqual(len(simplify_path(path, tolerance_km=10)), 2)
+
+    def test_simplify_path_budget(self):
+        rng = np.random.default_rng(0)
+        path = np.cumsum(rng.normal(scale=0.01, size=(1000, 2)), axis=0) + [37, -122]
+        simplified = simplify_path(path, max_points=100)
+        self.assertEqual(len(simplified), 100)
+        np.testing.assert_allclose(simplified[[0, -1]], path[[0, -1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
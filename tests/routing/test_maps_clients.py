@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+import googlemaps
+from travel_mapper.routing import maps_clients
+from travel_mapper.routing.maps_clients import (
+    get_shared_maps_client,
+    make_maps_client,
+    warm_up_maps_client,
+    warm_up_maps_client_once,
+)
+from travel_mapper.routing.MapsStandInServer import MapsStandInServer
+from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from travel_mapper.routing.QuotaScheduler import QuotaScheduler
+from tests.routing.fakes import FAKE_API_KEY
+
+
+class TestMapsClientsMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_route_finder(self, base_url, **kwargs):
+        return RouteFinder(
+            FAKE_API_KEY,
+            base_url=base_url,
+            geocode_cache=GeocodeCache(
+                path=os.path.join(self.tmp_dir.name, "geocode.sqlite")
+            ),
+            directions_cache=DirectionsCache(
+                path=os.path.join(self.tmp_dir.name, "directions.sqlite")
+            ),
+            **kwargs,
+        )
+
+    def test_clients_are_shared_per_key_and_url(self):
+        client = get_shared_maps_client(FAKE_API_KEY, "http://localhost:1/")
+        self.assertIs(
+            get_shared_maps_client(FAKE_API_KEY, "http://localhost:1"), client
+        )
+        self.assertIsNot(
+            get_shared_maps_client(FAKE_API_KEY, "http://localhost:2"), client
+        )
+        self.assertIsNot(
+            get_shared_maps_client(FAKE_API_KEY + "2", "http://localhost:1"), client
+        )
+        self.assertIs(
+            self.make_route_finder("http://localhost:1").gmaps,
+            self.make_route_finder("http://localhost:1").gmaps,
+        )
+
+    def test_pool_size(self):
+        client = get_shared_maps_client(
+            FAKE_API_KEY, "http://localhost:3", max_connections=7, keep_alive=False
+        )
+        adapter = client.session.get_adapter("http://localhost:3")
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(client.session.headers["Connection"], "close")
+
+    def test_server_errors_are_retried_by_the_scheduler(self):
+        with MapsStandInServer() as server:
+            handle = server.handle
+            responses = [(503, {"status": "UNKNOWN_ERROR"})]
+            calls = []
+
+            def handle_with_errors(path, params):
+                calls.append(path)
+                if responses:
+                    return responses.pop()
+                return handle(path, params)
+
+            server.handle = handle_with_errors
+            route_finder = self.make_route_finder(
+                server.base_url, scheduler=QuotaScheduler(1000, backoff_seconds=0.01)
+            )
+            place = route_finder.convert_to_coords("Berkeley, CA")
+        self.assertEqual(place.address, "Berkeley, CA")
+        # once by the scheduler, not by the client as well
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(route_finder.scheduler.stats()["geocode"]["retries"], 1)
+
+        # the client raises them without retrying
+        with self.assertRaises(googlemaps.exceptions.HTTPError) as raised:
+            with MapsStandInServer() as server:
+                server.handle = lambda path, params: (500, {})
+                client = make_maps_client(FAKE_API_KEY, server.base_url)
+                client.geocode("Berkeley, CA")
+        self.assertEqual(raised.exception.status_code, 500)
+
+    def test_warm_up(self):
+        with MapsStandInServer() as server:
+            client = get_shared_maps_client(FAKE_API_KEY, server.base_url)
+            self.assertTrue(warm_up_maps_client(client, background=False))
+        self.assertFalse(warm_up_maps_client(client, background=False))
+
+    def test_warm_up_once(self):
+        with MapsStandInServer() as server:
+            client = make_maps_client(FAKE_API_KEY, server.base_url)
+            self.assertTrue(warm_up_maps_client_once(client, background=False))
+            # the connection is already open for later queries
+            self.assertIsNone(warm_up_maps_client_once(client, background=False))
+            other_client = make_maps_client(FAKE_API_KEY, server.base_url)
+            self.assertTrue(warm_up_maps_client_once(other_client, background=False))
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_clients_are_not_inherited_by_forks(self):
+        get_shared_maps_client(FAKE_API_KEY, "http://localhost:4")
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if not maps_clients._shared_clients else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertTrue(maps_clients._shared_clients)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import time
+import unittest
+from travel_mapper.routing.MapsStandInServer import MapsStandInServer
+from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from tests.routing.fakes import FAKE_API_KEY
+
+
+class TestMapsStandInServerMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.recordings_path = os.path.join(self.tmp_dir.name, "recordings.jsonl")
+        self.list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "New York, NY",
+            "waypoints": ["Place {}".format(i) for i in range(30)],
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_route_finder(self, base_url, cache_name):
+        return RouteFinder(
+            google_maps_api_key=FAKE_API_KEY,
+            base_url=base_url,
+            geocode_cache=GeocodeCache(
+                path=os.path.join(self.tmp_dir.name, cache_name + "_geocode.sqlite")
+            ),
+            directions_cache=DirectionsCache(
+                path=os.path.join(self.tmp_dir.name, cache_name + "_directions.sqlite")
+            ),
+            requests_per_second=1000,
+        )
+
+    def test_synthetic_route_through_googlemaps_client(self):
+        with MapsStandInServer() as server:
+            route_finder = self.make_route_finder(server.base_url, "synthetic")
+            route, sampled_route, _ = route_finder.build_route_segments(
+                self.list_of_places, verbose=False
+            )
+        stops = [stop.address for stop in route.stops]
+        self.assertEqual(stops[0], "Berkeley, CA")
+        self.assertEqual(stops[-1], "New York, NY")
+        self.assertEqual(sorted(stops[1:-1]), sorted(self.list_of_places["waypoints"]))
+        self.assertTrue(all(leg.distance > 0 and len(leg.path) > 2 for leg in route))
+        self.assertEqual(server.request_counts["/maps/api/directions/json"], 2)
+        self.assertEqual(server.request_counts["/maps/api/geocode/json"], 32)
+
+    def test_record_then_replay(self):
+        with MapsStandInServer() as upstream:
+            with MapsStandInServer(
+                mode="record",
+                recordings_path=self.recordings_path,
+                upstream_url=upstream.base_url,
+            ) as recorder:
+                recorded_route, _, _ = self.make_route_finder(
+                    recorder.base_url, "record"
+                ).build_route_segments(self.list_of_places, verbose=False)
+
+        # the upstream is gone, everything comes from the recordings
+        with MapsStandInServer(
+            mode="replay", recordings_path=self.recordings_path
+        ) as replayer:
+            replayed_route, _, _ = self.make_route_finder(
+                replayer.base_url, "replay"
+            ).build_route_segments(self.list_of_places, verbose=False)
+
+        self.assertEqual(replayed_route.to_dict(), recorded_route.to_dict())
+        with open(self.recordings_path) as f:
+            self.assertNotIn(FAKE_API_KEY, f.read())
+
+    def test_latency_injection(self):
+        with MapsStandInServer(latency_seconds=0.05) as server:
+            route_finder = self.make_route_finder(server.base_url, "latency")
+            t1 = time.time()
+            route_finder.geocode_places(
+                ["Place {}".format(i) for i in range(4)], concurrent=False
+            )
+            self.assertGreaterEqual(time.time() - t1, 0.2)
+
+    def test_unroutable_waypoint_is_dropped(self):
+        with MapsStandInServer() as server:
+            route_finder = self.make_route_finder(server.base_url, "unroutable")
+            route, _, _ = route_finder.build_route_segments(
+                {
+                    "start": "Berkeley, CA",
+                    "end": "Reno, NV",
+                    "waypoints": ["Davis, CA", "Unroutable island", "Nowhere"],
+                },
+                verbose=False,
+            )
+        self.assertEqual(len(route), 2)
+        self.assertEqual(
+            route_finder.dropped_waypoints, ["Nowhere", "Unroutable island"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import gc
+import json
+import tracemalloc
+import unittest
+import numpy as np
+from googlemaps.convert import encode_polyline
+from travel_mapper.routing.models import Place, Leg, Route
+
+
+def make_directions_result(n_legs, n_steps=40, points_per_step=20, seed=0):
+    """
+    Directions payload shaped like the ones returned by the Google Maps API, with
+    instructions and per step details that the pipeline never uses
+    """
+    rng = np.random.default_rng(seed)
+    position = np.array([37.87, -122.27])
+    legs = []
+    for leg_id in range(n_legs):
+        steps = []
+        leg_start = position.copy()
+        for step_id in range(n_steps):
+            points = position + np.cumsum(
+                rng.normal(scale=0.002, size=(points_per_step, 2)), axis=0
+            )
+            steps.append(
+                {
+                    "distance": {"text": "1.2 km", "value": 1200},
+                    "duration": {"text": "2 mins", "value": 120},
+                    "start_location": {"lat": position[0], "lng": position[1]},
+                    "end_location": {"lat": points[-1, 0], "lng": points[-1, 1]},
+                    "html_instructions": "Turn <b>left</b> onto <b>Route {}</b>"
+                    '<div style="font-size:0.9em">Pass by the gas station '
+                    "(on the right in {} m)</div>".format(step_id, step_id * 100),
+                    "maneuver": "turn-left",
+                    "polyline": {"points": encode_polyline(points.tolist())},
+                    "travel_mode": "DRIVING",
+                }
+            )
+            position = points[-1]
+        legs.append(
+            {
+                "start_address": "Stop {}, Some Street, Some City, CA 94704, USA".format(
+                    leg_id
+                ),
+                "end_address": "Stop {}, Some Street, Some City, CA 94704, USA".format(
+                    leg_id + 1
+                ),
+                "start_location": {"lat": leg_start[0], "lng": leg_start[1]},
+                "end_location": {"lat": position[0], "lng": position[1]},
+                "distance": {"text": "48 km", "value": 48000},
+                "duration": {"text": "1 hour 20 mins", "value": 4800},
+                "steps": steps,
+                "traffic_speed_entry": [],
+                "via_waypoint": [],
+            }
+        )
+    return [
+        {
+            "bounds": {
+                "northeast": {"lat": 40.0, "lng": -120.0},
+                "southwest": {"lat": 37.0, "lng": -123.0},
+            },
+            "copyrights": "Map data ©2023 Google",
+            "legs": legs,
+            "overview_polyline": {"points": legs[0]["steps"][0]["polyline"]["points"]},
+            "summary": "I-80 E",
+            "warnings": [],
+            "waypoint_order": list(range(max(0, n_legs - 1))),
+        }
+    ]
+
+
+def retained_memory(build):
+    """
+    Bytes still allocated after build() returns, for the object it returns
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        obj = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size, obj
+
+
+class TestModelsMethods(unittest.TestCase):
+    def setUp(self):
+        self.directions_result = make_directions_result(n_legs=3, n_steps=4)
+        self.route = Route.from_directions(self.directions_result)
+
+    def test_from_directions(self):
+        self.assertEqual(len(self.route), 3)
+        leg = self.route[0]
+        self.assertEqual(leg.distance, 48000)
+        self.assertEqual(leg.duration_text, "1 hour 20 mins")
+        self.assertEqual(leg.path.shape, (80, 2))
+        self.assertEqual(self.route.distance, 144000)
+        self.assertEqual(len(self.route.stops), 4)
+        self.assertFalse(hasattr(leg, "__dict__"))
+
+    def test_round_trip(self):
+        route_dict = json.loads(json.dumps(self.route.to_dict()))
+        route = Route.from_dict(route_dict)
+        self.assertEqual(route[1].start, self.route[1].start)
+        np.testing.assert_allclose(route[2].path, self.route[2].path, atol=1e-9)
+
+        place = Place("Berkeley, CA", 37.87, -122.27, place_id="abc")
+        self.assertEqual(Place.from_dict(place.to_dict()), place)
+
+    def test_resample_uses_numeric_distance(self):
+        leg = self.route[0].with_path(
+            np.array([[37.0, -122.0], [37.001, -122.0], [37.3, -122.0]])
+        )
+        leg.distance_text = "29.8 mi"
+        sampled = Route([leg]).resample(distance_per_point_in_km=2)
+        # 48 km at 2 km per point
+        self.assertEqual(sampled[0].path.shape, (25, 2))
+        self.assertEqual(sampled[0].distance_text, "29.8 mi")
+
+    def test_simplify_shares_budget_by_length(self):
+        route = Route([self.route[0], self.route[1]])
+        route[0].distance = 300000
+        route[1].distance = 100000
+        simplified = route.simplify(max_points=40)
+        self.assertEqual(len(simplified[0].path), 30)
+        self.assertEqual(len(simplified[1].path), 10)
+        self.assertEqual(len(route[0].path), 80)
+
+    def test_legacy_dict(self):
+        legacy = self.route.to_legacy_dict()
+        self.assertEqual(sorted(legacy), [0, 1, 2])
+        self.assertEqual(legacy[0]["distance"], "48 km")
+        lat, lng = legacy[0]["route"][0].split(",")
+        self.assertAlmostEqual(float(lat), self.route[0].path[0, 0])
+
+    def test_memory_smaller_than_raw_payload(self):
+        raw_size, raw = retained_memory(
+            lambda: make_directions_result(n_legs=20, n_steps=40)
+        )
+        route_size, route = retained_memory(lambda: Route.from_directions(raw))
+        self.assertEqual(len(route), 20)
+        # the parsed route keeps none of the raw payload
+        del raw
+        gc.collect()
+        self.assertLess(route_size, raw_size / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+from travel_mapper.routing.ordering import (
+    distance_matrix_km,
+    path_length,
+    nearest_neighbour_order,
+    two_opt,
+    or_opt,
+    optimize_order,
+)
+
+
+class TestOrderingMethods(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.coords = rng.uniform([30, -120], [45, -75], size=(60, 2))
+        self.dist = distance_matrix_km(self.coords)
+
+    def test_distance_matrix(self):
+        self.assertEqual(self.dist.shape, (60, 60))
+        np.testing.assert_allclose(self.dist, self.dist.T)
+        np.testing.assert_allclose(np.diag(self.dist), 0, atol=1e-9)
+        # one degree of latitude
+        self.assertAlmostEqual(
+            distance_matrix_km([[0, 0], [1, 0]])[0, 1], 111.2, places=1
+        )
+
+    def test_points_on_a_line(self):
+        lats = np.linspace(30, 40, 12)
+        coords = np.column_stack((lats, np.full(12, -100.0)))
+        rng = np.random.default_rng(1)
+        interior = rng.permutation(np.arange(1, 11))
+        coords = coords[np.concatenate(([0], interior, [11]))]
+
+        order = optimize_order(distance_matrix_km(coords))
+        np.testing.assert_array_equal(np.diff(coords[order, 0]) > 0, True)
+
+    def test_each_stage_keeps_ends_and_improves(self):
+        n = len(self.coords)
+        identity_length = path_length(np.arange(n), self.dist)
+
+        order = nearest_neighbour_order(self.dist)
+        nn_length = path_length(order, self.dist)
+        self.assertLess(nn_length, identity_length)
+
+        order = two_opt(order, self.dist)
+        two_opt_length = path_length(order, self.dist)
+        self.assertLessEqual(two_opt_length, nn_length)
+
+        order, _ = or_opt(order, self.dist)
+        self.assertLessEqual(path_length(order, self.dist), two_opt_length)
+
+        order = optimize_order(self.dist)
+        self.assertEqual(order[0], 0)
+        self.assertEqual(order[-1], n - 1)
+        self.assertEqual(sorted(order), list(range(n)))
+
+    def test_small_inputs(self):
+        for n in range(4):
+            dist = distance_matrix_km(self.coords[:n])
+            np.testing.assert_array_equal(optimize_order(dist), np.arange(n))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import math
+import os
+import tempfile
+import unittest
+from unittest import mock
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.PlaceIndex import PlaceIndex
+from travel_mapper.routing.geohash import encode, cells_within
+from travel_mapper.routing.models import Place
+
+VALLEY = Place("Yosemite Valley, CA", 37.7456, -119.5936, place_id="valley")
+VILLAGE = Place("Yosemite Village, CA", 37.7489, -119.5870, place_id="village")
+TAHOE = Place("Lake Tahoe", 39.0968, -120.0324, place_id="tahoe")
+
+
+class TestPlaceIndexMethods(unittest.TestCase):
+    def test_encode(self):
+        # reference values from the original geohash.org
+        self.assertEqual(encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(encode(37.8324, 112.5584, 9), "ww8p1r4t8")
+        self.assertTrue(encode(37.87, -122.27, 6).startswith(encode(37.87, -122.27, 4)))
+
+    def test_cells_within_cover_the_radius(self):
+        for lat, lng in ((37.87, -122.27), (78.2, 15.6), (0.0, 179.999)):
+            cells = cells_within(lat, lng, 2.0, precision=6)
+            # points 1.9 km away in every direction fall in one of the cells
+            for d_lat, d_lng in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+                other_lat = lat + d_lat * 1.9 / 111.2
+                other_lng = lng + d_lng * 0.99 * 1.9 / 111.2 / math.cos(
+                    math.radians(lat)
+                )
+                other_lng = (other_lng + 180) % 360 - 180
+                self.assertIn(encode(other_lat, other_lng, 6), cells)
+
+    def test_nearest(self):
+        valley = Place("Yosemite Valley, CA", 37.7456, -119.5936, place_id="valley")
+        village = Place("Yosemite Village, CA", 37.7489, -119.5870, place_id="village")
+        tahoe = Place("Lake Tahoe", 39.0968, -120.0324, place_id="tahoe")
+        index = PlaceIndex([valley, village, tahoe])
+        self.assertEqual(len(index), 3)
+
+        nearest, distance = index.nearest(37.7460, -119.5930, radius_km=1.0)
+        self.assertIs(nearest, valley)
+        self.assertLess(distance, 0.1)
+        self.assertEqual(index.nearest(37.80, -119.50, radius_km=1.0), (None, None))
+
+        # adding a place again replaces it
+        index.add(Place("Yosemite Valley", 37.7456, -119.5936, place_id="valley"))
+        self.assertEqual(len(index), 3)
+
+        index.remove("valley")
+        self.assertEqual(len(index), 2)
+        nearest, _ = index.nearest(37.7460, -119.5930, radius_km=1.0)
+        self.assertIs(nearest, village)
+        index.remove("valley")
+        self.assertEqual(len(index), 2)
+
+
+class TestGeocodeCachePlaceIndexMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.now = 1000.0
+        patcher = mock.patch(
+            "travel_mapper.caching.DiskCache.time.time", lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def make_cache(self, **kwargs):
+        return GeocodeCache(
+            path=os.path.join(self.tmp_dir.name, "geocode.sqlite"), **kwargs
+        )
+
+    def test_evicted_places_leave_the_index(self):
+        cache = self.make_cache(max_entries=2)
+        cache.set_place("valley", VALLEY)
+        self.now += 1
+        cache.set_place("tahoe", TAHOE)
+        self.assertEqual(cache.nearest_place(VALLEY, 1.0), VALLEY)
+        self.now += 1
+        cache.set_place("village", VILLAGE)
+        self.assertEqual(len(cache.place_index), 2)
+        self.assertEqual(cache.nearest_place(VALLEY, 0.1), None)
+
+    def test_expired_places_leave_the_index(self):
+        cache = self.make_cache(ttl_seconds=100)
+        cache.set_place("valley", VALLEY)
+        self.assertEqual(cache.nearest_place(VALLEY, 1.0), VALLEY)
+        self.now += 50
+        cache.set_place("tahoe", TAHOE)
+
+        # expired without being looked up
+        self.now += 51
+        self.assertIsNone(cache.nearest_place(VALLEY, 1.0))
+        self.assertEqual(len(cache.place_index), 1)
+
+        # expired on a lookup
+        self.now += 50
+        self.assertIsNone(cache.get_place("tahoe"))
+        self.assertEqual(len(cache.place_index), 0)
+
+    def test_places_leave_the_index_with_their_last_entry(self):
+        cache = self.make_cache()
+        cache.set_place("Yosemite Valley", VALLEY)
+        cache.set_place("the valley", VALLEY)
+        self.assertEqual(cache.nearest_place(VALLEY, 1.0), VALLEY)
+        cache.delete("yosemite valley")
+        self.assertEqual(cache.nearest_place(VALLEY, 1.0), VALLEY)
+        cache.delete("the valley")
+        self.assertIsNone(cache.nearest_place(VALLEY, 1.0))
+
+        # also when the index is loaded from the file
+        cache.set_place("valley", VALLEY)
+        other_cache = self.make_cache()
+        self.assertEqual(other_cache.nearest_place(VALLEY, 1.0), VALLEY)
+        cache.delete("valley")
+        self.assertIsNone(other_cache.nearest_place(VALLEY, 1.0))
+        self.assertEqual(len(other_cache.place_index), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import random
+import unittest
+import numpy as np
+from googlemaps.convert import decode_polyline as reference_decode_polyline
+from googlemaps.convert import encode_polyline
+from travel_mapper.routing.polyline import decode_polyline, decode_polylines
+
+
+class TestPolylineMethods(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.polylines = [
+            encode_polyline(
+                [
+                    (rng.uniform(-80, 80), rng.uniform(-179, 179))
+                    for _ in range(rng.randint(1, 30))
+                ]
+            )
+            for _ in range(20)
+        ]
+
+    @staticmethod
+    def reference(encoded):
+        return np.array(
+            [[p["lat"], p["lng"]] for p in reference_decode_polyline(encoded)]
+        )
+
+    def test_decode_polyline(self):
+        # example from the Google encoded polyline documentation
+        np.testing.assert_allclose(
+            decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@"),
+            [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]],
+        )
+        for encoded in self.polylines:
+            np.testing.assert_allclose(
+                decode_polyline(encoded), self.reference(encoded)
+            )
+
+    def test_decode_polylines(self):
+        decoded = decode_polylines(self.polylines)
+        self.assertEqual(decoded.dtype, np.float64)
+        np.testing.assert_allclose(
+            decoded, np.vstack([self.reference(e) for e in self.polylines])
+        )
+
+    def test_decode_empty(self):
+        self.assertEqual(decode_polylines([]).shape, (0, 2))
+        self.assertEqual(decode_polyline("").shape, (0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
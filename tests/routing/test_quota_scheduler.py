@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+import unittest
+import googlemaps
+from travel_mapper.routing.QuotaScheduler import (
+    QuotaScheduler,
+    get_shared_quota_scheduler,
+    INTERACTIVE,
+    BATCH,
+)
+
+
+def over_query_limit():
+    return googlemaps.exceptions._OverQueryLimit("OVER_QUERY_LIMIT", "quota")
+
+
+class TestQuotaSchedulerMethods(unittest.TestCase):
+    def test_interactive_requests_go_first(self):
+        scheduler = QuotaScheduler({"geocode": 20})
+        # use up the burst so that the requests below have to queue
+        for _ in range(20):
+            scheduler.acquire("geocode")
+
+        served = []
+
+        def request(name, priority):
+            scheduler.call("geocode", served.append, name, priority=priority)
+
+        threads = [
+            threading.Thread(target=request, args=("batch", BATCH)) for _ in range(3)
+        ]
+        for t in threads:
+            t.start()
+        while scheduler.queue_depth("geocode") < 3:
+            time.sleep(0.001)
+        threads.append(
+            threading.Thread(target=request, args=("interactive", INTERACTIVE))
+        )
+        threads[-1].start()
+        for t in threads:
+            t.join()
+
+        # the first batch request may already hold the head of the queue
+        self.assertIn("interactive", served[:2])
+        self.assertEqual(scheduler.stats()["geocode"]["max_queue_depth"], 4)
+
+    def test_throughput_at_quota(self):
+        scheduler = QuotaScheduler({"geocode": 100, "directions": 100})
+        for endpoint in ("geocode", "directions"):
+            scheduler.buckets[endpoint].drain()
+
+        def requests(endpoint):
+            for _ in range(10):
+                scheduler.call(endpoint, lambda: None)
+
+        t1 = time.monotonic()
+        threads = [
+            threading.Thread(target=requests, args=(endpoint,))
+            for endpoint in ("geocode", "directions", "geocode", "directions")
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - t1
+        # 20 requests per endpoint at 100 per second, with the endpoints in parallel
+        self.assertGreaterEqual(elapsed, 0.19)
+        self.assertLess(elapsed, 0.5)
+        stats = scheduler.stats()
+        self.assertEqual(stats["geocode"]["requests"], 20)
+        self.assertEqual(stats["directions"]["queue_depth"], 0)
+
+    def test_over_query_limit_is_retried(self):
+        scheduler = QuotaScheduler(1000, backoff_seconds=0.01)
+        responses = [over_query_limit(), over_query_limit(), "OK"]
+
+        def request():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.assertEqual(scheduler.call("directions", request), "OK")
+        stats = scheduler.stats()["directions"]
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["over_query_limit"], 2)
+        self.assertEqual(stats["requests"], 3)
+
+    def test_gives_up_after_max_retries(self):
+        scheduler = QuotaScheduler(1000, max_retries=1, backoff_seconds=0.01)
+        calls = []
+
+        def request():
+            calls.append(1)
+            raise googlemaps.exceptions.HTTPError(503)
+
+        with self.assertRaises(googlemaps.exceptions.HTTPError):
+            scheduler.call("geocode", request)
+        self.assertEqual(len(calls), 2)
+
+        def not_found():
+            calls.append(1)
+            raise googlemaps.exceptions.ApiError("INVALID_REQUEST")
+
+        with self.assertRaises(googlemaps.exceptions.ApiError):
+            scheduler.call("geocode", not_found)
+        self.assertEqual(len(calls), 3)
+
+    def test_call_async(self):
+        scheduler = QuotaScheduler(50, backoff_seconds=0.01)
+        scheduler.buckets["geocode"].drain()
+        refused = [over_query_limit()]
+
+        async def request(i):
+            if i == 0 and refused:
+                raise refused.pop()
+            return i
+
+        async def main():
+            return await asyncio.gather(
+                *[
+                    scheduler.call_async("geocode", request, i, priority=BATCH)
+                    for i in range(5)
+                ]
+            )
+
+        t1 = time.monotonic()
+        self.assertEqual(asyncio.run(main()), list(range(5)))
+        # 6 requests at 50 per second, the bucket being emptied by the refusal
+        self.assertGreaterEqual(time.monotonic() - t1, 0.1)
+        self.assertEqual(scheduler.stats()["geocode"]["retries"], 1)
+
+    def test_shared_scheduler(self):
+        self.assertIs(
+            get_shared_quota_scheduler(7),
+            get_shared_quota_scheduler({"geocode": 7, "directions": 7}),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
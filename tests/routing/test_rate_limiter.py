@@ -0,0 +1,27 @@
+import threading
+import time
+import unittest
+from travel_mapper.routing.RateLimiter import RateLimiter
+
+
+class TestRateLimiterMethods(unittest.TestCase):
+    def test_burst_then_throttle(self):
+        limiter = RateLimiter(requests_per_second=20, burst=5)
+        for _ in range(5):
+            self.assertEqual(limiter.try_acquire(), 0)
+        self.assertGreater(limiter.try_acquire(), 0)
+
+    def test_rate_across_threads(self):
+        limiter = RateLimiter(requests_per_second=50, burst=1)
+        t1 = time.monotonic()
+        threads = [threading.Thread(target=limiter.acquire) for _ in range(11)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # one token is available up front, the other 10 arrive at 50 per second
+        self.assertGreaterEqual(time.monotonic() - t1, 0.18)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,492 @@
+import os
+import tempfile
+import threading
+import unittest
+import numpy as np
+from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from travel_mapper.routing.GeocodeQueue import GeocodeQueue
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from tests.routing.fakes import FakeMapsClient, FAKE_API_KEY
+
+
+class TestRouteFinderMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.geocode_cache = GeocodeCache(
+            path=os.path.join(self.tmp_dir.name, "geocode.sqlite")
+        )
+        self.directions_cache = DirectionsCache(
+            path=os.path.join(self.tmp_dir.name, "directions.sqlite")
+        )
+        self.route_finder = RouteFinder(
+            google_maps_api_key=FAKE_API_KEY,
+            geocode_cache=self.geocode_cache,
+            directions_cache=self.directions_cache,
+            requests_per_second=1000,
+        )
+        self.gmaps = FakeMapsClient()
+        self.route_finder.gmaps = self.gmaps
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_convert_to_coords_uses_cache(self):
+        first = self.route_finder.convert_to_coords("Berkeley, CA")
+        second = self.route_finder.convert_to_coords("berkeley CA")
+        self.assertEqual(first, second)
+        self.assertEqual(self.gmaps.geocode_calls, ["Berkeley, CA"])
+        self.assertEqual(self.geocode_cache.stats()["hits"], 1)
+
+        # a new RouteFinder pointed at the same cache file reuses the result
+        other_finder = RouteFinder(
+            google_maps_api_key=FAKE_API_KEY,
+            geocode_cache=GeocodeCache(path=self.geocode_cache.path),
+            directions_cache=self.directions_cache,
+        )
+        other_finder.gmaps = FakeMapsClient()
+        other_finder.convert_to_coords("Berkeley, CA")
+        self.assertEqual(other_finder.gmaps.geocode_calls, [])
+
+    def test_near_duplicate_places_snap_to_known_ones(self):
+        trip = {"start": "Berkeley, CA", "end": "Ferry Building, San Francisco"}
+        self.route_finder.build_route_segments(dict(trip, waypoints=[]), verbose=False)
+        building = self.geocode_cache.get_place("Ferry Building, San Francisco")
+
+        def geocode(address):
+            # the street address of the building, 200 m away
+            self.gmaps.geocode_calls.append(address)
+            location = {"lat": building.lat + 0.002, "lng": building.lng}
+            return [
+                {
+                    "formatted_address": address,
+                    "place_id": "pid_street_address",
+                    "geometry": {"location": location},
+                }
+            ]
+
+        self.gmaps.geocode = geocode
+        route, _, _ = self.route_finder.build_route_segments(
+            dict(trip, end="1 Ferry Building, San Francisco, CA", waypoints=[]),
+            verbose=False,
+        )
+        self.assertEqual(
+            self.gmaps.geocode_calls[-1], "1 Ferry Building, San Francisco, CA"
+        )
+        self.assertEqual(
+            self.geocode_cache.get_place("1 Ferry Building, San Francisco, CA"),
+            building,
+        )
+        # the directions are served from the cache
+        self.assertEqual(len(self.gmaps.directions_calls), 1)
+        self.assertEqual(route[-1].end.address, "Ferry Building, San Francisco")
+
+        self.route_finder.snap_radius_km = 0
+        self.assertEqual(
+            self.route_finder.convert_to_coords("Ferry Plaza").place_id,
+            "pid_street_address",
+        )
+
+    def test_build_mapping_dict_concurrent_keeps_order(self):
+        waypoints = ["Place {}".format(i) for i in range(20)]
+        mapping_dict = self.route_finder.build_mapping_dict(
+            "Berkeley, CA", "New York, NY", waypoints=waypoints, concurrent=True
+        )
+        sequential_dict = self.route_finder.build_mapping_dict(
+            "Berkeley, CA", "New York, NY", waypoints=waypoints, concurrent=False
+        )
+        self.assertEqual(mapping_dict, sequential_dict)
+        for i, waypoint in enumerate(waypoints):
+            self.assertEqual(mapping_dict["waypoint_{}".format(i)].address, waypoint)
+        # each place is only sent to the API once
+        self.assertEqual(len(self.gmaps.geocode_calls), 22)
+
+    def test_build_route_segments_over_max_waypoints(self):
+        waypoints = ["Place {}".format(i) for i in range(50)]
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "New York, NY",
+            "waypoints": waypoints,
+        }
+        route, sampled_route, mapping_dict = self.route_finder.build_route_segments(
+            list_of_places, verbose=False
+        )
+        # three segments, each fetched with a single directions call
+        self.assertEqual(len(self.gmaps.directions_calls), 3)
+        self.assertEqual(len(route), 51)
+        self.assertEqual(len(sampled_route), 51)
+        # the waypoints are reordered, but the trip still starts and ends in place
+        stops = [stop.address for stop in route.stops]
+        self.assertEqual(stops[0], "Berkeley, CA")
+        self.assertEqual(stops[-1], "New York, NY")
+        self.assertEqual(sorted(stops[1:-1]), sorted(waypoints))
+        self.assertEqual(
+            [mapping_dict["waypoint_{}".format(i)].address for i in range(50)],
+            stops[1:-1],
+        )
+        self.assertEqual(mapping_dict["start"].address, "Berkeley, CA")
+        self.assertEqual(mapping_dict["end"].address, "New York, NY")
+
+    def test_build_route_segments_with_geocode_queue(self):
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "New York, NY",
+            "waypoints": ["Reno, NV", "Nowhere", "Chicago, IL"],
+        }
+        geocode_queue = GeocodeQueue(self.route_finder)
+        # places queued as the agent wrote them, the last one was still missing
+        for place in ["Berkeley, CA", "New York, NY", "Reno, NV", "Nowhere"]:
+            geocode_queue.put(place)
+        route, _, mapping_dict = self.route_finder.build_route_segments(
+            list_of_places, verbose=False, geocode_queue=geocode_queue
+        )
+        geocode_queue.close()
+        self.assertEqual(len(geocode_queue), 5)
+        self.assertEqual(len(route), 3)
+        # each place, found or not, is only sent to the API once
+        self.assertEqual(
+            sorted(self.gmaps.geocode_calls),
+            sorted(
+                ["Berkeley, CA", "New York, NY", "Reno, NV", "Nowhere", "Chicago, IL"]
+            ),
+        )
+        self.assertEqual(self.route_finder.dropped_waypoints, ["Nowhere"])
+
+    def test_waypoint_order_shortens_long_trips(self):
+        waypoints = ["Place {}".format(i) for i in range(40)]
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "New York, NY",
+            "waypoints": waypoints,
+        }
+        ordered_route, _, _ = self.route_finder.build_route_segments(
+            list_of_places, verbose=False
+        )
+        self.route_finder.optimize_waypoint_order = False
+        unordered_route, _, _ = self.route_finder.build_route_segments(
+            list_of_places, verbose=False
+        )
+        self.assertEqual(
+            [stop.address for stop in unordered_route.stops],
+            ["Berkeley, CA"] + waypoints + ["New York, NY"],
+        )
+
+        def straight_line_km(route):
+            return sum(np.linalg.norm(leg.path[-1] - leg.path[0]) for leg in route)
+
+        self.assertLess(
+            straight_line_km(ordered_route), straight_line_km(unordered_route) / 2
+        )
+
+    def test_bisection_fallback_drops_bad_waypoints(self):
+        waypoints = ["Place {}".format(i) for i in range(23)]
+        waypoints[5] = "Unroutable island"
+        waypoints[17] = "Nowhere"
+        mapping_dict = self.route_finder.build_mapping_dict(
+            "Berkeley, CA", "New York, NY", waypoints=waypoints
+        )
+        route = self.route_finder.build_directions_and_route(
+            mapping_dict, verbose=False
+        )
+        self.assertEqual(
+            self.route_finder.dropped_waypoints, ["Nowhere", "Unroutable island"]
+        )
+        # 21 waypoints are left between start and end, so the route has 22 legs
+        self.assertEqual(len(route), 22)
+        self.assertEqual(route[0].start.address, "Berkeley, CA")
+        self.assertEqual(route[-1].end.address, "New York, NY")
+        for leg, next_leg in zip(route.legs[:-1], route.legs[1:]):
+            self.assertEqual(leg.end.address, next_leg.start.address)
+        # fewer calls than stepping through the 23 edges one by one
+        self.assertLess(len(self.gmaps.directions_calls), 23)
+        # the failed request through every waypoint is not made again
+        self.assertEqual(
+            [len(call[2]) for call in self.gmaps.directions_calls].count(22), 1
+        )
+
+    def test_bisection_drops_the_bad_point(self):
+        def bisect(n_points, bad, max_run_points=None, failed=False):
+            steps = self.route_finder.bisection_steps(
+                list(range(n_points)), max_run_points, failed=failed
+            )
+            try:
+                pending = next(steps)
+                while True:
+                    pending = steps.send(
+                        [
+                            [] if bad in run else [None] * (len(run) - 1)
+                            for run in pending
+                        ]
+                    )
+            except StopIteration as stop:
+                return stop.value
+
+        for n_points in [3, 12, 25]:
+            for bad in range(1, n_points - 1):
+                legs, dropped = bisect(n_points, bad, failed=True)
+                self.assertEqual(dropped, [bad], (n_points, bad))
+                self.assertEqual(len(legs), n_points - 2)
+                # one leg per request, like in transit mode
+                legs, dropped = bisect(n_points, bad, max_run_points=2)
+                self.assertEqual(dropped, [bad], (n_points, bad))
+
+    def test_bisection_keeps_a_stop_between_two_bad_ones(self):
+        points = list(range(13))
+        steps = self.route_finder.bisection_steps(points, failed=True)
+        try:
+            pending = next(steps)
+            while True:
+                pending = steps.send(
+                    [
+                        [] if {2, 4} & set(run) else [None] * (len(run) - 1)
+                        for run in pending
+                    ]
+                )
+        except StopIteration as stop:
+            legs, dropped = stop.value
+        self.assertEqual(dropped, [2, 4])
+        self.assertEqual(len(legs), 10)
+
+    def test_concurrent_trips_track_dropped_waypoints(self):
+        barrier = threading.Barrier(3)
+
+        def trip(waypoints):
+            self.route_finder.build_route_segments(
+                {"start": "Berkeley, CA", "end": "Reno, NV", "waypoints": waypoints},
+                verbose=False,
+            )
+            # every trip is built before any reads its dropped waypoints
+            barrier.wait()
+            return list(self.route_finder.dropped_waypoints)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            dropped = list(
+                executor.map(
+                    trip,
+                    [
+                        ["Sacramento, CA", "Nowhere"],
+                        ["Davis, CA", "Unroutable island", "Truckee, CA"],
+                        ["Auburn, CA"],
+                    ],
+                )
+            )
+        self.assertEqual(dropped, [["Nowhere"], ["Unroutable island"], []])
+
+    def test_segments_report_dropped_waypoints(self):
+        waypoints = ["Place {}".format(i) for i in range(50)]
+        waypoints[30] = "Unroutable island"
+        # within the second segment, which runs in a worker thread
+        self.route_finder.optimize_waypoint_order = False
+        self.route_finder.build_route_segments(
+            {"start": "Berkeley, CA", "end": "New York, NY", "waypoints": waypoints},
+            verbose=False,
+        )
+        self.assertEqual(self.route_finder.dropped_waypoints, ["Unroutable island"])
+
+    def test_session_reroutes_only_changed_legs(self):
+        waypoints = ["Place {}".format(i) for i in range(50)]
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "New York, NY",
+            "waypoints": waypoints,
+        }
+
+        def build(waypoints):
+            return self.route_finder.build_route_segments(
+                dict(list_of_places, waypoints=waypoints),
+                verbose=False,
+                session_id="session",
+            )
+
+        def check(route, mapping_dict, waypoints):
+            stops = [stop.address for stop in route.stops]
+            self.assertEqual(stops[0], "Berkeley, CA")
+            self.assertEqual(stops[-1], "New York, NY")
+            self.assertEqual(sorted(stops[1:-1]), sorted(waypoints))
+            for leg, next_leg in zip(route.legs[:-1], route.legs[1:]):
+                self.assertEqual(leg.end.address, next_leg.start.address)
+            self.assertEqual(
+                [mapping_dict["waypoint_{}".format(i)].address for i in range(50)],
+                stops[1:-1],
+            )
+
+        route, _, mapping_dict = build(waypoints)
+        check(route, mapping_dict, waypoints)
+        self.assertEqual(len(self.gmaps.directions_calls), 3)
+        self.assertEqual(len(self.gmaps.geocode_calls), 52)
+
+        # adding a waypoint only fetches the two legs to and from it
+        waypoints = waypoints[:10] + waypoints[11:] + ["Place 50"]
+        route, _, mapping_dict = build(waypoints)
+        check(route, mapping_dict, waypoints)
+        self.assertEqual(len(self.gmaps.geocode_calls), 53)
+        self.assertEqual(len(self.gmaps.directions_calls), 5)
+        self.assertTrue(
+            all(len(call[2]) <= 1 for call in self.gmaps.directions_calls[3:])
+        )
+
+        # a new session starts from scratch, from the directions cache here
+        route, _, mapping_dict = self.route_finder.build_route_segments(
+            list_of_places, verbose=False, session_id="other session"
+        )
+        check(route, mapping_dict, list_of_places["waypoints"])
+        self.assertEqual(len(self.gmaps.directions_calls), 5)
+
+    def test_session_drops_unroutable_waypoints(self):
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "Denver, CO",
+            "waypoints": ["Reno, NV", "Salt Lake City, UT"],
+            "transit": "train",
+        }
+
+        def build(waypoints):
+            return self.route_finder.build_route_segments(
+                dict(list_of_places, waypoints=waypoints),
+                verbose=False,
+                session_id="session",
+            )
+
+        build(list_of_places["waypoints"])
+        # every leg of a transit route is a request of its own
+        route, _, mapping_dict = build(
+            ["Reno, NV", "Unroutable town", "Salt Lake City, UT"]
+        )
+        stops = [stop.address for stop in route.stops]
+        self.assertEqual(len(route), 3)
+        self.assertNotIn("Unroutable town", stops)
+        for leg, next_leg in zip(route.legs[:-1], route.legs[1:]):
+            self.assertEqual(leg.end.address, next_leg.start.address)
+        self.assertEqual(self.route_finder.dropped_waypoints, ["Unroutable town"])
+        self.assertEqual(len(mapping_dict), 4)
+        session = self.route_finder.route_sessions.get(("session", "transit"))
+        self.assertEqual(session["stops"], stops)
+
+    def test_session_without_route_is_not_saved(self):
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "Unroutable town",
+            "waypoints": ["Reno, NV"],
+        }
+        route, _, _ = self.route_finder.build_route_segments(
+            list_of_places, verbose=False, session_id="session"
+        )
+        self.assertEqual(len(route), 0)
+        self.assertIsNone(self.route_finder.route_sessions.get(("session", "driving")))
+
+    def test_transit_mode(self):
+        self.assertEqual(RouteFinder.transit_mode("Train"), "transit")
+        self.assertEqual(RouteFinder.transit_mode("public transport"), "transit")
+        self.assertEqual(RouteFinder.transit_mode("walking tour"), "walking")
+        self.assertEqual(RouteFinder.transit_mode("bicycling"), "bicycling")
+        self.assertEqual(RouteFinder.transit_mode("road trip by car"), "driving")
+        self.assertEqual(RouteFinder.transit_mode(None), "driving")
+        # whole words only
+        self.assertEqual(RouteFinder.transit_mode("scenic trail drive"), "driving")
+        self.assertEqual(RouteFinder.transit_mode("Amtrak rail pass"), "transit")
+        self.assertEqual(RouteFinder.transit_mode("on foot"), "walking")
+        self.assertEqual(RouteFinder.transit_mode("e-bike"), "bicycling")
+
+    def test_compare_modes(self):
+        directions = self.gmaps.directions
+        requests = []
+
+        def directions_by_mode(origin, destination, waypoints=None, mode=None, **_):
+            requests.append((mode, len(waypoints or [])))
+            routes = directions(origin, destination, waypoints)
+            # transit is twice as fast as driving here
+            for leg in routes[0]["legs"] if mode == "transit" else []:
+                leg["duration"]["value"] //= 2
+            return routes
+
+        self.gmaps.directions = directions_by_mode
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "New York, NY",
+            "waypoints": ["Place {}".format(i) for i in range(5)],
+            "transit": "train",
+        }
+        route, _, mapping_dict, summaries = self.route_finder.compare_modes(
+            list_of_places, verbose=False
+        )
+        self.assertEqual(
+            [summary["mode"] for summary in summaries], ["transit", "driving"]
+        )
+        self.assertAlmostEqual(summaries[0]["duration_hrs"], 3.0)
+        self.assertAlmostEqual(summaries[1]["duration_hrs"], 6.0)
+        self.assertEqual(summaries[0]["distance_km"], 600)
+        self.assertAlmostEqual(route.duration / 3600, 3.0)
+        self.assertEqual(mapping_dict["end"].address, "New York, NY")
+        # transit legs are requested one at a time, driving takes a single call
+        self.assertEqual(sorted(requests), [("driving", 5)] + [("transit", 0)] * 6)
+        # every place is geocoded once for both modes
+        self.assertEqual(len(self.gmaps.geocode_calls), 7)
+
+        # the trip's own mode is used by default, and cached apart from the others
+        requests.clear()
+        self.route_finder.build_route_segments(list_of_places, verbose=False)
+        self.route_finder.build_route_segments(
+            dict(list_of_places, transit="on foot"), verbose=False
+        )
+        self.assertEqual(requests, [("walking", 5)])
+
+    def test_route_arrays_and_legacy_view(self):
+        mapping_dict = self.route_finder.build_mapping_dict(
+            "Berkeley, CA", "New York, NY", waypoints=["Place 1"]
+        )
+        route = self.route_finder.build_directions_and_route(
+            mapping_dict, verbose=False
+        )
+        self.assertEqual(route[0].path.shape, (4, 2))
+        np.testing.assert_allclose(
+            route[0].path[0], mapping_dict["start"].location, atol=1e-5
+        )
+
+        legacy_route = self.route_finder.get_legacy_route(route)
+        lat, lng = legacy_route[0]["route"][0].split(",")
+        self.assertAlmostEqual(float(lat), route[0].path[0, 0])
+        self.assertAlmostEqual(float(lng), route[0].path[0, 1])
+        self.assertEqual(legacy_route[1]["distance"], route[1].distance_text)
+
+    def test_directions_cache(self):
+        mapping_dict = self.route_finder.build_mapping_dict(
+            "Berkeley, CA", "New York, NY", waypoints=["Place 1", "Place 2"]
+        )
+        start_time = datetime(2030, 1, 1, 10, 5)
+        first = self.route_finder.build_directions_and_route(
+            mapping_dict, start_time=start_time, verbose=False
+        )
+        # same departure bucket is served from the cache
+        second = self.route_finder.build_directions_and_route(
+            mapping_dict, start_time=start_time + timedelta(minutes=10), verbose=False
+        )
+        self.assertEqual(first.to_dict(), second.to_dict())
+        self.assertEqual(len(self.gmaps.directions_calls), 1)
+
+        # a different bucket or mode needs a new call
+        self.route_finder.build_directions_and_route(
+            mapping_dict, start_time=start_time + timedelta(hours=2), verbose=False
+        )
+        self.route_finder.build_directions_and_route(
+            mapping_dict, start_time=start_time, transit_type="walking", verbose=False
+        )
+        self.assertEqual(len(self.gmaps.directions_calls), 3)
+
+    def test_departure_bucket(self):
+        bucket = DirectionsCache.departure_bucket(datetime(2030, 1, 1, 10, 5), 3600)
+        self.assertEqual(bucket, datetime(2030, 1, 1, 11, 0))
+
+    def test_missing_start_raises(self):
+        with self.assertRaises(ValueError):
+            self.route_finder.build_mapping_dict("Nowhere", "New York, NY", [])
+
+    def test_empty_geocode_not_cached(self):
+        self.assertIsNone(self.route_finder.convert_to_coords("Nowhere"))
+        self.assertIsNone(self.route_finder.convert_to_coords("Nowhere"))
+        self.assertEqual(len(self.gmaps.geocode_calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
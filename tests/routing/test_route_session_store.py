@@ -0,0 +1,45 @@
+import unittest
+from unittest import mock
+from travel_mapper.routing.RouteSessionStore import RouteSessionStore
+
+
+class TestRouteSessionStoreMethods(unittest.TestCase):
+    def setUp(self):
+        self.store = RouteSessionStore(max_entries=2, ttl_seconds=100)
+        self.now = 1000.0
+        patcher = mock.patch(
+            "travel_mapper.routing.RouteSessionStore.time.time", lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reused_legs_expire(self):
+        ab, bc, cd = object(), object(), object()
+        self.store.set("session", ["a", "b", "c"], {}, {("a", "b"): ab, ("b", "c"): bc})
+        self.now += 60
+        # the session is saved again, reusing the leg a to b
+        self.store.set(
+            "session", ["a", "b", "c", "d"], {}, {("a", "b"): ab, ("c", "d"): cd}
+        )
+        self.now += 50
+        session = self.store.get("session")
+        self.assertEqual(session["stops"], ["a", "b", "c", "d"])
+        self.assertEqual(session["legs"], {("c", "d"): cd})
+
+        # not saved again since
+        self.now += 51
+        self.assertIsNone(self.store.get("session"))
+
+    def test_sessions_expire_and_are_evicted(self):
+        self.store.set("first", ["a", "b"], {}, {})
+        self.store.set("second", ["a", "b"], {}, {})
+        self.assertIsNotNone(self.store.get("first"))
+        self.store.set("third", ["a", "b"], {}, {})
+        self.assertIsNone(self.store.get("second"))
+        self.now += 101
+        self.assertIsNone(self.store.get("first"))
+        self.assertEqual(len(self.store), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
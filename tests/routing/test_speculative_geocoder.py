@@ -0,0 +1,144 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from travel_mapper.TravelMapper import TravelMapperBase
+from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.DirectionsCache import DirectionsCache
+from travel_mapper.routing.SpeculativeGeocoder import SpeculativeGeocoder
+from travel_mapper.routing.models import Place
+from travel_mapper.user_interface.constants import EXAMPLE_QUERY
+from tests.routing.fakes import FakeMapsClient, FAKE_API_KEY
+from tests.agent.fakes import make_fake_agent
+
+
+class SlowMapsClient(FakeMapsClient):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def geocode(self, address):
+        self.release.wait(timeout=5)
+        return super().geocode(address)
+
+
+class TestSpeculativeGeocoderMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.geocode_cache = GeocodeCache(
+            path=os.path.join(self.tmp_dir.name, "geocode.sqlite")
+        )
+        self.route_finder = RouteFinder(
+            google_maps_api_key=FAKE_API_KEY,
+            geocode_cache=self.geocode_cache,
+            directions_cache=DirectionsCache(
+                path=os.path.join(self.tmp_dir.name, "directions.sqlite")
+            ),
+            requests_per_second=1000,
+        )
+        self.gmaps = FakeMapsClient()
+        self.route_finder.gmaps = self.gmaps
+        self.speculative_geocoder = SpeculativeGeocoder(self.route_finder)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_extract_endpoints(self):
+        self.assertEqual(
+            SpeculativeGeocoder.extract_endpoints(EXAMPLE_QUERY),
+            {"start": "Berkeley CA", "end": "New York City"},
+        )
+        self.assertEqual(
+            SpeculativeGeocoder.extract_endpoints(
+                "A walking tour starting in St. Louis and ending at Chicago."
+            ),
+            {"start": "St. Louis", "end": "Chicago"},
+        )
+        self.assertEqual(
+            SpeculativeGeocoder.extract_endpoints(
+                "Plan a trip between San Francisco, CA and Los Angeles. Lots of food"
+            ),
+            {"start": "San Francisco, CA", "end": "Los Angeles"},
+        )
+        self.assertEqual(
+            SpeculativeGeocoder.extract_endpoints("a weekend of museums"),
+            {"start": None, "end": None},
+        )
+
+    def test_same_place(self):
+        place = Place("Paris, France", 48.86, 2.35)
+        self.assertTrue(SpeculativeGeocoder.same_place("Paris, France", "Paris", place))
+        self.assertFalse(SpeculativeGeocoder.same_place("Paris, Texas", "Paris", place))
+        self.assertFalse(SpeculativeGeocoder.same_place("France", "Paris", place))
+
+    def test_reconcile_seeds_cache(self):
+        speculation = self.speculative_geocoder.speculate(EXAMPLE_QUERY)
+        list_of_places = {
+            "start": "Berkeley, CA",
+            "end": "Boston, MA",
+            "waypoints": ["Chicago, IL"],
+        }
+        n_hits = self.speculative_geocoder.reconcile(speculation, list_of_places)
+        self.assertEqual(n_hits, 1)
+        self.assertEqual(self.speculative_geocoder.stats(), {"hits": 1, "misses": 1})
+
+        self.route_finder.geocode_places(
+            ["Berkeley, CA", "Boston, MA", "Chicago, IL"], concurrent=False
+        )
+        # only the endpoint that was speculated wrong and the waypoint were
+        # geocoded after the agent finished
+        self.assertEqual(
+            self.gmaps.geocode_calls,
+            ["Berkeley CA", "New York City", "Boston, MA", "Chicago, IL"],
+        )
+
+    def test_concurrent_speculations_share_requests(self):
+        gmaps = SlowMapsClient()
+        self.route_finder.gmaps = gmaps
+        first = self.speculative_geocoder.speculate(EXAMPLE_QUERY)
+        second = self.speculative_geocoder.speculate(
+            "Drive from Berkeley, CA to New York City"
+        )
+        self.assertIs(first["start"][1], second["start"][1])
+        gmaps.release.set()
+        self.assertIsNotNone(first["end"][1].result(timeout=5))
+        self.assertEqual(sorted(gmaps.geocode_calls), ["Berkeley CA", "New York City"])
+
+    def make_travel_mapper(self, speculative_geocoding, stream_mapping_list):
+        agent = make_fake_agent(speculative=False, validation_delay_seconds=0)
+        agent.chat_model.delay_seconds = 0
+        with mock.patch(
+            "travel_mapper.TravelMapper.Agent", lambda **kwargs: agent
+        ), mock.patch(
+            "travel_mapper.TravelMapper.RouteFinder",
+            lambda **kwargs: self.route_finder,
+        ):
+            return TravelMapperBase(
+                openai_api_key="sk-fake",
+                google_palm_api_key=None,
+                google_maps_key=FAKE_API_KEY,
+                speculative_geocoding=speculative_geocoding,
+                stream_mapping_list=stream_mapping_list,
+            )
+
+    def test_no_speculation_while_streaming_places(self):
+        travel_mapper = self.make_travel_mapper(True, True)
+        self.assertIsNone(travel_mapper.speculative_geocoder)
+        _, list_of_places, _, geocode_queue = travel_mapper._suggest_travel(
+            "Drive from Berkeley, CA to New York"
+        )
+        places = [list_of_places["start"], list_of_places["end"]]
+        places += list_of_places["waypoints"]
+        geocode_queue.geocodes(places)
+        geocode_queue.close()
+        # each place of the trip once, from the queue
+        self.assertEqual(sorted(self.gmaps.geocode_calls), sorted(places))
+
+        travel_mapper = self.make_travel_mapper(True, False)
+        self.assertIsNotNone(travel_mapper.speculative_geocoder)
+
+
+if __name__ == "__main__":
+    unittest.main()
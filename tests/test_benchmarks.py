@@ -0,0 +1,40 @@
+import unittest
+from benchmarks.run_routing_benchmarks import (
+    compare_to_baseline,
+    measure,
+    synthetic_trip,
+)
+
+
+class TestBenchmarksMethods(unittest.TestCase):
+    def test_compare_to_baseline(self):
+        baseline = {
+            "get_route/10": {"wall_time_s": 1.0, "peak_alloc_bytes": 1000},
+            "map_folium/10": {"wall_time_s": 1.0, "html_bytes": 1000},
+        }
+        results = {
+            "get_route/10": {"wall_time_s": 1.2, "peak_alloc_bytes": 2000},
+            "map_folium/10": {"wall_time_s": 20.0, "html_bytes": 1000},
+            "get_route/500": {"wall_time_s": 100.0, "peak_alloc_bytes": 1},
+        }
+        regressions = compare_to_baseline(results, baseline)
+        # wall times are not gated
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("get_route/10 peak_alloc_bytes"))
+
+    def test_measure(self):
+        metrics = measure(lambda n: "<p>{}</p>".format(list(range(n))), lambda: 3)
+        self.assertEqual(metrics["html_bytes"], 16)
+        self.assertGreater(metrics["peak_alloc_bytes"], 0)
+
+        metrics = measure(lambda n: list(range(n)), lambda: 1000)
+        self.assertNotIn("html_bytes", metrics)
+        self.assertGreater(metrics["peak_alloc_bytes"], 8000)
+
+        trip = synthetic_trip(5)
+        self.assertEqual(len(trip["waypoints"]), 5)
+        self.assertEqual(trip, synthetic_trip(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+from travel_mapper.routing.models import Place, Leg, Route
+from travel_mapper.user_interface.utils import (
+    generate_generic_leafmap,
+    generate_leafmap,
+)
+
+
+class TestUserInterfaceUtilsMethods(unittest.TestCase):
+    def test_generate_leafmap(self):
+        leg = Leg(
+            start=Place("Berkeley, CA", 37.87, -122.27),
+            end=Place("Reno, NV", 39.53, -119.81),
+            distance=350000,
+            duration=12600,
+            distance_text="350 km",
+            duration_text="3 hours 30 mins",
+            path=np.array([[37.87, -122.27], [39.53, -119.81]]),
+        )
+        html = generate_leafmap(Route([leg]), Route([leg]))
+        self.assertIn("Reno, NV", html)
+
+    def test_empty_route_gives_the_generic_map(self):
+        html = generate_leafmap(Route([]), Route([]))
+        self.assertNotIn("Click for address", html)
+        self.assertEqual(len(html), len(generate_generic_leafmap()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 from travel_mapper.agent.Agent import Agent
 from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.AsyncRouteFinder import AsyncRouteFinder
+from travel_mapper.routing.SpeculativeGeocoder import SpeculativeGeocoder
+from travel_mapper.routing.GeocodeQueue import GeocodeQueue
 from travel_mapper.user_interface.utils import (
     generate_leafmap,
     validation_message,
@@ -8,6 +11,13 @@ from travel_mapper.user_interface.utils import (
 from dotenv import load_dotenv
 from pathlib import Path
 from travel_mapper.user_interface.constants import VALID_MESSAGE
+from travel_mapper.constants import (
+    GOOGLE_MAPS_BASE_URL,
+    SPECULATIVE_GEOCODING,
+    STREAM_MAPPING_LIST,
+    SPECULATIVE_AGENT,
+)
+import asyncio
 import os
 
 
@@ -19,11 +29,14 @@ def load_secrets():
     open_ai_key = os.getenv("OPENAI_API_KEY")
     google_maps_key = os.getenv("GOOGLE_MAPS_API_KEY")
     google_palm_key = os.getenv("GOOGLE_PALM_API_KEY")
+    # optional, e.g. the url of a MapsStandInServer
+    google_maps_base_url = os.getenv("GOOGLE_MAPS_BASE_URL", GOOGLE_MAPS_BASE_URL)
 
     return {
         "OPENAI_API_KEY": open_ai_key,
         "GOOGLE_MAPS_API_KEY": google_maps_key,
         "GOOGLE_PALM_API_KEY": google_palm_key,
+        "GOOGLE_MAPS_BASE_URL": google_maps_base_url,
     }
 
 
@@ -35,86 +48,211 @@ def assert_secrets(secrets_dict):
 
 class TravelMapperBase(object):
     def __init__(
-        self, openai_api_key, google_palm_api_key, google_maps_key, verbose=False
+        self,
+        openai_api_key,
+        google_palm_api_key,
+        google_maps_key,
+        verbose=False,
+        google_maps_base_url=GOOGLE_MAPS_BASE_URL,
+        speculative_geocoding=SPECULATIVE_GEOCODING,
+        stream_mapping_list=STREAM_MAPPING_LIST,
+        speculative_agent=SPECULATIVE_AGENT,
+        preload_models=(),
     ):
         self.travel_agent = Agent(
             open_ai_api_key=openai_api_key,
             google_palm_api_key=google_palm_api_key,
             debug=verbose,
+            streaming=stream_mapping_list,
+            speculative=speculative_agent,
+            preload_models=preload_models,
+        )
+        self.route_finder = RouteFinder(
+            google_maps_api_key=google_maps_key, base_url=google_maps_base_url
+        )
+        # geocodes the places of the trip as the mapping chain writes them
+        self.stream_mapping_list = stream_mapping_list
+        # geocodes the start and end named in the query while the agent runs. The
+        # GeocodeQueue of the streamed places already has them geocoded by the
+        # time the agent returns, so speculating as well would only repeat the
+        # requests
+        self.speculative_geocoder = (
+            SpeculativeGeocoder(self.route_finder)
+            if speculative_geocoding and not stream_mapping_list
+            else None
+        )
+
+    def _speculate(self, query):
+        if self.speculative_geocoder is None:
+            return None
+        return self.speculative_geocoder.speculate(query)
+
+    def _reconcile(self, speculation, list_of_places):
+        if speculation is None or list_of_places is None:
+            return
+        self.speculative_geocoder.reconcile(speculation, list_of_places)
+
+    def _suggest_travel(self, query, model_name=None):
+        """
+        Call the agent, geocoding places of the trip while it runs
+
+        Parameters
+        ----------
+        query
+        model_name: optional model of the agent to answer with
+
+        Returns
+        -------
+        the output of Agent.suggest_travel, and the GeocodeQueue of the places
+        the agent wrote, or None
+        """
+        speculation = self._speculate(query)
+        geocode_queue = None
+        if self.stream_mapping_list:
+            geocode_queue = GeocodeQueue(self.route_finder)
+        itinerary, list_of_places, validation = self.travel_agent.suggest_travel(
+            query,
+            on_place=geocode_queue.put if geocode_queue is not None else None,
+            model_name=model_name,
         )
-        self.route_finder = RouteFinder(google_maps_api_key=google_maps_key)
+        self._reconcile(speculation, list_of_places)
+        return itinerary, list_of_places, validation, geocode_queue
 
     def parse(self, query, make_map=True):
         """
         For running when we don't want to call gradio
         """
-        itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query)
+        itinerary, list_of_places, validation, geocode_queue = self._suggest_travel(
+            query
+        )
 
-        directions, sampled_route, mapping_dict = self.route_finder.generate_route(
-            list_of_places=list_of_places, itinerary=itinerary, include_map=make_map
+        route, sampled_route, mapping_dict = self.route_finder.generate_route(
+            list_of_places=list_of_places,
+            itinerary=itinerary,
+            include_map=make_map,
+            geocode_queue=geocode_queue,
         )
+        if geocode_queue is not None:
+            geocode_queue.close()
 
 
 class TravelMapperForUI(TravelMapperBase):
-    def _model_type_switch(self, new_model_name):
+    def __init__(
+        self,
+        openai_api_key,
+        google_palm_api_key,
+        google_maps_key,
+        verbose=False,
+        google_maps_base_url=GOOGLE_MAPS_BASE_URL,
+        speculative_geocoding=SPECULATIVE_GEOCODING,
+        stream_mapping_list=STREAM_MAPPING_LIST,
+        speculative_agent=SPECULATIVE_AGENT,
+        preload_models=(),
+    ):
+        super().__init__(
+            openai_api_key=openai_api_key,
+            google_palm_api_key=google_palm_api_key,
+            google_maps_key=google_maps_key,
+            verbose=verbose,
+            google_maps_base_url=google_maps_base_url,
+            speculative_geocoding=speculative_geocoding,
+            stream_mapping_list=stream_mapping_list,
+            speculative_agent=speculative_agent,
+            preload_models=preload_models,
+        )
+        # routes for the async handlers are fetched on the event loop, so that
+        # concurrent requests don't each hold a worker thread
+        self.async_route_finder = AsyncRouteFinder(
+            google_maps_api_key=google_maps_key, base_url=google_maps_base_url
+        )
+
+    def generate_without_leafmap(self, query, model_name):
         """
 
         Parameters
         ----------
-        new_model_name
+        query
+        model_name
 
         Returns
         -------
 
         """
-        current_model_name = self.travel_agent.chat_model.model_name
-        if ("gpt" in current_model_name and "gpt" not in new_model_name) or (
-            "bison" in current_model_name and "bison" not in new_model_name
-        ):
-            # change the model family
-            self.travel_agent.update_model_family(new_model_name)
-        elif current_model_name != new_model_name:
-            self.travel_agent.chat_model.model_name = new_model_name
+        itinerary, list_of_places, validation = self.travel_agent.suggest_travel(
+            query, model_name=model_name
+        )
 
-    def generate_without_leafmap(self, query, model_name):
+        # make validation message
+        validation_string = validation_message(validation)
+
+        if validation_string != VALID_MESSAGE:
+            itinerary = "No valid itinerary"
+
+        return itinerary, validation_string
+
+    def generate_with_leafmap(self, query, model_name, session_id=None):
         """
 
         Parameters
         ----------
         query
         model_name
+        session_id: optional id of the user session, so that edits of a trip
+            only re-route the parts that changed
 
         Returns
         -------
 
         """
-        self._model_type_switch(model_name)
-
-        itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query)
+        itinerary, list_of_places, validation, geocode_queue = self._suggest_travel(
+            query, model_name
+        )
 
         # make validation message
         validation_string = validation_message(validation)
 
         if validation_string != VALID_MESSAGE:
             itinerary = "No valid itinerary"
+            # make a generic map here
+            map_html = generate_generic_leafmap()
 
-        return itinerary, validation_string
+        else:
+            route, sampled_route, mapping_dict = self.route_finder.generate_route(
+                list_of_places=list_of_places,
+                itinerary=itinerary,
+                include_map=False,
+                session_id=session_id,
+                geocode_queue=geocode_queue,
+            )
+
+            map_html = generate_leafmap(route, sampled_route)
 
-    def generate_with_leafmap(self, query, model_name):
+        if geocode_queue is not None:
+            geocode_queue.close()
+        return map_html, itinerary, validation_string
+
+    async def generate_with_leafmap_async(self, query, model_name, session_id=None):
         """
+        Same as generate_with_leafmap, but awaiting the Google Maps requests. The
+        agent calls are still blocking and run in a worker thread
 
         Parameters
         ----------
         query
         model_name
+        session_id
 
         Returns
         -------
 
         """
-        self._model_type_switch(model_name)
-
-        itinerary, list_of_places, validation = self.travel_agent.suggest_travel(query)
+        loop = asyncio.get_running_loop()
+        (
+            itinerary,
+            list_of_places,
+            validation,
+            geocode_queue,
+        ) = await loop.run_in_executor(None, self._suggest_travel, query, model_name)
 
         # make validation message
         validation_string = validation_message(validation)
@@ -126,13 +264,19 @@ class TravelMapperForUI(TravelMapperBase):
 
         else:
             (
-                directions_list,
+                route,
                 sampled_route,
                 mapping_dict,
-            ) = self.route_finder.generate_route(
-                list_of_places=list_of_places, itinerary=itinerary, include_map=False
+            ) = await self.async_route_finder.generate_route(
+                list_of_places=list_of_places,
+                itinerary=itinerary,
+                include_map=False,
+                session_id=session_id,
+                geocode_queue=geocode_queue,
             )
 
-            map_html = generate_leafmap(directions_list, sampled_route)
+            map_html = generate_leafmap(route, sampled_route)
 
+        if geocode_queue is not None:
+            geocode_queue.close()
         return map_html, itinerary, validation_string
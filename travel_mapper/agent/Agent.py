@@ -1,14 +1,32 @@
-from langchain.chains import LLMChain, SequentialChain
+from langchain.chains import LLMChain, SequentialChain, TransformChain
 from langchain.chat_models import ChatOpenAI
 from langchain.llms import GooglePalm
 from travel_mapper.agent.templates import (
     ValidationTemplate,
     ItineraryTemplate,
     MappingTemplate,
+    ItineraryMappingTemplate,
+    Trip,
 )
-from travel_mapper.constants import MODEL_NAME, TEMPERATURE
+from travel_mapper.agent.streaming import TripStreamHandler
+from travel_mapper.agent.speculation import CancellationHandler, SpeculationCancelled
+from travel_mapper.agent.LLMResponseCache import get_shared_llm_response_cache
+from travel_mapper.agent.SimilarQueryCache import get_shared_similar_query_cache
+from travel_mapper.constants import (
+    MODEL_NAME,
+    TEMPERATURE,
+    STREAM_MAPPING_LIST,
+    SPECULATIVE_AGENT,
+    AGENT_MAX_WORKERS,
+    SINGLE_CALL_AGENT,
+    CACHE_LLM_RESPONSES,
+    SIMILAR_QUERY_CACHE,
+)
+from concurrent.futures import ThreadPoolExecutor
 import openai
+import threading
 import logging
+import copy
 import time
 
 logging.basicConfig(level=logging.INFO)
@@ -22,72 +40,187 @@ class Agent(object):
         model=MODEL_NAME,
         temperature=TEMPERATURE,
         debug=True,
+        streaming=STREAM_MAPPING_LIST,
+        speculative=SPECULATIVE_AGENT,
+        single_call=SINGLE_CALL_AGENT,
+        cache_responses=CACHE_LLM_RESPONSES,
+        response_cache=None,
+        cache_similar_queries=SIMILAR_QUERY_CACHE,
+        similar_query_cache=None,
+        preload_models=(),
     ):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
+        # stream the tokens of models that support it, so that the places of the
+        # trip can be reported before the mapping chain has finished
+        self.streaming = streaming
 
-        if "gpt" in model:
-            # model is open ai
-            self.logger.info("Base LLM is OpenAI chatGPT series")
-            openai.api_key = open_ai_api_key
-            self.chat_model = ChatOpenAI(model=model, temperature=temperature)
-        elif "bison-001" in model:
-            # model is google palm
-            self.logger.info("Base LLM is Google Palm")
-            self.chat_model = GooglePalm(
-                model_name=model,
-                temperature=temperature,
-                google_api_key=google_palm_api_key,
-            )
-
+        self.temperature = temperature
+        self.debug = debug
         self._palm_key = google_palm_api_key
         self._openai_key = open_ai_api_key
 
         self.validation_prompt = ValidationTemplate()
         self.itinerary_prompt = ItineraryTemplate()
         self.mapping_prompt = MappingTemplate()
+        self.itinerary_mapping_prompt = ItineraryMappingTemplate()
+
+        # the chains of each model are built once and shared by every request,
+        # see chains. Those of the default model are also the attributes
+        # chat_model, validation_chain, agent_chain and single_call_chain
+        self._chain_sets = {}
+        self._chain_sets_lock = threading.Lock()
+        for model_name in preload_models:
+            # a model that can't be built, e.g. without its optional package,
+            # is left out rather than failing the start up
+            try:
+                self.chains(model_name)
+            except Exception as e:
+                self.logger.warning(
+                    "Could not preload the model {}: {}".format(model_name, e)
+                )
+        self.use_model(model)
+        # the single call chain writes the itinerary and the list of places in a
+        # single call, used instead of agent_chain when single_call is set
+        self.single_call = single_call
+
+        # in speculative mode the agent chain runs in a worker thread alongside
+        # the validation, see _suggest_travel_speculatively
+        self.speculative = speculative
+        self._executor = ThreadPoolExecutor(max_workers=AGENT_MAX_WORKERS)
+        self._speculation_lock = threading.Lock()
+        self._speculation_stats = {
+            "runs": 0,
+            "discarded": 0,
+            "cancelled": 0,
+            "wasted_seconds": 0.0,
+        }
+
+        # outputs of the chain stages run at temperature 0 are reused for
+        # identical inputs, see _call_stage
+        if cache_responses and response_cache is None:
+            response_cache = get_shared_llm_response_cache()
+        self.response_cache = response_cache if cache_responses else None
+        # trips of earlier queries are returned for reworded versions of them
+        # that pass validation, see _cached_suggestion
+        if cache_similar_queries and similar_query_cache is None:
+            similar_query_cache = get_shared_similar_query_cache()
+        self.similar_query_cache = (
+            similar_query_cache if cache_similar_queries else None
+        )
 
-        self.validation_chain = self._set_up_validation_chain(debug)
-        self.agent_chain = self._set_up_agent_chain(debug)
-
-    def update_model_family(self, new_model):
+    def _make_chat_model(self, model_name):
         """
 
         Parameters
         ----------
-        new_model
+        model_name
 
         Returns
         -------
-
+        the LLM of the model
         """
-
-        if "gpt" in new_model:
+        if "gpt" in model_name:
             # model is open ai
             self.logger.info("Base LLM is OpenAI chatGPT series")
-            self.chat_model = ChatOpenAI(model=new_model, temperature=TEMPERATURE)
-        elif "bison-001" in new_model:
+            openai.api_key = self._openai_key
+            return ChatOpenAI(
+                model=model_name, temperature=self.temperature, streaming=self.streaming
+            )
+        elif "bison-001" in model_name:
             # model is google palm
             self.logger.info("Base LLM is Google Palm")
-            self.chat_model = GooglePalm(
-                model_name=new_model,
-                temperature=TEMPERATURE,
+            return GooglePalm(
+                model_name=model_name,
+                temperature=self.temperature,
                 google_api_key=self._palm_key,
             )
+        raise ValueError("Unknown model {}".format(model_name))
+
+    def chains(self, model_name=None):
+        """
+        The LLM and chains of a model, built on first use
+
+        Parameters
+        ----------
+        model_name: by default the model set with use_model
+
+        Returns
+        -------
+        dict with the chat_model, validation_chain, agent_chain and
+        single_call_chain of the model
+        """
+        if model_name is None:
+            return {
+                "chat_model": self.chat_model,
+                "validation_chain": self.validation_chain,
+                "agent_chain": self.agent_chain,
+                "single_call_chain": self.single_call_chain,
+            }
+
+        with self._chain_sets_lock:
+            if model_name not in self._chain_sets:
+                chat_model = self._make_chat_model(model_name)
+                self._chain_sets[model_name] = {
+                    "chat_model": chat_model,
+                    "validation_chain": self._set_up_validation_chain(
+                        self.debug, chat_model
+                    ),
+                    "agent_chain": self._set_up_agent_chain(self.debug, chat_model),
+                    "single_call_chain": self._set_up_single_call_chain(
+                        self.debug, chat_model
+                    ),
+                }
+            return self._chain_sets[model_name]
 
-    def _set_up_validation_chain(self, debug=True):
+    def use_model(self, model_name):
+        """
+        Make a model the default one of the requests that don't pick theirs
+
+        Parameters
+        ----------
+        model_name
+
+        Returns
+        -------
+
+        """
+        chains = self.chains(model_name)
+        self.chat_model = chains["chat_model"]
+        self.validation_chain = chains["validation_chain"]
+        self.agent_chain = chains["agent_chain"]
+        self.single_call_chain = chains["single_call_chain"]
+
+    def update_model_family(self, new_model):
+        """
+        Same as use_model, kept for the callers that switch model family
+
+        Parameters
+        ----------
+        new_model
+
+        Returns
+        -------
+
+        """
+        self.use_model(new_model)
+
+    def _set_up_validation_chain(self, debug=True, chat_model=None):
         """
 
         Parameters
         ----------
         debug
+        chat_model: by default self.chat_model
 
         Returns
         -------
 
         """
+        if chat_model is None:
+            chat_model = self.chat_model
         validation_agent = LLMChain(
-            llm=self.chat_model,
+            llm=chat_model,
             prompt=self.validation_prompt.chat_prompt,
             output_parser=self.validation_prompt.parser,
             output_key="validation_output",
@@ -103,26 +236,29 @@ class Agent(object):
 
         return overall_chain
 
-    def _set_up_agent_chain(self, debug=True):
+    def _set_up_agent_chain(self, debug=True, chat_model=None):
         """
 
         Parameters
         ----------
         debug
+        chat_model: by default self.chat_model
 
         Returns
         -------
 
         """
+        if chat_model is None:
+            chat_model = self.chat_model
         travel_agent = LLMChain(
-            llm=self.chat_model,
+            llm=chat_model,
             prompt=self.itinerary_prompt.chat_prompt,
             verbose=debug,
             output_key="agent_suggestion",
         )
 
         parser = LLMChain(
-            llm=self.chat_model,
+            llm=chat_model,
             prompt=self.mapping_prompt.chat_prompt,
             output_parser=self.mapping_prompt.parser,
             verbose=debug,
@@ -138,29 +274,269 @@ class Agent(object):
 
         return overall_chain
 
-    def suggest_travel(self, query):
+    def _set_up_single_call_chain(self, debug=True, chat_model=None):
+        """
+
+        Parameters
+        ----------
+        debug
+        chat_model: by default self.chat_model
+
+        Returns
+        -------
+        chain with the same inputs and outputs as the agent chain
+        """
+        if chat_model is None:
+            chat_model = self.chat_model
+        travel_agent = LLMChain(
+            llm=chat_model,
+            prompt=self.itinerary_mapping_prompt.chat_prompt,
+            output_parser=self.itinerary_mapping_prompt.parser,
+            verbose=debug,
+            output_key="itinerary_and_mapping",
+        )
+
+        splitter = TransformChain(
+            input_variables=["itinerary_and_mapping"],
+            output_variables=["agent_suggestion", "mapping_list"],
+            transform=self._split_itinerary_and_mapping,
+        )
+
+        overall_chain = SequentialChain(
+            chains=[travel_agent, splitter],
+            input_variables=["query", "format_instructions"],
+            output_variables=["agent_suggestion", "mapping_list"],
+            verbose=debug,
+        )
+
+        return overall_chain
+
+    @staticmethod
+    def _split_itinerary_and_mapping(inputs):
+        """
+
+        Parameters
+        ----------
+        inputs: dict with the TripWithItinerary written by the single call chain
+
+        Returns
+        -------
+        dict with the itinerary and the Trip
+        """
+        trip = inputs["itinerary_and_mapping"].dict()
+        itinerary = trip.pop("itinerary")
+        return {"agent_suggestion": itinerary, "mapping_list": Trip(**trip)}
+
+    def suggest_travel(self, query, on_place=None, single_call=None, model_name=None):
+        """
+
+        Parameters
+        ----------
+        query
+        on_place: optional function called with each place of the trip as soon
+            as the mapping chain has written it, e.g. to start geocoding it. In
+            speculative mode it may be called for trips that are then discarded
+        single_call: whether to write the itinerary and the list of places in a
+            single call, by default self.single_call
+        model_name: optional model to answer with, by default the one set with
+            use_model. Its chains are built on the first request that uses it
+
+        Returns
+        -------
+
+        """
+        chains = self.chains(model_name)
+        if self.speculative:
+            return self._suggest_travel_speculatively(
+                query, chains, on_place, single_call
+            )
+        return self._suggest_travel(query, chains, on_place, single_call)
+
+    def _cached_suggestion(self, query, chains, on_place=None):
+        """
+        The cached trip of a similar query, for a query that passed validation
+
+        Parameters
+        ----------
+        query
+        chains
+        on_place
+
+        Returns
+        -------
+        the itinerary and the list of places, or None
+        """
+        if self.similar_query_cache is None:
+            return None
+        cached, _ = self.similar_query_cache.get(
+            query, namespace=chains["chat_model"].model_name
+        )
+        if cached is None:
+            return None
+        list_of_places = copy.deepcopy(cached["mapping_list"])
+        if on_place is not None:
+            for place in [list_of_places["start"], list_of_places["end"]]:
+                on_place(place)
+            for place in list_of_places["waypoints"]:
+                on_place(place)
+        return cached["agent_suggestion"], list_of_places
+
+    def _cache_suggestion(self, query, chains, trip_suggestion, list_of_places):
+        if self.similar_query_cache is None:
+            return
+        self.similar_query_cache.set(
+            query,
+            {"agent_suggestion": trip_suggestion, "mapping_list": list_of_places},
+            namespace=chains["chat_model"].model_name,
+        )
+
+    def _suggest_travel(self, query, chains, on_place=None, single_call=None):
         """
+        Validate the query, then call the agent if it is valid
 
         Parameters
         ----------
         query
+        chains: output of chains, for the model to answer with
+        on_place
+        single_call
 
         Returns
         -------
 
         """
+        validation_result, is_valid = self._validate(query, chains)
+        if not is_valid:
+            return None, None, validation_result
+
+        cached = self._cached_suggestion(query, chains, on_place)
+        if cached is not None:
+            return cached + (validation_result,)
+
+        self.logger.info(
+            "User request is valid, calling agent (model is {})".format(
+                chains["chat_model"].model_name
+            )
+        )
+        trip_suggestion, list_of_places = self._get_suggestions(
+            query, chains, on_place, single_call=single_call
+        )
+        self._cache_suggestion(query, chains, trip_suggestion, list_of_places)
+        return trip_suggestion, list_of_places, validation_result
+
+    def _suggest_travel_speculatively(
+        self, query, chains, on_place=None, single_call=None
+    ):
+        """
+        Like suggest_travel, but the agent chain starts at the same time as the
+        validation chain. Its run is cancelled if the query turns out not to
+        be valid, or to be answered by the trip of a similar query
+
+        Parameters
+        ----------
+        query
+        chains
+        on_place
+        single_call
+
+        Returns
+        -------
+
+        """
+        self.logger.info(
+            "Calling agent (model is {}) while validating".format(
+                chains["chat_model"].model_name
+            )
+        )
+        t1 = time.time()
+        cancellation = CancellationHandler()
+        future = self._executor.submit(
+            self._get_suggestions, query, chains, on_place, [cancellation], single_call
+        )
+        with self._speculation_lock:
+            self._speculation_stats["runs"] += 1
+
+        validation_result, is_valid = self._validate(query, chains)
+        cached = self._cached_suggestion(query, chains, on_place) if is_valid else None
+        if not is_valid or cached is not None:
+            cancellation.cancel()
+            future.add_done_callback(lambda f: self._record_discarded_run(f, t1))
+            if cached is not None:
+                return cached + (validation_result,)
+            return None, None, validation_result
+
+        trip_suggestion, list_of_places = future.result()
+        self._cache_suggestion(query, chains, trip_suggestion, list_of_places)
+        return trip_suggestion, list_of_places, validation_result
+
+    def _record_discarded_run(self, future, start_time):
+        """
+        Count the time a discarded speculative run spent calling the agent
+
+        Parameters
+        ----------
+        future: of the run
+        start_time
+
+        Returns
+        -------
+
+        """
+        wasted_seconds = time.time() - start_time
+        with self._speculation_lock:
+            self._speculation_stats["discarded"] += 1
+            self._speculation_stats["wasted_seconds"] += wasted_seconds
+            if future.cancelled() or isinstance(
+                future.exception(), SpeculationCancelled
+            ):
+                self._speculation_stats["cancelled"] += 1
+        self.logger.info(
+            "Discarded agent run, {} seconds wasted".format(round(wasted_seconds, 2))
+        )
+
+    def speculation_stats(self):
+        """
+
+        Returns
+        -------
+        dict with the number of speculative agent runs, of those discarded
+        because the query was not valid or was answered from the similar query
+        cache and of those stopped before the end, and the time the discarded
+        ones ran for
+        """
+        with self._speculation_lock:
+            return dict(
+                self._speculation_stats,
+                wasted_seconds=round(self._speculation_stats["wasted_seconds"], 3),
+            )
+
+    def _validate(self, query, chains=None):
+        """
+
+        Parameters
+        ----------
+        query
+        chains: by default those of the model set with use_model
+
+        Returns
+        -------
+        output of the validation chain, and whether the query is valid
+        """
+        if chains is None:
+            chains = self.chains()
         self.logger.info("Validating query")
         t1 = time.time()
         self.logger.info(
             "Calling validation (model is {}) on user input".format(
-                self.chat_model.model_name
+                chains["chat_model"].model_name
             )
         )
-        validation_result = self.validation_chain(
+        validation_result = self._call_chain(
+            chains["validation_chain"],
             {
                 "query": query,
                 "format_instructions": self.validation_prompt.parser.get_format_instructions(),
-            }
+            },
         )
 
         validation_test = validation_result["validation_output"].dict()
@@ -171,30 +547,147 @@ class Agent(object):
             self.logger.warning("User request was not valid!")
             print("\n######\n Travel plan is not valid \n######\n")
             print(validation_test["updated_request"])
-            return None, None, validation_result
+            return validation_result, False
+
+        self.logger.info("Query is valid")
+        return validation_result, True
+
+    def _get_suggestions(
+        self, query, chains=None, on_place=None, callbacks=None, single_call=None
+    ):
+        """
+
+        Parameters
+        ----------
+        query
+        chains: by default those of the model set with use_model
+        on_place
+        callbacks: optional extra callback handlers of the agent chain
+        single_call: by default self.single_call
+
+        Returns
+        -------
+        the itinerary and the list of places
+        """
+        if chains is None:
+            chains = self.chains()
+        self.logger.info("Getting travel suggestions")
+        t1 = time.time()
 
+        if single_call is None:
+            single_call = self.single_call
+        if single_call:
+            chain, prompt = chains["single_call_chain"], self.itinerary_mapping_prompt
         else:
-            # plan is valid
-            self.logger.info("Query is valid")
-            self.logger.info("Getting travel suggestions")
-            t1 = time.time()
+            chain, prompt = chains["agent_chain"], self.mapping_prompt
 
+        callbacks = list(callbacks or [])
+        reported_places = set()
+        if on_place is not None:
+
+            def report_place(place):
+                if place not in reported_places:
+                    reported_places.add(place)
+                    on_place(place)
+
+            callbacks.append(TripStreamHandler(report_place))
+        agent_result = self._call_chain(
+            chain,
+            {
+                "query": query,
+                "format_instructions": prompt.parser.get_format_instructions(),
+            },
+            callbacks=callbacks or None,
+        )
+
+        trip_suggestion = agent_result["agent_suggestion"]
+        list_of_places = agent_result["mapping_list"].dict()
+        if on_place is not None:
+            # cached places were never streamed
+            for place in [list_of_places["start"], list_of_places["end"]]:
+                report_place(place)
+            for place in list_of_places["waypoints"]:
+                report_place(place)
+        t2 = time.time()
+        self.logger.info("Time to get suggestions: {}".format(round(t2 - t1, 2)))
+        if self.response_cache is not None:
             self.logger.info(
-                "User request is valid, calling agent (model is {})".format(
-                    self.chat_model.model_name
-                )
+                "Response cache stats : {}".format(self.response_cache.stats())
             )
 
-            agent_result = self.agent_chain(
-                {
-                    "query": query,
-                    "format_instructions": self.mapping_prompt.parser.get_format_instructions(),
-                }
-            )
+        return trip_suggestion, list_of_places
+
+    def _call_chain(self, chain, inputs, callbacks=None):
+        """
+        Run a sequential chain, stage by stage when responses are cached
+
+        Parameters
+        ----------
+        chain: SequentialChain
+        inputs
+        callbacks
+
+        Returns
+        -------
+        dict of the inputs and the outputs of every stage
+        """
+        if self.response_cache is None:
+            return chain(inputs, callbacks=callbacks)
+
+        outputs = dict(inputs)
+        for stage in chain.chains:
+            outputs.update(self._call_stage(stage, outputs, callbacks))
+        return outputs
+
+    def _call_stage(self, stage, inputs, callbacks=None):
+        """
+        Run a stage of a chain, or return its cached output. Only LLM stages
+        run at temperature 0 are cached, since their output hardly depends on
+        anything but their inputs
 
-            trip_suggestion = agent_result["agent_suggestion"]
-            list_of_places = agent_result["mapping_list"].dict()
-            t2 = time.time()
-            self.logger.info("Time to get suggestions: {}".format(round(t2 - t1, 2)))
+        Parameters
+        ----------
+        stage: chain
+        inputs: dict including the input variables of the stage
+        callbacks
 
-            return trip_suggestion, list_of_places, validation_result
+        Returns
+        -------
+        dict of the outputs of the stage
+        """
+        stage_inputs = {name: inputs[name] for name in stage.input_keys}
+        if (
+            not isinstance(stage, LLMChain)
+            or getattr(stage.llm, "temperature", None) != 0
+        ):
+            return stage(stage_inputs, return_only_outputs=True, callbacks=callbacks)
+
+        key = self.response_cache.make_key(
+            stage.output_key,
+            stage_inputs,
+            stage.llm.model_name,
+            stage.prompt,
+            stage.llm.temperature,
+        )
+        output_type = getattr(stage.output_parser, "pydantic_object", None)
+        output = self.response_cache.get_response(stage.output_key, key, output_type)
+        if output is None:
+            output = stage(stage_inputs, return_only_outputs=True, callbacks=callbacks)[
+                stage.output_key
+            ]
+            self.response_cache.set_response(key, output)
+        else:
+            self.logger.info("Cached response for {}".format(stage.output_key))
+        return {stage.output_key: output}
+
+    def response_cache_stats(self):
+        """
+
+        Returns
+        -------
+        hit and miss counters of the response cache, or None if responses are
+        not cached
+        """
+        if self.response_cache is None:
+            return None
+        return self.response_cache.stats()
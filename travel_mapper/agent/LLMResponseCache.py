@@ -0,0 +1,184 @@
+from travel_mapper.caching.DiskCache import DiskCache
+from travel_mapper.constants import (
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_MAX_ENTRIES,
+)
+from pydantic import BaseModel
+import threading
+import hashlib
+import json
+import re
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+class LLMResponseCache(DiskCache):
+    """
+    Disk backed cache of the outputs of the agent's LLM chains, one entry per
+    chain stage, keyed on the normalized inputs of the stage, the model, a hash
+    of the prompt template and the temperature
+    """
+
+    def __init__(
+        self,
+        path=LLM_CACHE_PATH,
+        ttl_seconds=LLM_CACHE_TTL_SECONDS,
+        max_entries=LLM_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(
+            path, ttl_seconds=ttl_seconds, max_entries=max_entries, table="responses"
+        )
+        # hits and misses of each stage in this process
+        self.stage_counts = {}
+
+    @staticmethod
+    def normalize_text(text):
+        """
+        Lower case the text and collapse whitespace, so that queries differing
+        only in those share an entry
+
+        Parameters
+        ----------
+        text
+
+        Returns
+        -------
+
+        """
+        return re.sub(r"\s+", " ", text.lower()).strip()
+
+    @staticmethod
+    def template_hash(prompt):
+        """
+
+        Parameters
+        ----------
+        prompt: ChatPromptTemplate or PromptTemplate of the stage
+
+        Returns
+        -------
+        hash of the template texts and partial variables of the prompt
+        """
+        messages = getattr(prompt, "messages", [prompt])
+        templates = [
+            getattr(getattr(message, "prompt", message), "template", repr(message))
+            for message in messages
+        ]
+        partials = [
+            getattr(getattr(message, "prompt", message), "partial_variables", {})
+            for message in messages
+        ]
+        return hashlib.sha256(
+            json.dumps([templates, partials], sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    @classmethod
+    def make_key(cls, stage, inputs, model_name, prompt, temperature):
+        """
+
+        Parameters
+        ----------
+        stage: name of the chain stage, e.g. its output key
+        inputs: dict of the input variables of the stage
+        model_name
+        prompt: prompt template of the stage
+        temperature
+
+        Returns
+        -------
+
+        """
+        normalized_inputs = {
+            name: cls.normalize_text(value) if isinstance(value, str) else value
+            for name, value in inputs.items()
+        }
+        key = json.dumps(
+            [
+                stage,
+                normalized_inputs,
+                model_name,
+                cls.template_hash(prompt),
+                temperature,
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get_response(self, stage, key, output_type=None):
+        """
+
+        Parameters
+        ----------
+        stage
+        key
+        output_type: pydantic model the output was parsed to, if any
+
+        Returns
+        -------
+        The cached output of the stage, or None on a miss
+        """
+        response = self.get(key)
+        with self._lock:
+            counts = self.stage_counts.setdefault(stage, {"hits": 0, "misses": 0})
+            counts["hits" if response is not None else "misses"] += 1
+        if response is None:
+            return None
+        if "fields" in response and output_type is not None:
+            return output_type(**response["fields"])
+        return response["text"]
+
+    def set_response(self, key, output):
+        """
+
+        Parameters
+        ----------
+        key
+        output: text or parsed pydantic model written by the stage
+
+        Returns
+        -------
+
+        """
+        if isinstance(output, BaseModel):
+            self.set(key, {"fields": output.dict()})
+        else:
+            self.set(key, {"text": output})
+
+    def stats(self):
+        """
+
+        Returns
+        -------
+        dict with hit and miss counters for this process, overall and per stage
+        """
+        stats = super().stats()
+        with self._lock:
+            stats["stages"] = {
+                stage: dict(
+                    counts,
+                    hit_rate=counts["hits"] / (counts["hits"] + counts["misses"]),
+                )
+                for stage, counts in self.stage_counts.items()
+            }
+        return stats
+
+
+def get_shared_llm_response_cache(path=LLM_CACHE_PATH):
+    """
+    Return the process wide LLMResponseCache for this path
+
+    Parameters
+    ----------
+    path
+
+    Returns
+    -------
+
+    """
+    with _shared_caches_lock:
+        if path not in _shared_caches:
+            _shared_caches[path] = LLMResponseCache(path=path)
+        return _shared_caches[path]
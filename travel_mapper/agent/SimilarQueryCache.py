@@ -0,0 +1,366 @@
+from travel_mapper.routing.SpeculativeGeocoder import SpeculativeGeocoder, PLACE
+from travel_mapper.constants import (
+    SIMILAR_QUERY_THRESHOLD,
+    SIMILAR_QUERY_MAX_ENTRIES,
+)
+from collections import Counter
+import numpy as np
+import threading
+import logging
+import zlib
+import re
+
+logging.basicConfig(level=logging.INFO)
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+# length of the character n-grams, taken within words so that inserting or
+# dropping a word leaves the n-grams of the others unchanged
+NGRAM_LENGTH = 3
+N_FEATURES = 2**15
+# "Berkeley to NYC", when the query doesn't say "from"
+BARE_ENDPOINTS_PATTERN = re.compile(
+    r"(?P<start>{0})\s+(?i:to)\s+(?P<end>{0})".format(PLACE)
+)
+# words that change what a query asks for but hardly change its n-grams
+MODE_WORDS = {
+    "drive": "driving",
+    "driving": "driving",
+    "car": "driving",
+    "road": "driving",
+    "roadtrip": "driving",
+    "train": "transit",
+    "bus": "transit",
+    "transit": "transit",
+    "rail": "transit",
+    "walk": "walking",
+    "walking": "walking",
+    "hike": "walking",
+    "hiking": "walking",
+    "foot": "walking",
+    "bike": "bicycling",
+    "biking": "bicycling",
+    "bicycle": "bicycling",
+    "cycling": "bicycling",
+    "fly": "flying",
+    "flight": "flying",
+    "flights": "flying",
+    "plane": "flying",
+}
+NEGATIONS = {
+    "no",
+    "not",
+    "avoid",
+    "avoiding",
+    "without",
+    "never",
+    "skip",
+    "except",
+    "don",
+    "doesn",
+    "won",
+}
+
+
+def normalize_query(query):
+    """
+    Lower case the query and collapse punctuation and whitespace
+
+    Parameters
+    ----------
+    query
+
+    Returns
+    -------
+
+    """
+    return re.sub(r"[\W_]+", " ", query.lower()).strip()
+
+
+def query_features(query, n_features=N_FEATURES):
+    """
+    Hashed bag of the words of the query, of its pairs of consecutive words
+    and of the character n-grams of its words
+
+    Parameters
+    ----------
+    query
+    n_features: number of hash buckets
+
+    Returns
+    -------
+    sorted array of the feature indices, and array of their sublinear term
+    frequencies
+    """
+    words = normalize_query(query).split()
+    # the word pairs tell "from A to B" from "from B to A"
+    grams = words + ["{} {}".format(a, b) for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = " {} ".format(word)
+        grams += [
+            padded[i : i + NGRAM_LENGTH] for i in range(len(padded) - NGRAM_LENGTH + 1)
+        ]
+    hashes = np.array([zlib.crc32(gram.encode()) for gram in grams], dtype=np.int64)
+    indices, counts = np.unique(hashes % n_features, return_counts=True)
+    return indices.astype(np.int32), (1 + np.log(counts)).astype(np.float32)
+
+
+def query_constraints(query):
+    """
+    What a cached trip must agree with to answer a query, beyond its wording
+
+    Parameters
+    ----------
+    query
+
+    Returns
+    -------
+    tuple of the numbers of the query (durations, group sizes...), its start
+    and end if it names them, and its modes of transport and negations
+    """
+    endpoints = SpeculativeGeocoder.extract_endpoints(query)
+    match = BARE_ENDPOINTS_PATTERN.search(query)
+    if match is not None:
+        for key, place in match.groupdict().items():
+            if endpoints[key] is None:
+                endpoints[key] = place
+    start, end = [
+        None if endpoints[key] is None else normalize_query(endpoints[key])
+        for key in ["start", "end"]
+    ]
+    words = normalize_query(query).split()
+    return (
+        tuple(sorted(re.findall(r"\d+", query))),
+        start,
+        end,
+        tuple(sorted({MODE_WORDS[w] for w in words if w in MODE_WORDS})),
+        tuple(sorted({w for w in words if w in NEGATIONS})),
+    )
+
+
+class SimilarQueryCache:
+    """
+    In memory cache of the trips suggested for earlier queries, which also
+    answers queries that are only worded differently, e.g. "2 week trip Berkeley
+    to NYC, national parks" and "2 weeks trip from Berkeley to NYC, national
+    parks".
+
+    Queries are compared by the cosine similarity of their TF-IDF weighted
+    hashed n-grams. Candidates are found with random hyperplane LSH: each of
+    n_tables tables buckets the queries on the signs of their projections on
+    n_bits random hyperplanes. The candidates sharing a bucket with the query in
+    the most tables are then compared exactly, and the best one is returned if
+    it is similar enough and has the same query_constraints: numbers, start and
+    end, modes of transport and negations, which n-grams barely tell apart.
+
+    The IDF weights follow the queries cached so far. The oldest entries are
+    evicted once max_entries are cached
+    """
+
+    def __init__(
+        self,
+        threshold=SIMILAR_QUERY_THRESHOLD,
+        max_entries=SIMILAR_QUERY_MAX_ENTRIES,
+        n_tables=24,
+        n_bits=16,
+        n_candidates=8,
+        n_features=N_FEATURES,
+        seed=0,
+    ):
+        """
+
+        Parameters
+        ----------
+        threshold: lowest cosine similarity of a query to a cached one for it
+            to be answered from the cache
+        max_entries
+        n_tables: more find more of the similar queries, at the cost of more
+            candidates
+        n_bits: bits of the bucket keys, more give fewer candidates
+        n_candidates: number of candidates compared exactly
+        n_features: number of hash buckets of the n-grams
+        seed: of the random hyperplanes
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.n_candidates = n_candidates
+        self.n_features = n_features
+
+        # random signs are as good as gaussian hyperplanes here, at a quarter of
+        # the memory
+        self.hyperplanes = np.random.default_rng(seed).choice(
+            np.array([-1, 1], dtype=np.int8), size=(n_features, n_tables * n_bits)
+        )
+        self._bit_values = 1 << np.arange(n_bits, dtype=np.int64)
+        self._document_frequency = np.zeros(n_features, dtype=np.int64)
+
+        # entries live in slots reused oldest first
+        self._entries = [None] * max_entries
+        self._tables = [{} for _ in range(n_tables)]
+        self._n_entries = 0
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self._n_entries
+
+    def _weights(self, indices, term_frequencies):
+        idf = 1 + np.log(
+            (1 + self._n_entries) / (1 + self._document_frequency[indices])
+        )
+        weights = term_frequencies * idf
+        return weights / np.linalg.norm(weights)
+
+    def _bucket_keys(self, indices, weights):
+        """
+
+        Returns
+        -------
+        list of the bucket key of the weighted features in each table
+        """
+        projection = weights @ self.hyperplanes[indices]
+        bits = projection.reshape(self.n_tables, self.n_bits) > 0
+        return (bits @ self._bit_values).tolist()
+
+    def _similarity(self, indices, weights, entry):
+        entry_weights = self._weights(entry["indices"], entry["term_frequencies"])
+        _, i, j = np.intersect1d(
+            indices, entry["indices"], assume_unique=True, return_indices=True
+        )
+        return float(weights[i] @ entry_weights[j])
+
+    def get(self, query, namespace=None):
+        """
+
+        Parameters
+        ----------
+        query
+        namespace: optional name the entries were cached under, e.g. the model
+            that wrote them. Entries of other namespaces are ignored
+
+        Returns
+        -------
+        the value cached for the most similar query, and its similarity, or
+        None and None
+        """
+        indices, term_frequencies = query_features(query, self.n_features)
+        constraints = query_constraints(query)
+        best_entry, best_similarity = None, None
+        with self._lock:
+            if self._n_entries and len(indices):
+                weights = self._weights(indices, term_frequencies)
+                collisions = Counter()
+                for table, key in zip(
+                    self._tables, self._bucket_keys(indices, weights)
+                ):
+                    collisions.update(table.get(key, ()))
+                for slot, _ in collisions.most_common(self.n_candidates):
+                    entry = self._entries[slot]
+                    if (
+                        entry["constraints"] != constraints
+                        or entry["namespace"] != namespace
+                    ):
+                        continue
+                    similarity = self._similarity(indices, weights, entry)
+                    if best_similarity is None or similarity > best_similarity:
+                        best_entry, best_similarity = entry, similarity
+
+            if best_entry is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None, None
+            self.hits += 1
+
+        self.logger.info(
+            "Query is similar ({:.2f}) to the cached {!r}".format(
+                best_similarity, best_entry["query"]
+            )
+        )
+        return best_entry["value"], best_similarity
+
+    def set(self, query, value, namespace=None):
+        """
+
+        Parameters
+        ----------
+        query
+        value
+        namespace
+
+        Returns
+        -------
+
+        """
+        indices, term_frequencies = query_features(query, self.n_features)
+        if not len(indices):
+            return
+        with self._lock:
+            slot = self._next_slot
+            if self._entries[slot] is not None:
+                self._evict(slot)
+            self._document_frequency[indices] += 1
+            self._n_entries += 1
+
+            keys = self._bucket_keys(indices, self._weights(indices, term_frequencies))
+            for table, key in zip(self._tables, keys):
+                table.setdefault(key, []).append(slot)
+            self._entries[slot] = {
+                "query": query,
+                "value": value,
+                "indices": indices,
+                "term_frequencies": term_frequencies,
+                "constraints": query_constraints(query),
+                "namespace": namespace,
+                "keys": keys,
+            }
+            self._next_slot = (slot + 1) % self.max_entries
+
+    def _evict(self, slot):
+        entry = self._entries[slot]
+        for table, key in zip(self._tables, entry["keys"]):
+            bucket = table[key]
+            bucket.remove(slot)
+            if not bucket:
+                del table[key]
+        self._document_frequency[entry["indices"]] -= 1
+        self._entries[slot] = None
+        self._n_entries -= 1
+
+    def stats(self):
+        """
+
+        Returns
+        -------
+        dict with hit and miss counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._n_entries,
+        }
+
+
+def get_shared_similar_query_cache(threshold=SIMILAR_QUERY_THRESHOLD):
+    """
+    Return the process wide SimilarQueryCache for this threshold
+
+    Parameters
+    ----------
+    threshold
+
+    Returns
+    -------
+
+    """
+    with _shared_caches_lock:
+        if threshold not in _shared_caches:
+            _shared_caches[threshold] = SimilarQueryCache(threshold=threshold)
+        return _shared_caches[threshold]
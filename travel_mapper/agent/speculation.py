@@ -0,0 +1,42 @@
+from langchain.callbacks.base import BaseCallbackHandler
+import threading
+
+
+class SpeculationCancelled(Exception):
+    """
+    Raised inside a speculative chain run once its result is no longer wanted
+    """
+
+
+class CancellationHandler(BaseCallbackHandler):
+    """
+    Callback handler stopping a chain run after cancel() is called, at the start
+    of its next chain or LLM call or at its next streamed token. A call already
+    running on a model that doesn't stream completes before the run stops
+    """
+
+    # exceptions of the other handlers are only logged
+    raise_error = True
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _check(self):
+        if self._cancelled.is_set():
+            raise SpeculationCancelled()
+
+    def on_chain_start(self, serialized, inputs, **kwargs):
+        self._check()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._check()
+
+    def on_llm_new_token(self, token, **kwargs):
+        self._check()
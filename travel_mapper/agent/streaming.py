@@ -0,0 +1,146 @@
+from langchain.callbacks.base import BaseCallbackHandler
+import json
+
+# fields of a Trip holding places, see templates.Trip
+PLACE_FIELDS = ("start", "end")
+PLACE_LIST_FIELDS = ("waypoints",)
+
+
+class TripStreamParser(object):
+    """
+    Incremental parser for the Trip json written by the mapping chain, which
+    reports every place as soon as its string is complete, rather than when the
+    whole json has arrived.
+
+    Only the structure of the json is tracked, anything before its opening
+    brace (e.g. a markdown fence) is skipped and the final output is still
+    parsed and validated by the chain's own output parser.
+    """
+
+    def __init__(self, on_place=None):
+        """
+
+        Parameters
+        ----------
+        on_place: optional function called with each place, in order of arrival
+        """
+        self.on_place = on_place
+        self.places = []
+        # one frame per open object or array: its type, the key it is the value
+        # of, and for objects whether a key is expected next
+        self._stack = []
+        self._started = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._string = []
+
+    @property
+    def done(self):
+        return self._done
+
+    def feed(self, text):
+        """
+
+        Parameters
+        ----------
+        text: next chunk of the output
+
+        Returns
+        -------
+        the places completed by this chunk
+        """
+        n_places = len(self.places)
+        for char in text:
+            if self._done:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._push("{")
+            elif self._in_string:
+                self._feed_string(char)
+            elif char == '"':
+                self._in_string = True
+                self._string = []
+            elif char in "{[":
+                self._push(char)
+            elif char in "}]":
+                self._stack.pop()
+                self._done = not self._stack
+            elif char == ":":
+                self._stack[-1]["expect_key"] = False
+            elif char == "," and self._stack[-1]["type"] == "{":
+                self._stack[-1]["expect_key"] = True
+        return self.places[n_places:]
+
+    def _push(self, container_type):
+        key = self._stack[-1]["key"] if self._stack else None
+        self._stack.append(
+            {"type": container_type, "key": key, "expect_key": container_type == "{"}
+        )
+
+    def _feed_string(self, char):
+        if self._escape:
+            self._escape = False
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            raw = "".join(self._string)
+            try:
+                value = json.loads('"{}"'.format(raw))
+            except ValueError:
+                value = raw
+            self._end_string(value)
+            return
+        self._string.append(char)
+
+    def _end_string(self, value):
+        frame = self._stack[-1]
+        if frame["type"] == "{" and frame["expect_key"]:
+            frame["key"] = value
+        elif frame["type"] == "{":
+            if len(self._stack) == 1 and frame["key"] in PLACE_FIELDS:
+                self._add_place(value)
+        elif len(self._stack) == 2 and frame["key"] in PLACE_LIST_FIELDS:
+            self._add_place(value)
+
+    def _add_place(self, place):
+        self.places.append(place)
+        if self.on_place is not None:
+            self.on_place(place)
+
+
+class TripStreamHandler(BaseCallbackHandler):
+    """
+    Callback handler feeding the tokens of every LLM call of a chain to its own
+    TripStreamParser. Calls whose output is not a Trip, such as the itinerary,
+    report no places.
+
+    Models that don't stream report their places when the call ends
+    """
+
+    def __init__(self, on_place):
+        """
+
+        Parameters
+        ----------
+        on_place: function called with each place
+        """
+        self.on_place = on_place
+        self.parsers = {}
+        self._streamed = set()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.parsers[run_id] = TripStreamParser(self.on_place)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        self._streamed.add(run_id)
+        self.parsers[run_id].feed(token)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if run_id not in self._streamed:
+            for generations in response.generations:
+                for generation in generations:
+                    self.parsers[run_id].feed(generation.text)
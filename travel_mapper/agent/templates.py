@@ -15,6 +15,14 @@ class Trip(BaseModel):
     transit: str = Field(description="mode of transportation")
 
 
+class TripWithItinerary(BaseModel):
+    itinerary: str = Field(description="detailed itinerary as a bulleted list")
+    start: str = Field(description="start location of trip")
+    end: str = Field(description="end location of trip")
+    waypoints: List[str] = Field(description="list of waypoints")
+    transit: str = Field(description="mode of transportation")
+
+
 class Validation(BaseModel):
     plan_is_valid: str = Field(
         description="This field is 'yes' if the plan is feasible, 'no' otherwise"
@@ -168,3 +176,52 @@ class MappingTemplate(object):
         self.chat_prompt = ChatPromptTemplate.from_messages(
             [self.system_message_prompt, self.human_message_prompt]
         )
+
+
+class ItineraryMappingTemplate(object):
+    def __init__(self):
+        self.system_template = """
+      You are a travel agent who helps users make exciting travel plans.
+
+      The user's request will be denoted by four hashtags. Convert the
+      user's request into a detailed itinerary describing the places
+      they should visit and the things they should do, and into the list
+      of those places.
+
+      Remember to take the user's preferences and timeframe into account,
+      and give them an itinerary that would be fun and realistic given their constraints.
+
+      Try to make sure the user doesn't need to travel for more than 8 hours on any one day during
+      their trip.
+
+      The itinerary should be a bulleted list with clear start and end locations and mention the type of transit for the trip.
+      If specific start and end locations are not given, choose ones that you think are suitable.
+
+      The list of places should always contain the start and end point of the trip, and may also include
+      waypoints. Try to include the specific address of each location. The number of waypoints cannot exceed 20.
+      It should also include a mode of transit, which can be only one of the following options:
+      "driving", "train", "bus" or "flight". If you can't infer the mode of transit, make a best guess
+      given the trip location.
+
+      {format_instructions}
+    """
+
+        self.human_template = """
+      ####{query}####
+    """
+
+        self.parser = PydanticOutputParser(pydantic_object=TripWithItinerary)
+
+        self.system_message_prompt = SystemMessagePromptTemplate.from_template(
+            self.system_template,
+            partial_variables={
+                "format_instructions": self.parser.get_format_instructions()
+            },
+        )
+        self.human_message_prompt = HumanMessagePromptTemplate.from_template(
+            self.human_template, input_variables=["query"]
+        )
+
+        self.chat_prompt = ChatPromptTemplate.from_messages(
+            [self.system_message_prompt, self.human_message_prompt]
+        )
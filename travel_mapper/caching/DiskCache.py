@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+
+class DiskCache:
+    """
+    Small key-value store backed by SQLite, so that it can be shared by every
+    object (and every process) pointing at the same file.
+
+    Values must be JSON serializable. Entries expire after ``ttl_seconds`` and
+    once the table holds more than ``max_entries`` rows, the least recently
+    used ones are evicted.
+    """
+
+    def __init__(self, path, ttl_seconds=None, max_entries=None, table="cache"):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+        cache_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(cache_dir):
+            self.logger.info("Generating cache dir {}".format(cache_dir))
+            os.makedirs(cache_dir, exist_ok=True)
+
+        with self._lock:
+            self._connect().execute(
+                "CREATE TABLE IF NOT EXISTS {} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)".format(self.table)
+            )
+            self._connect().execute(
+                "CREATE INDEX IF NOT EXISTS {0}_accessed ON {0} (accessed)".format(
+                    self.table
+                )
+            )
+
+    def _connect(self):
+        """
+        Return the connection for this process, opening a new one after a fork
+        since sqlite connections must not be shared across processes
+
+        Returns
+        -------
+        sqlite3.Connection
+        """
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get(self, key, default=None):
+        """
+
+        Parameters
+        ----------
+        key
+        default
+
+        Returns
+        -------
+        The cached value, or default on a miss or an expired entry
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT value, created FROM {} WHERE key = ?".format(self.table),
+                (key,),
+            ).fetchone()
+
+            if row is not None and self.ttl_seconds is not None:
+                if now - row[1] > self.ttl_seconds:
+                    connection.execute(
+                        "DELETE FROM {} WHERE key = ?".format(self.table), (key,)
+                    )
+                    self._deleted([key])
+                    row = None
+
+            if row is None:
+                self.misses += 1
+                return default
+
+            connection.execute(
+                "UPDATE {} SET accessed = ? WHERE key = ?".format(self.table),
+                (now, key),
+            )
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """
+
+        Parameters
+        ----------
+        key
+        value
+
+        Returns
+        -------
+
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO {} (key, value, created, accessed) "
+                "VALUES (?, ?, ?, ?)".format(self.table),
+                (key, json.dumps(value), now, now),
+            )
+            if self.max_entries is not None:
+                self._evict(connection)
+
+    def values(self):
+        """
+        All the values that have not expired, without counting as lookups
+
+        Returns
+        -------
+        list of values
+        """
+        return [value for _, value in self.items()]
+
+    def items(self):
+        """
+        All the keys and values that have not expired, without counting as
+        lookups
+
+        Returns
+        -------
+        list of (key, value)
+        """
+        with self._lock:
+            query = "SELECT key, value FROM {}".format(self.table)
+            params = ()
+            if self.ttl_seconds is not None:
+                query += " WHERE created >= ?"
+                params = (time.time() - self.ttl_seconds,)
+            rows = self._connect().execute(query, params).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def __contains__(self, key):
+        """
+        Whether the key has an entry that has not expired, without counting as
+        a lookup nor as an access
+
+        Parameters
+        ----------
+        key
+
+        Returns
+        -------
+
+        """
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT created FROM {} WHERE key = ?".format(self.table), (key,)
+                )
+                .fetchone()
+            )
+        if row is None:
+            return False
+        return self.ttl_seconds is None or time.time() - row[0] <= self.ttl_seconds
+
+    def _deleted(self, keys):
+        """
+        Called with the keys of the entries this object deleted, once they
+        expired, were evicted or were deleted. Subclasses keeping state derived
+        from the entries drop it here
+
+        Parameters
+        ----------
+        keys
+
+        Returns
+        -------
+
+        """
+
+    def _evict(self, connection):
+        """
+        Drop the least recently used rows beyond max_entries
+
+        Parameters
+        ----------
+        connection
+
+        Returns
+        -------
+
+        """
+        n_entries = connection.execute(
+            "SELECT COUNT(*) FROM {}".format(self.table)
+        ).fetchone()[0]
+        n_excess = n_entries - self.max_entries
+        if n_excess > 0:
+            keys = [
+                row[0]
+                for row in connection.execute(
+                    "SELECT key FROM {} ORDER BY accessed ASC LIMIT ?".format(
+                        self.table
+                    ),
+                    (n_excess,),
+                )
+            ]
+            connection.executemany(
+                "DELETE FROM {} WHERE key = ?".format(self.table),
+                [(key,) for key in keys],
+            )
+            self._deleted(keys)
+
+    def delete(self, key):
+        """
+
+        Parameters
+        ----------
+        key
+
+        Returns
+        -------
+
+        """
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM {} WHERE key = ?".format(self.table), (key,)
+            )
+            self._deleted([key])
+
+    def clear(self):
+        """
+
+        Returns
+        -------
+
+        """
+        with self._lock:
+            keys = [
+                row[0]
+                for row in self._connect().execute(
+                    "SELECT key FROM {}".format(self.table)
+                )
+            ]
+            self._connect().execute("DELETE FROM {}".format(self.table))
+            self._deleted(keys)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return (
+                self._connect()
+                .execute("SELECT COUNT(*) FROM {}".format(self.table))
+                .fetchone()[0]
+            )
+
+    def stats(self):
+        """
+
+        Returns
+        -------
+        dict with hit and miss counters for this process
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
@@ -5,3 +5,42 @@ MODEL_NAME = "gpt-3.5-turbo"
 # MODEL_NAME = "models/text-bison-001"  # palm
 TEMPERATURE = 0
 MAPS_DUMP_DIR = os.path.join(os.getcwd(), "maps")
+CACHE_DIR = os.path.join(os.getcwd(), "cache")
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIR, "geocode.sqlite")
+GEOCODE_CACHE_TTL_SECONDS = 30 * 24 * 3600
+GEOCODE_CACHE_MAX_ENTRIES = 50000
+GEOCODE_MAX_WORKERS = 8
+GOOGLE_MAPS_REQUESTS_PER_SECOND = 10
+DIRECTIONS_CACHE_PATH = os.path.join(CACHE_DIR, "directions.sqlite")
+DIRECTIONS_CACHE_TTL_SECONDS = 7 * 24 * 3600
+DIRECTIONS_CACHE_MAX_ENTRIES = 10000
+DEPARTURE_BUCKET_SECONDS = 3600
+MAP_SIMPLIFY_TOLERANCE_KM = 0.02
+MAP_MAX_ROUTE_POINTS = 5000
+GOOGLE_MAPS_BASE_URL = "https://maps.googleapis.com"
+GOOGLE_MAPS_MAX_CONNECTIONS = 20
+GOOGLE_MAPS_TIMEOUT_SECONDS = 30
+GOOGLE_MAPS_MAX_RETRIES = 3
+MAPS_STAND_IN_RECORDINGS_PATH = os.path.join(CACHE_DIR, "maps_recordings.jsonl")
+OPTIMIZE_WAYPOINT_ORDER = True
+QUOTA_BACKOFF_SECONDS = 0.5
+QUOTA_MAX_BACKOFF_SECONDS = 8
+GOOGLE_MAPS_POOL_HOSTS = 4
+GOOGLE_MAPS_KEEP_ALIVE = True
+ROUTE_SESSIONS_MAX_ENTRIES = 1000
+ROUTE_SESSION_TTL_SECONDS = DEPARTURE_BUCKET_SECONDS
+PLACE_SNAP_RADIUS_KM = 0.5
+PLACE_INDEX_GEOHASH_PRECISION = 6
+SPECULATIVE_GEOCODING = True
+SPECULATION_TIMEOUT_SECONDS = 5
+STREAM_MAPPING_LIST = True
+SPECULATIVE_AGENT = False
+AGENT_MAX_WORKERS = 8
+SINGLE_CALL_AGENT = False
+CACHE_LLM_RESPONSES = True
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_responses.sqlite")
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600
+LLM_CACHE_MAX_ENTRIES = 10000
+SIMILAR_QUERY_CACHE = False
+SIMILAR_QUERY_THRESHOLD = 0.9
+SIMILAR_QUERY_MAX_ENTRIES = 100000
@@ -1,7 +1,11 @@
 from datetime import datetime
 import folium
 from branca.element import Figure
-from travel_mapper.constants import MAPS_DUMP_DIR
+from travel_mapper.constants import (
+    MAPS_DUMP_DIR,
+    MAP_SIMPLIFY_TOLERANCE_KM,
+    MAP_MAX_ROUTE_POINTS,
+)
 import logging
 import os
 
@@ -9,9 +13,18 @@ logging.basicConfig(level=logging.INFO)
 
 
 class RouteMapper:
-    def __init__(self, h=500, w=1000):
+    def __init__(
+        self,
+        h=500,
+        w=1000,
+        simplify_tolerance_km=MAP_SIMPLIFY_TOLERANCE_KM,
+        max_route_points=MAP_MAX_ROUTE_POINTS,
+    ):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
+        # the route lines are simplified before they are inlined into the map html
+        self.simplify_tolerance_km = simplify_tolerance_km
+        self.max_route_points = max_route_points
         self.figure = Figure(height=h, width=w)
         self.map_name = "route_map.html"
         self.save_map = True
@@ -47,60 +60,51 @@ class RouteMapper:
             list_of_places["end"].split(",")[0].replace(" ", "_"),
         )
 
-    def generate_and_display(self, directions_list, route_dict):
+    def generate_and_display(self, route, sampled_route):
         """
 
         Parameters
         ----------
-        directions_list
-        route_dict
+        route
+        sampled_route
 
         Returns
         -------
 
         """
-        map = self.generate_route_map(self, directions_list, route_dict)
+        map = self.generate_route_map(self, route, sampled_route)
         self.figure.add_child(map)
 
-    def generate_route_map(self, directions_list, route_dict):
+    def generate_route_map(self, route, sampled_route):
         """
 
         Parameters
         ----------
-        directions_list
-        route_dict
+        route: Route, used for the stop markers
+        sampled_route: Route, used for the lines
 
         Returns
         -------
 
         """
-        map_start_loc_lat = directions_list[0]["legs"][0]["start_location"]["lat"]
-        map_start_loc_lon = directions_list[0]["legs"][0]["start_location"]["lng"]
-        map_start_loc = [map_start_loc_lat, map_start_loc_lon]
-
-        marker_points = []
-
-        # extract the location points from the previous directions function
+        if route:
+            map_start_loc = route[0].start.location
+            zoom_start = 10
+        else:
+            # e.g. a session route whose stops could not be routed
+            self.logger.warning("Generating a map without a route")
+            map_start_loc = [0, 0]
+            zoom_start = 3
+
+        # extract the location points from the route
         self.logger.info("Generating marker_points for map")
-        for segment in directions_list:
-            for leg in segment["legs"]:
-                leg_start_loc = leg["start_location"]
-                marker_points.append(
-                    ([leg_start_loc["lat"], leg_start_loc["lng"]], leg["start_address"])
-                )
-
-        last_stop = directions_list[-1]["legs"][-1]
-        last_stop_coords = last_stop["end_location"]
-        marker_points.append(
-            (
-                [last_stop_coords["lat"], last_stop_coords["lng"]],
-                last_stop["end_address"],
-            )
-        )
+        marker_points = [(stop.location, stop.address) for stop in route.stops]
 
         self.logger.info("Setting up the map")
 
-        map = folium.Map(location=map_start_loc, tiles="OpenStreetMap", zoom_start=10)
+        map = folium.Map(
+            location=map_start_loc, tiles="OpenStreetMap", zoom_start=zoom_start
+        )
 
         # Add waypoint markers to the map
         for location, address in marker_points:
@@ -115,13 +119,18 @@ class RouteMapper:
 
         self.logger.info("Adding route segments to the map")
 
-        for leg_id, route_points in route_dict.items():
-            leg_distance = route_points["distance"]
-            leg_duration = route_points["duration"]
+        sampled_route = sampled_route.simplify(
+            tolerance_km=self.simplify_tolerance_km,
+            max_points=self.max_route_points,
+        )
+
+        for leg_id, leg in enumerate(sampled_route):
+            leg_distance = leg.distance_text
+            leg_duration = leg.duration_text
 
             f_group = folium.FeatureGroup("Leg {}".format(leg_id))
             folium.vector_layers.PolyLine(
-                route_points["route"],
+                leg.path.tolist(),
                 popup="<b>Route segment {}</b>".format(leg_id),
                 tooltip="Distance: {}, Duration: {}".format(leg_distance, leg_duration),
                 color="blue",
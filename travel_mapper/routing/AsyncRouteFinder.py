@@ -0,0 +1,619 @@
+from travel_mapper.routing.RouteFinder import RouteFinder
+from travel_mapper.routing.models import Route
+from travel_mapper.constants import (
+    GOOGLE_MAPS_MAX_CONNECTIONS,
+    GOOGLE_MAPS_TIMEOUT_SECONDS,
+)
+from googlemaps.convert import time as convert_time
+import googlemaps
+from datetime import datetime
+import asyncio
+import aiohttp
+import time
+
+
+class AsyncRouteFinder(RouteFinder):
+    """
+    RouteFinder whose Google Maps requests are made with aiohttp, so that one
+    event loop can route many trips concurrently instead of holding a thread per
+    trip. The methods that make requests are coroutines with the same arguments
+    as their RouteFinder counterparts, everything else is shared. The caches are
+    read and written in the default executor, as SQLite calls would block the
+    event loop.
+
+    Requests go through a pooled session that is opened on first use, call
+    close() (or use the finder as an async context manager) when done with it.
+    """
+
+    def __init__(
+        self,
+        google_maps_api_key,
+        max_connections=GOOGLE_MAPS_MAX_CONNECTIONS,
+        timeout_seconds=GOOGLE_MAPS_TIMEOUT_SECONDS,
+        **kwargs
+    ):
+        super().__init__(google_maps_api_key, **kwargs)
+        self.google_maps_api_key = google_maps_api_key
+        self.max_connections = max_connections
+        self.timeout_seconds = timeout_seconds
+        self._session = None
+        self._session_loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self):
+        """
+        Return the session of the running event loop, opening one if needed
+
+        Returns
+        -------
+        aiohttp.ClientSession
+        """
+        loop = asyncio.get_running_loop()
+        if (
+            self._session is None
+            or self._session.closed
+            or self._session_loop is not loop
+        ):
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    @staticmethod
+    async def _in_executor(function, *args):
+        """
+        Run a blocking call, e.g. to the SQLite caches, in the default executor of
+        the running event loop
+
+        Parameters
+        ----------
+        function
+        args
+
+        Returns
+        -------
+        the result of the call
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def _request(self, endpoint, params):
+        """
+        GET to a Maps API endpoint, queued on the quota scheduler which retries
+        it when refused
+
+        Parameters
+        ----------
+        endpoint: "geocode" or "directions"
+        params
+
+        Returns
+        -------
+        the decoded response body
+        """
+        return await self.scheduler.call_async(
+            endpoint,
+            self._get,
+            "{}/maps/api/{}/json".format(self.base_url, endpoint),
+            dict(params, key=self.google_maps_api_key),
+            priority=self.priority,
+        )
+
+    async def _get(self, url, params):
+        """
+        Single GET, handling statuses like googlemaps.Client: an error status
+        raises googlemaps.exceptions.HTTPError or googlemaps.exceptions.ApiError
+
+        Parameters
+        ----------
+        url
+        params
+
+        Returns
+        -------
+        the decoded response body
+        """
+        try:
+            async with self._get_session().get(url, params=params) as response:
+                if response.status != 200:
+                    raise googlemaps.exceptions.HTTPError(response.status)
+                body = await response.json()
+        except asyncio.TimeoutError:
+            raise googlemaps.exceptions.Timeout()
+        except aiohttp.ClientError as e:
+            raise googlemaps.exceptions.TransportError(e)
+
+        api_status = body["status"]
+        if api_status == "OK" or api_status == "ZERO_RESULTS":
+            return body
+        raise googlemaps.exceptions.ApiError(api_status, body.get("error_message"))
+
+    async def generate_route(
+        self,
+        list_of_places,
+        itinerary,
+        include_map=True,
+        session_id=None,
+        geocode_queue=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        list_of_places
+        itinerary
+        include_map
+        session_id
+        geocode_queue
+
+        Returns
+        -------
+
+        """
+        self.log_itinerary(itinerary)
+
+        t1 = time.time()
+        route, sampled_route, mapping_dict = await self.build_route_segments(
+            list_of_places, session_id=session_id, geocode_queue=geocode_queue
+        )
+        t2 = time.time()
+        # the stats count the rows of the caches
+        await self._in_executor(self.log_route_stats, t2 - t1)
+
+        if include_map:
+            self.generate_map(list_of_places, route, sampled_route)
+
+        return route, sampled_route, mapping_dict
+
+    async def build_route_segments(
+        self,
+        list_of_places,
+        verbose=True,
+        distance_per_point_in_km=0.25,
+        session_id=None,
+        transit_type=None,
+        geocode_queue=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        list_of_places
+        verbose
+        distance_per_point_in_km
+        session_id
+        transit_type
+        geocode_queue: optional GeocodeQueue already resolving the places of the
+            trip, waited on in the default executor
+
+        Returns
+        -------
+        the Route, the Route resampled every distance_per_point_in_km and the
+        dict of geocoded Places
+        """
+        if transit_type is None:
+            transit_type = self.transit_mode(list_of_places.get("transit"))
+        geocodes = None
+        if geocode_queue is not None:
+            # the places found are in the geocode cache by now, which is where
+            # sessions look them up
+            geocodes = await self._in_executor(
+                geocode_queue.geocodes,
+                [list_of_places["start"], list_of_places["end"]]
+                + list_of_places["waypoints"],
+            )
+        if session_id is not None:
+            return await self.build_route_for_session(
+                session_id,
+                list_of_places,
+                verbose,
+                distance_per_point_in_km,
+                transit_type,
+            )
+
+        self.dropped_waypoints = []
+        number_of_stops = len(list_of_places["waypoints"])
+
+        if number_of_stops > self.MAX_WAYPOINTS_API_CALL:
+            self.logger.info(
+                "Number of stops ({}) > MAX_WAYPOINTS_PER_CALL ({}), going to make several calls to Google Maps API".format(
+                    number_of_stops, self.MAX_WAYPOINTS_API_CALL
+                )
+            )
+            all_places = [list_of_places["start"], list_of_places["end"]]
+            all_places += list_of_places["waypoints"]
+            if geocodes is None:
+                geocodes = await self.geocode_places(all_places)
+            segment_mapping_dicts = self.plan_segments(list_of_places, geocodes)
+
+            async def route_segment(segment_id):
+                if verbose:
+                    self.logger.info("# " * 10)
+                    self.logger.info(
+                        "Getting directions for segment {}".format(segment_id)
+                    )
+                route = await self.build_directions_and_route(
+                    segment_mapping_dicts[segment_id],
+                    transit_type=transit_type,
+                    verbose=verbose,
+                )
+                sampled_route = self.sample_route_with_legs(
+                    route, distance_per_point_in_km
+                )
+                return route, sampled_route
+
+            segment_results = await asyncio.gather(
+                *(route_segment(i) for i in range(len(segment_mapping_dicts)))
+            )
+
+            route = Route.concatenate(route for route, _ in segment_results)
+            mapping_dict, sampled_route = self.assemble_final_route_from_segments(
+                segment_mapping_dicts,
+                [sampled_route for _, sampled_route in segment_results],
+            )
+
+        else:
+            self.logger.info("Assembling mapping dictionary")
+            mapping_dict = await self.build_mapping_dict(
+                list_of_places["start"],
+                list_of_places["end"],
+                waypoints=list_of_places["waypoints"],
+                geocodes=geocodes,
+            )
+
+            self.logger.info("Calling Google Maps API to get directions")
+            route = await self.build_directions_and_route(
+                mapping_dict, transit_type=transit_type, verbose=verbose
+            )
+            sampled_route = self.sample_route_with_legs(route, distance_per_point_in_km)
+
+        return route, sampled_route, mapping_dict
+
+    async def build_route_for_session(
+        self,
+        session_id,
+        list_of_places,
+        verbose=True,
+        distance_per_point_in_km=0.25,
+        transit_type="driving",
+    ):
+        """
+
+        Parameters
+        ----------
+        session_id
+        list_of_places
+        verbose
+        distance_per_point_in_km
+        transit_type
+
+        Returns
+        -------
+        the Route, the Route resampled every distance_per_point_in_km and the
+        dict of geocoded Places
+        """
+        self.dropped_waypoints = []
+        session_key = (session_id, transit_type)
+        session = self.route_sessions.get(session_key)
+        geocodes = self.session_geocodes(session, list_of_places)
+        geocodes.update(
+            await self.geocode_places([p for p in geocodes if geocodes[p] is None])
+        )
+        stops = self.plan_session_stops(session, list_of_places, geocodes)
+        runs = self.missing_runs(
+            stops,
+            session["legs"] if session else {},
+            self.max_run_points(transit_type),
+        )
+        route_legs, dropped = await self.bisect_directions(
+            self.session_points(stops, geocodes),
+            transit_type=transit_type,
+            runs=runs,
+            legs=self.index_legs(stops, session["legs"] if session else {}),
+        )
+        return self.finish_session_route(
+            session_key,
+            session,
+            list_of_places,
+            stops,
+            geocodes,
+            route_legs,
+            dropped,
+            verbose,
+            distance_per_point_in_km,
+        )
+
+    async def compare_modes(
+        self,
+        list_of_places,
+        modes=None,
+        verbose=True,
+        distance_per_point_in_km=0.25,
+        session_id=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        list_of_places
+        modes
+        verbose
+        distance_per_point_in_km
+        session_id
+
+        Returns
+        -------
+        the Route, the resampled Route and the dict of geocoded Places in the
+        best mode, and the summaries of every mode, best first
+        """
+        modes = self.modes_to_compare(list_of_places, modes)
+        await self.geocode_places(
+            [list_of_places["start"], list_of_places["end"]]
+            + list_of_places["waypoints"]
+        )
+
+        async def route_mode(mode):
+            # each mode runs in its own task, with its own dropped waypoints
+            result = await self.build_route_segments(
+                list_of_places,
+                verbose=verbose,
+                distance_per_point_in_km=distance_per_point_in_km,
+                session_id=session_id,
+                transit_type=mode,
+            )
+            return result, self.dropped_waypoints
+
+        results = await asyncio.gather(*(route_mode(mode) for mode in modes))
+        return self.pick_best_mode(dict(zip(modes, results)))
+
+    async def convert_to_coords(self, input_address):
+        """
+
+        Parameters
+        ----------
+        input_address
+
+        Returns
+        -------
+        the Place of the best geocode result, or None if the address was not found
+        """
+        place = await self._in_executor(self.geocode_cache.get_place, input_address)
+        if place is None:
+            body = await self._request("geocode", {"address": input_address})
+            # snapping may load the place index from the cache
+            place = await self._in_executor(
+                self.parse_geocode, input_address, body.get("results", [])
+            )
+
+        return place
+
+    async def geocode_places(self, places, concurrent=None):
+        """
+
+        Parameters
+        ----------
+        places
+        concurrent
+
+        Returns
+        -------
+        dict of place to Place, or None for the places that were not found
+        """
+        if concurrent is None:
+            concurrent = self.max_workers > 1
+
+        unique_places = list(dict.fromkeys(places))
+        if concurrent:
+            geocode_results = await asyncio.gather(
+                *(self.convert_to_coords(p) for p in unique_places)
+            )
+        else:
+            geocode_results = [await self.convert_to_coords(p) for p in unique_places]
+
+        return dict(zip(unique_places, geocode_results))
+
+    async def build_mapping_dict(
+        self, start, end, waypoints, concurrent=None, geocodes=None
+    ):
+        """
+
+        Parameters
+        ----------
+        start
+        end
+        waypoints
+        concurrent
+        geocodes: optional dict of place to Place, for places that have already
+            been looked up
+
+        Returns
+        -------
+        dict of Places, with keys start, end and waypoint_{i}
+        """
+        waypoints = waypoints or []
+        if geocodes is None:
+            geocodes = await self.geocode_places(
+                [start, end] + waypoints, concurrent=concurrent
+            )
+        return self.mapping_dict_from_geocodes(start, end, waypoints, geocodes)
+
+    async def build_directions_and_route(
+        self, mapping_dict, start_time=None, transit_type=None, verbose=True
+    ):
+        """
+
+        Parameters
+        ----------
+        mapping_dict
+        start_time
+        transit_type
+        verbose
+
+        Returns
+        -------
+        Route through the places of the mapping dict
+        """
+        if not start_time:
+            start_time = datetime.now()
+
+        if not transit_type:
+            transit_type = "driving"
+
+        start, end, waypoints = self.directions_points(mapping_dict)
+
+        if waypoints and transit_type in self.MODES_WITHOUT_WAYPOINTS:
+            route = Route()
+            requested = False
+        else:
+            requested = True
+            route = await self.request_directions(
+                start,
+                end,
+                waypoints=waypoints,
+                transit_type=transit_type,
+                optimize_waypoints=True,
+                start_time=start_time,
+            )
+            if not route:
+                self.log_bisection_start(waypoints)
+
+        if not route:
+            legs, dropped = await self.bisect_directions(
+                [start] + waypoints + [end],
+                transit_type=transit_type,
+                start_time=start_time,
+                failed=requested,
+            )
+            self.record_dropped_waypoints(mapping_dict, dropped)
+            route = Route(legs)
+
+        if verbose:
+            self.print_route(route)
+
+        return route
+
+    async def request_directions(
+        self,
+        origin,
+        destination,
+        waypoints=None,
+        transit_type="driving",
+        optimize_waypoints=False,
+        start_time=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        origin
+        destination
+        waypoints
+        transit_type
+        optimize_waypoints
+        start_time
+
+        Returns
+        -------
+        Route, empty if no directions were found
+        """
+        cache_key, params = self.directions_params(
+            origin, destination, waypoints, transit_type, optimize_waypoints, start_time
+        )
+        route = await self._in_executor(self.directions_cache.get_route, cache_key)
+        if route is not None:
+            return route
+
+        body = await self._request("directions", self.directions_query(params))
+        return await self._in_executor(
+            self.parse_directions, cache_key, body.get("routes", [])
+        )
+
+    @staticmethod
+    def directions_query(params):
+        """
+        Encode the keyword arguments of googlemaps.Client.directions as the query
+        parameters of the directions endpoint, the same way the client does
+
+        Parameters
+        ----------
+        params
+
+        Returns
+        -------
+
+        """
+        query = {
+            "origin": params["origin"],
+            "destination": params["destination"],
+            "mode": params["mode"],
+            "units": params["units"],
+            "departure_time": convert_time(params["departure_time"]),
+        }
+        if params["waypoints"]:
+            waypoints = "|".join(params["waypoints"])
+            if params["optimize_waypoints"]:
+                waypoints = "optimize:true|" + waypoints
+            query["waypoints"] = waypoints
+        if params["traffic_model"]:
+            query["traffic_model"] = params["traffic_model"]
+        return query
+
+    async def bisect_directions(
+        self,
+        points,
+        transit_type="driving",
+        start_time=None,
+        failed=False,
+        runs=None,
+        legs=None,
+    ):
+        """
+        Find directions through points when a single call with all of them fails,
+        see RouteFinder.bisection_steps
+
+        Parameters
+        ----------
+        points: place strings, from start to end
+        transit_type
+        start_time
+        failed
+        runs
+        legs
+
+        Returns
+        -------
+        list of Legs through the points that were kept, in order, and the sorted
+        indices of the points that were dropped
+        """
+
+        def fetch(run):
+            return self.request_directions(
+                points[run[0]],
+                points[run[-1]],
+                waypoints=[points[i] for i in run[1:-1]],
+                transit_type=transit_type,
+                start_time=start_time,
+            )
+
+        steps = self.bisection_steps(
+            points, self.max_run_points(transit_type), failed, runs, legs
+        )
+        try:
+            pending = next(steps)
+            while True:
+                results = await asyncio.gather(*(fetch(run) for run in pending))
+                pending = steps.send(list(results))
+        except StopIteration as stop:
+            return stop.value
@@ -0,0 +1,121 @@
+from travel_mapper.caching.DiskCache import DiskCache
+from travel_mapper.routing.models import Route
+from travel_mapper.constants import (
+    DIRECTIONS_CACHE_PATH,
+    DIRECTIONS_CACHE_TTL_SECONDS,
+    DIRECTIONS_CACHE_MAX_ENTRIES,
+)
+from datetime import datetime
+import threading
+import json
+import math
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+class DirectionsCache(DiskCache):
+    """
+    Disk backed cache of parsed directions Routes, keyed on the ordered places,
+    the transit mode, the optimize flag and the departure time bucket
+    """
+
+    def __init__(
+        self,
+        path=DIRECTIONS_CACHE_PATH,
+        ttl_seconds=DIRECTIONS_CACHE_TTL_SECONDS,
+        max_entries=DIRECTIONS_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(
+            path, ttl_seconds=ttl_seconds, max_entries=max_entries, table="routes"
+        )
+
+    @staticmethod
+    def departure_bucket(start_time, bucket_seconds):
+        """
+        Round a departure time up to the next bucket boundary. Rounding up keeps
+        the departure in the future, which the directions API requires
+
+        Parameters
+        ----------
+        start_time
+        bucket_seconds
+
+        Returns
+        -------
+        datetime
+        """
+        bucket = math.ceil(start_time.timestamp() / bucket_seconds) * bucket_seconds
+        return datetime.fromtimestamp(bucket)
+
+    @staticmethod
+    def make_key(places, transit_type, optimize_waypoints, departure_time):
+        """
+
+        Parameters
+        ----------
+        places: origin, waypoints and destination in order, ideally as place_ids
+        transit_type
+        optimize_waypoints
+        departure_time: bucketed departure time
+
+        Returns
+        -------
+
+        """
+        return json.dumps(
+            [
+                list(places),
+                transit_type,
+                bool(optimize_waypoints),
+                int(departure_time.timestamp()),
+            ]
+        )
+
+    def get_route(self, key):
+        """
+
+        Parameters
+        ----------
+        key
+
+        Returns
+        -------
+        The cached Route, or None on a miss
+        """
+        route_dict = self.get(key)
+        if route_dict is None:
+            return None
+        return Route.from_dict(route_dict)
+
+    def set_route(self, key, route):
+        """
+
+        Parameters
+        ----------
+        key
+        route
+
+        Returns
+        -------
+
+        """
+        self.set(key, route.to_dict())
+
+
+def get_shared_directions_cache(path=DIRECTIONS_CACHE_PATH):
+    """
+    Return the process wide DirectionsCache for this path
+
+    Parameters
+    ----------
+    path
+
+    Returns
+    -------
+
+    """
+    with _shared_caches_lock:
+        if path not in _shared_caches:
+            _shared_caches[path] = DirectionsCache(path=path)
+        return _shared_caches[path]
@@ -0,0 +1,183 @@
+from travel_mapper.caching.DiskCache import DiskCache
+from travel_mapper.routing.models import Place
+from travel_mapper.routing.PlaceIndex import PlaceIndex
+from travel_mapper.constants import (
+    GEOCODE_CACHE_PATH,
+    GEOCODE_CACHE_TTL_SECONDS,
+    GEOCODE_CACHE_MAX_ENTRIES,
+)
+import threading
+import re
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+class GeocodeCache(DiskCache):
+    """
+    Disk backed cache of geocoded Places, keyed on the normalized address text
+    """
+
+    def __init__(
+        self,
+        path=GEOCODE_CACHE_PATH,
+        ttl_seconds=GEOCODE_CACHE_TTL_SECONDS,
+        max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(
+            path, ttl_seconds=ttl_seconds, max_entries=max_entries, table="places"
+        )
+        # spatial index of the cached places, built on first use, and the keys
+        # of the entries holding each indexed place_id, so that a place leaves
+        # the index with the last of its entries
+        self._place_index = None
+        self._place_keys = {}
+        self._key_place_ids = {}
+        self._place_index_lock = threading.Lock()
+
+    @staticmethod
+    def normalize_address(address):
+        """
+        Lower case the address and collapse whitespace and punctuation, so that
+        "Berkeley, CA" and "berkeley CA " share an entry
+
+        Parameters
+        ----------
+        address
+
+        Returns
+        -------
+
+        """
+        address = re.sub(r"[\s,;.]+", " ", address.lower())
+        return address.strip()
+
+    def get_place(self, address):
+        """
+
+        Parameters
+        ----------
+        address
+
+        Returns
+        -------
+        The cached Place, or None on a miss
+        """
+        place_dict = self.get(self.normalize_address(address))
+        if place_dict is None:
+            return None
+        return Place.from_dict(place_dict)
+
+    def set_place(self, address, place):
+        """
+
+        Parameters
+        ----------
+        address
+        place
+
+        Returns
+        -------
+
+        """
+        key = self.normalize_address(address)
+        self.set(key, place.to_dict())
+        with self._place_index_lock:
+            if self._place_index is not None:
+                self._index_place(key, place)
+
+    @property
+    def place_index(self):
+        """
+        PlaceIndex of every cached place, loaded from the cache the first time
+        and then kept up to date with the places set through this object and
+        the entries it expires or evicts
+
+        Returns
+        -------
+        PlaceIndex
+        """
+        with self._place_index_lock:
+            if self._place_index is not None:
+                return self._place_index
+        # read outside the lock of the index, which _deleted takes while the
+        # cache holds its own
+        items = self.items()
+        with self._place_index_lock:
+            if self._place_index is None:
+                self._place_index = PlaceIndex()
+                for key, place_dict in items:
+                    self._index_place(key, Place.from_dict(place_dict))
+            return self._place_index
+
+    def _index_place(self, key, place):
+        self._unindex_key(key)
+        self._place_keys.setdefault(place.place_id, set()).add(key)
+        self._key_place_ids[key] = place.place_id
+        self._place_index.add(place)
+
+    def _unindex_key(self, key):
+        place_id = self._key_place_ids.pop(key, None)
+        if place_id is None:
+            return
+        keys = self._place_keys[place_id]
+        keys.discard(key)
+        if not keys:
+            del self._place_keys[place_id]
+            self._place_index.remove(place_id)
+
+    def _deleted(self, keys):
+        with self._place_index_lock:
+            if self._place_index is not None:
+                for key in keys:
+                    self._unindex_key(key)
+
+    def nearest_place(self, place, radius_km):
+        """
+
+        Parameters
+        ----------
+        place
+        radius_km
+
+        Returns
+        -------
+        the cached Place closest to place within radius_km, or None
+        """
+        while True:
+            nearest, _ = self.place_index.nearest(place.lat, place.lng, radius_km)
+            if nearest is None:
+                return None
+            # entries also expire without being looked up, or are evicted by
+            # other processes sharing the file
+            with self._place_index_lock:
+                keys = list(self._place_keys.get(nearest.place_id, ()))
+            stale_keys = [key for key in keys if key not in self]
+            if len(stale_keys) < len(keys):
+                return nearest
+            with self._place_index_lock:
+                for key in stale_keys:
+                    self._unindex_key(key)
+                if nearest.place_id in self._place_keys:
+                    # set again in the meantime
+                    return nearest
+                self._place_index.remove(nearest.place_id)
+
+
+def get_shared_geocode_cache(path=GEOCODE_CACHE_PATH):
+    """
+    Return the process wide GeocodeCache for this path, so that every RouteFinder
+    shares the same counters and connection
+
+    Parameters
+    ----------
+    path
+
+    Returns
+    -------
+
+    """
+    with _shared_caches_lock:
+        if path not in _shared_caches:
+            _shared_caches[path] = GeocodeCache(path=path)
+        return _shared_caches[path]
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+class GeocodeQueue:
+    """
+    Places geocoded in the background as soon as they are known, e.g. while the
+    agent is still writing the trip, so that by the time the route is built
+    most of them are already resolved. See RouteFinder.build_route_segments
+    """
+
+    def __init__(self, route_finder, max_workers=None):
+        """
+
+        Parameters
+        ----------
+        route_finder: RouteFinder geocoding the places, through its cache and
+            quota scheduler
+        max_workers: by default those of the route finder
+        """
+        self.route_finder = route_finder
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or route_finder.max_workers
+        )
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._futures)
+
+    def put(self, place):
+        """
+        Start geocoding a place, unless it was already queued
+
+        Parameters
+        ----------
+        place
+
+        Returns
+        -------
+        the future of its Place
+        """
+        with self._lock:
+            if place not in self._futures:
+                self._futures[place] = self.executor.submit(
+                    self.route_finder.convert_to_coords, place
+                )
+            return self._futures[place]
+
+    def geocodes(self, places):
+        """
+        Wait for the places, queuing those that were not queued yet
+
+        Parameters
+        ----------
+        places
+
+        Returns
+        -------
+        dict of place to Place, or None for the places that were not found
+        """
+        futures = {place: self.put(place) for place in places}
+        return {place: future.result() for place, future in futures.items()}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+
+from travel_mapper.routing.polyline import encode_polyline
+from travel_mapper.routing.geometry import haversine_km
+from travel_mapper.constants import GOOGLE_MAPS_BASE_URL, MAPS_STAND_IN_RECORDINGS_PATH
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from urllib.request import urlopen
+import numpy as np
+import argparse
+import threading
+import logging
+import base64
+import random
+import json
+import time
+import zlib
+import os
+
+logging.basicConfig(level=logging.INFO)
+
+GEOCODE_PATH = "/maps/api/geocode/json"
+DIRECTIONS_PATH = "/maps/api/directions/json"
+
+# query parameters that change between otherwise identical requests, and are
+# left out of the replay keys
+VOLATILE_PARAMS = {"key", "client", "signature", "departure_time", "channel"}
+
+
+class MapsStandInServer:
+    """
+    Local stand-in for the Google Maps geocode and directions endpoints, for
+    benchmarking and testing the routing code offline. Point googlemaps.Client
+    (or a RouteFinder) at base_url to use it.
+
+    Modes:
+    - synthetic: every address geocodes to a deterministic location, and
+      directions are generated for any number of waypoints, with step polylines
+      and instructions shaped like the real payloads
+    - replay: serve the payloads recorded in recordings_path, answering 404 for
+      requests that were never recorded
+    - record: forward requests to upstream_url and append the payloads to
+      recordings_path
+
+    Every request is delayed by latency_seconds plus up to latency_jitter_seconds,
+    and a fraction over_query_limit_rate of them is refused with OVER_QUERY_LIMIT.
+    In synthetic mode, addresses containing not_found_marker don't geocode and
+    directions through an address containing unroutable_marker aren't found.
+    """
+
+    MODES = ("synthetic", "replay", "record")
+
+    def __init__(
+        self,
+        mode="synthetic",
+        host="127.0.0.1",
+        port=0,
+        recordings_path=MAPS_STAND_IN_RECORDINGS_PATH,
+        upstream_url=GOOGLE_MAPS_BASE_URL,
+        latency_seconds=0.0,
+        latency_jitter_seconds=0.0,
+        over_query_limit_rate=0.0,
+        not_found_marker="nowhere",
+        unroutable_marker="unroutable",
+        seed=0,
+    ):
+        if mode not in self.MODES:
+            raise ValueError("mode must be one of {}, got {}".format(self.MODES, mode))
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.mode = mode
+        self.recordings_path = recordings_path
+        self.upstream_url = upstream_url.rstrip("/")
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.over_query_limit_rate = over_query_limit_rate
+        self.not_found_marker = not_found_marker
+        self.unroutable_marker = unroutable_marker
+        self.request_counts = {GEOCODE_PATH: 0, DIRECTIONS_PATH: 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.recordings = {}
+        if mode == "replay":
+            self.recordings = self.load_recordings(recordings_path)
+            self.logger.info(
+                "Loaded {} recorded payloads from {}".format(
+                    len(self.recordings), recordings_path
+                )
+            )
+
+        self.httpd = ThreadingHTTPServer((host, port), _StandInRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stand_in = self
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        """
+        Serve in a background thread
+
+        Returns
+        -------
+        self
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        self.logger.info(
+            "Maps stand-in serving {} payloads at {}".format(self.mode, self.base_url)
+        )
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @staticmethod
+    def replay_key(path, params):
+        """
+
+        Parameters
+        ----------
+        path
+        params: dict of query parameters
+
+        Returns
+        -------
+        key identifying a request, regardless of its api key and departure time
+        """
+        kept = sorted((k, v) for k, v in params.items() if k not in VOLATILE_PARAMS)
+        return path + "?" + urlencode(kept)
+
+    @staticmethod
+    def load_recordings(recordings_path):
+        """
+
+        Parameters
+        ----------
+        recordings_path: json lines file of {"key": ..., "body": ...} records
+
+        Returns
+        -------
+        dict of replay key to response body, the last record of a key winning
+        """
+        recordings = {}
+        if os.path.exists(recordings_path):
+            with open(recordings_path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        recordings[record["key"]] = record["body"]
+        return recordings
+
+    def handle(self, path, params):
+        """
+
+        Parameters
+        ----------
+        path
+        params
+
+        Returns
+        -------
+        http status and response body
+        """
+        if path not in self.request_counts:
+            return 404, {"status": "NOT_FOUND", "error_message": "Unknown endpoint"}
+
+        with self._lock:
+            self.request_counts[path] += 1
+            delay = self.latency_seconds
+            delay += self._random.random() * self.latency_jitter_seconds
+            refuse = self._random.random() < self.over_query_limit_rate
+        if delay > 0:
+            time.sleep(delay)
+        if refuse:
+            return 200, {
+                "status": "OVER_QUERY_LIMIT",
+                "error_message": "Injected by the stand-in server",
+            }
+
+        if self.mode == "synthetic":
+            if path == GEOCODE_PATH:
+                return 200, self.synthetic_geocode(params.get("address", ""))
+            return 200, self.synthetic_directions(params)
+
+        key = self.replay_key(path, params)
+        if self.mode == "replay":
+            if key not in self.recordings:
+                self.logger.warning("No recorded payload for {}".format(key))
+                return 404, {
+                    "status": "NOT_FOUND",
+                    "error_message": "Not recorded",
+                }
+            return 200, self.recordings[key]
+
+        with urlopen(self.upstream_url + path + "?" + urlencode(params)) as response:
+            body = json.loads(response.read())
+        with self._lock:
+            self.recordings[key] = body
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self.recordings_path)), exist_ok=True
+            )
+            with open(self.recordings_path, "a") as f:
+                f.write(json.dumps({"key": key, "body": body}) + "\n")
+        return 200, body
+
+    @staticmethod
+    def synthetic_place(address):
+        """
+        Deterministic location for an address, somewhere in the contiguous US,
+        unless the address is a "lat,lng" pair. The place_id encodes the address
+        and location, so that directions can be generated from it without any
+        state
+
+        Parameters
+        ----------
+        address
+
+        Returns
+        -------
+        geocode result
+        """
+        try:
+            lat, lng = (float(x) for x in address.split(","))
+        except ValueError:
+            seed = zlib.crc32(address.strip().lower().encode())
+            lat = round(30 + (seed % 10007) / 10007 * 18, 6)
+            lng = round(-122 + (seed // 10007 % 10009) / 10009 * 50, 6)
+        place_id = base64.urlsafe_b64encode(
+            json.dumps([address, lat, lng]).encode()
+        ).decode()
+        return {
+            "formatted_address": address,
+            "place_id": "SYN" + place_id,
+            "geometry": {"location": {"lat": lat, "lng": lng}},
+            "types": ["locality", "political"],
+        }
+
+    def synthetic_geocode(self, address):
+        if self.not_found_marker and self.not_found_marker in address.lower():
+            return {"status": "ZERO_RESULTS", "results": []}
+        return {"status": "OK", "results": [self.synthetic_place(address)]}
+
+    def _resolve(self, location):
+        """
+
+        Parameters
+        ----------
+        location: place_id:..., "lat,lng" or an address
+
+        Returns
+        -------
+        address, lat, lng
+        """
+        if location.startswith("place_id:SYN"):
+            return json.loads(base64.urlsafe_b64decode(location[len("place_id:SYN") :]))
+        place = self.synthetic_place(location)
+        coords = place["geometry"]["location"]
+        return place["formatted_address"], coords["lat"], coords["lng"]
+
+    def synthetic_directions(self, params):
+        """
+
+        Parameters
+        ----------
+        params: directions query parameters
+
+        Returns
+        -------
+        directions response with one route through all the points, in order
+        """
+        waypoints = [
+            w
+            for w in params.get("waypoints", "").split("|")
+            if w and w != "optimize:true"
+        ]
+        locations = [params["origin"]] + waypoints + [params["destination"]]
+        points = [self._resolve(location) for location in locations]
+
+        if self.unroutable_marker and any(
+            self.unroutable_marker in address.lower() for address, _, _ in points
+        ):
+            return {"status": "ZERO_RESULTS", "routes": []}
+
+        legs = [self.synthetic_leg(p0, p1) for p0, p1 in zip(points[:-1], points[1:])]
+        return {
+            "status": "OK",
+            "routes": [
+                {
+                    "bounds": {},
+                    "copyrights": "Synthetic data",
+                    "legs": legs,
+                    "overview_polyline": {
+                        "points": encode_polyline([p[1:] for p in points])
+                    },
+                    "summary": "Synthetic route",
+                    "warnings": [],
+                    "waypoint_order": list(range(len(waypoints))),
+                }
+            ],
+        }
+
+    @staticmethod
+    def synthetic_leg(p0, p1, km_per_step=20, points_per_step=10):
+        """
+        Leg following a gently winding path between two points, split into steps
+        of about km_per_step. Roads are taken to be 25% longer than the great
+        circle and driven at 80 km/h
+
+        Parameters
+        ----------
+        p0: address, lat, lng
+        p1: address, lat, lng
+        km_per_step
+        points_per_step
+
+        Returns
+        -------
+        directions leg
+        """
+        (a0, lat0, lng0), (a1, lat1, lng1) = p0, p1
+        distance_km = 1.25 * float(haversine_km(lat0, lng0, lat1, lng1))
+        n_steps = int(np.clip(np.ceil(distance_km / km_per_step), 1, 200))
+
+        t = np.linspace(0, 1, n_steps * (points_per_step - 1) + 1)
+        wiggle = 0.02 * np.sin(t * np.pi * 2 * max(1, n_steps // 4))
+        path = np.column_stack(
+            (lat0 + (lat1 - lat0) * t + wiggle, lng0 + (lng1 - lng0) * t - wiggle)
+        )
+
+        step_distance = int(distance_km * 1000 / n_steps)
+        step_duration = int(step_distance / (80 / 3.6))
+        steps = []
+        for i in range(n_steps):
+            step_path = path[
+                i * (points_per_step - 1) : (i + 1) * (points_per_step - 1) + 1
+            ]
+            steps.append(
+                {
+                    "distance": {
+                        "text": "{:.1f} km".format(step_distance / 1000),
+                        "value": step_distance,
+                    },
+                    "duration": {
+                        "text": "{} mins".format(max(1, step_duration // 60)),
+                        "value": step_duration,
+                    },
+                    "start_location": {"lat": step_path[0, 0], "lng": step_path[0, 1]},
+                    "end_location": {"lat": step_path[-1, 0], "lng": step_path[-1, 1]},
+                    "html_instructions": "Continue onto <b>Synthetic Road {}</b>".format(
+                        i
+                    ),
+                    "polyline": {"points": encode_polyline(step_path)},
+                    "travel_mode": "DRIVING",
+                }
+            )
+
+        distance = step_distance * n_steps
+        duration = step_duration * n_steps
+        return {
+            "start_address": a0,
+            "end_address": a1,
+            "start_location": {"lat": lat0, "lng": lng0},
+            "end_location": {"lat": lat1, "lng": lng1},
+            "distance": {
+                "text": "{:.0f} km".format(distance / 1000),
+                "value": distance,
+            },
+            "duration": {
+                "text": "{} hours {} mins".format(
+                    duration // 3600, duration % 3600 // 60
+                ),
+                "value": duration,
+            },
+            "steps": steps,
+            "traffic_speed_entry": [],
+            "via_waypoint": [],
+        }
+
+
+class _StandInRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        status, body = self.server.stand_in.handle(url.path, dict(parse_qsl(url.query)))
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        self.server.stand_in.logger.debug(format, *args)
+
+
+def main():
+    """
+    Run the stand-in until interrupted, e.g.
+    python -m travel_mapper.routing.MapsStandInServer --port 8089 --latency 0.1
+    and set GOOGLE_MAPS_BASE_URL=http://127.0.0.1:8089
+
+    Returns
+    -------
+
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--mode", choices=MapsStandInServer.MODES, default="synthetic")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--recordings", default=MAPS_STAND_IN_RECORDINGS_PATH)
+    parser.add_argument("--upstream", default=GOOGLE_MAPS_BASE_URL)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--over-query-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MapsStandInServer(
+        mode=args.mode,
+        host=args.host,
+        port=args.port,
+        recordings_path=args.recordings,
+        upstream_url=args.upstream,
+        latency_seconds=args.latency,
+        latency_jitter_seconds=args.jitter,
+        over_query_limit_rate=args.over_query_limit_rate,
+    )
+    server.logger.info("Serving at {}".format(server.base_url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
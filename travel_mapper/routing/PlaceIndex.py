@@ -0,0 +1,94 @@
+from travel_mapper.routing.geohash import encode, cells_within
+from travel_mapper.routing.geometry import haversine_km
+from travel_mapper.constants import PLACE_INDEX_GEOHASH_PRECISION
+import threading
+
+
+class PlaceIndex:
+    """
+    Thread safe spatial index of Places, bucketed by geohash, to find the known
+    place closest to a location without scanning them all
+    """
+
+    def __init__(self, places=(), precision=PLACE_INDEX_GEOHASH_PRECISION):
+        self.precision = precision
+        self._cells = {}
+        # cell of each place_id, to find the place when it is replaced or removed
+        self._place_cells = {}
+        self._lock = threading.Lock()
+        for place in places:
+            self.add(place)
+
+    def add(self, place):
+        """
+        Add a place, replacing any with the same place_id
+
+        Parameters
+        ----------
+        place
+
+        Returns
+        -------
+
+        """
+        cell = encode(place.lat, place.lng, self.precision)
+        with self._lock:
+            self._remove(place.place_id)
+            self._cells.setdefault(cell, []).append(place)
+            self._place_cells[place.place_id] = cell
+
+    def remove(self, place_id):
+        """
+        Remove the place with this place_id, if there is one
+
+        Parameters
+        ----------
+        place_id
+
+        Returns
+        -------
+
+        """
+        with self._lock:
+            self._remove(place_id)
+
+    def _remove(self, place_id):
+        cell = self._place_cells.pop(place_id, None)
+        if cell is None:
+            return
+        places = [p for p in self._cells[cell] if p.place_id != place_id]
+        if places:
+            self._cells[cell] = places
+        else:
+            del self._cells[cell]
+
+    def nearest(self, lat, lng, radius_km):
+        """
+
+        Parameters
+        ----------
+        lat
+        lng
+        radius_km
+
+        Returns
+        -------
+        the closest Place within radius_km and its distance in km, or
+        (None, None) if there is none
+        """
+        with self._lock:
+            candidates = [
+                place
+                for cell in cells_within(lat, lng, radius_km, self.precision)
+                for place in self._cells.get(cell, ())
+            ]
+        best, best_distance = None, None
+        for place in candidates:
+            distance = float(haversine_km(lat, lng, place.lat, place.lng))
+            if distance <= radius_km and (best is None or distance < best_distance):
+                best, best_distance = place, distance
+        return best, best_distance
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(places) for places in self._cells.values())
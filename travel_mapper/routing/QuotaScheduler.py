@@ -0,0 +1,353 @@
+from travel_mapper.routing.RateLimiter import RateLimiter
+from travel_mapper.constants import (
+    GOOGLE_MAPS_MAX_RETRIES,
+    QUOTA_BACKOFF_SECONDS,
+    QUOTA_MAX_BACKOFF_SECONDS,
+)
+import googlemaps
+import threading
+import asyncio
+import logging
+import random
+import heapq
+import itertools
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+# lower values are served first
+INTERACTIVE = 0
+BATCH = 10
+
+# the Maps APIs called by RouteFinder, each with its own quota
+ENDPOINTS = ("geocode", "directions")
+
+# http statuses of server errors, that the maps client leaves to the scheduler
+# to retry, see maps_clients.NonRetryingClient
+RETRIABLE_STATUSES = {500, 503, 504}
+
+_shared_schedulers = {}
+_shared_schedulers_lock = threading.Lock()
+
+
+def endpoint_quotas(requests_per_second):
+    """
+
+    Parameters
+    ----------
+    requests_per_second: dict of endpoint name to its quota, or a single quota
+        for every endpoint
+
+    Returns
+    -------
+    dict of endpoint name to its quota
+    """
+    if isinstance(requests_per_second, dict):
+        return dict(requests_per_second)
+    return {endpoint: requests_per_second for endpoint in ENDPOINTS}
+
+
+def is_retriable(error):
+    """
+
+    Parameters
+    ----------
+    error
+
+    Returns
+    -------
+    whether a failed request should be retried after a backoff
+    """
+    if isinstance(error, googlemaps.exceptions._RetriableRequest):
+        return True
+    if isinstance(error, googlemaps.exceptions.ApiError):
+        return error.status == "OVER_QUERY_LIMIT"
+    if isinstance(error, googlemaps.exceptions.HTTPError):
+        return error.status_code in RETRIABLE_STATUSES
+    return False
+
+
+class QuotaScheduler:
+    """
+    Process wide gate for the Google Maps calls of every RouteFinder, with one
+    token bucket per endpoint.
+
+    Callers queue for a token by priority, interactive requests ahead of batch
+    ones and first come first served within a priority, so the requests leave at
+    the quota rate in a steady stream. Requests refused with OVER_QUERY_LIMIT or
+    a server error are retried after a jittered exponential backoff, and the
+    bucket of the endpoint is emptied so that the other callers slow down too.
+
+    Both threads (call) and coroutines (call_async) can queue on the same
+    scheduler.
+    """
+
+    def __init__(
+        self,
+        requests_per_second,
+        max_retries=GOOGLE_MAPS_MAX_RETRIES,
+        backoff_seconds=QUOTA_BACKOFF_SECONDS,
+        max_backoff_seconds=QUOTA_MAX_BACKOFF_SECONDS,
+    ):
+        """
+
+        Parameters
+        ----------
+        requests_per_second: dict of endpoint name to its quota, or a single quota
+            for every endpoint
+        max_retries
+        backoff_seconds: delay before the first retry, doubled for each one after
+        max_backoff_seconds
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.buckets = {
+            endpoint: RateLimiter(rate)
+            for endpoint, rate in endpoint_quotas(requests_per_second).items()
+        }
+        self._queues = {endpoint: [] for endpoint in self.buckets}
+        self._metrics = {
+            endpoint: {
+                "requests": 0,
+                "retries": 0,
+                "over_query_limit": 0,
+                "max_queue_depth": 0,
+                "wait_seconds": 0.0,
+            }
+            for endpoint in self.buckets
+        }
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+    def _enqueue(self, endpoint, priority):
+        ticket = (priority, next(self._counter))
+        queue = self._queues[endpoint]
+        heapq.heappush(queue, ticket)
+        metrics = self._metrics[endpoint]
+        metrics["max_queue_depth"] = max(metrics["max_queue_depth"], len(queue))
+        return ticket
+
+    def _try_take(self, endpoint, ticket):
+        """
+        Take a token for the ticket if it is at the head of the queue. Must be
+        called holding the condition
+
+        Returns
+        -------
+        0 if a token was taken, otherwise how long to wait before trying again,
+        or None if the ticket is not at the head of the queue
+        """
+        queue = self._queues[endpoint]
+        if queue[0] != ticket:
+            return None
+        wait_time = self.buckets[endpoint].try_acquire()
+        if wait_time == 0:
+            heapq.heappop(queue)
+            self._metrics[endpoint]["requests"] += 1
+            # the next ticket may now be at the head
+            self._condition.notify_all()
+        return wait_time
+
+    def acquire(self, endpoint, priority=INTERACTIVE):
+        """
+        Block until the caller may send a request to the endpoint
+
+        Parameters
+        ----------
+        endpoint
+        priority
+
+        Returns
+        -------
+        the number of seconds spent waiting
+        """
+        t1 = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue(endpoint, priority)
+            while True:
+                wait_time = self._try_take(endpoint, ticket)
+                if wait_time == 0:
+                    break
+                # only the head of the queue needs to wake up on its own, the
+                # others are notified when the tickets ahead of them are served
+                self._condition.wait(timeout=wait_time)
+            waited = time.monotonic() - t1
+            self._metrics[endpoint]["wait_seconds"] += waited
+        return waited
+
+    async def acquire_async(self, endpoint, priority=INTERACTIVE):
+        """
+        Like acquire, but waits without blocking the event loop
+
+        Parameters
+        ----------
+        endpoint
+        priority
+
+        Returns
+        -------
+        the number of seconds spent waiting
+        """
+        t1 = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue(endpoint, priority)
+        try:
+            while True:
+                with self._condition:
+                    wait_time = self._try_take(endpoint, ticket)
+                if wait_time == 0:
+                    break
+                if wait_time is None:
+                    # not at the head of the queue, check again after roughly
+                    # the time it takes to serve one request
+                    wait_time = 1 / self.buckets[endpoint].requests_per_second
+                await asyncio.sleep(wait_time)
+        except asyncio.CancelledError:
+            with self._condition:
+                self._remove(endpoint, ticket)
+            raise
+        waited = time.monotonic() - t1
+        with self._condition:
+            self._metrics[endpoint]["wait_seconds"] += waited
+        return waited
+
+    def _remove(self, endpoint, ticket):
+        queue = self._queues[endpoint]
+        if ticket in queue:
+            queue.remove(ticket)
+            heapq.heapify(queue)
+            self._condition.notify_all()
+
+    def _backoff(self, endpoint, attempt, error):
+        """
+        Record a refused request and return how long to wait before retrying it
+
+        Parameters
+        ----------
+        endpoint
+        attempt: number of retries so far
+        error
+
+        Returns
+        -------
+        seconds
+        """
+        with self._condition:
+            metrics = self._metrics[endpoint]
+            metrics["retries"] += 1
+            if isinstance(error, googlemaps.exceptions.ApiError):
+                metrics["over_query_limit"] += 1
+                self.buckets[endpoint].drain()
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt)
+        # full jitter around the delay, so that the callers refused together
+        # don't all come back together
+        delay *= 0.5 + random.random()
+        self.logger.warning(
+            "{} request refused ({}), retrying in {:.2f}s".format(
+                endpoint, error, delay
+            )
+        )
+        return delay
+
+    def call(self, endpoint, request, *args, priority=INTERACTIVE, **kwargs):
+        """
+        Make a request once a token is available for the endpoint, retrying
+        it when it is refused
+
+        Parameters
+        ----------
+        endpoint
+        request: function making the request
+        args
+        priority
+        kwargs
+
+        Returns
+        -------
+        the result of request
+        """
+        attempt = 0
+        while True:
+            self.acquire(endpoint, priority)
+            try:
+                return request(*args, **kwargs)
+            except Exception as e:
+                if not is_retriable(e) or attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff(endpoint, attempt, e))
+                attempt += 1
+
+    async def call_async(
+        self, endpoint, request, *args, priority=INTERACTIVE, **kwargs
+    ):
+        """
+        Like call, for a coroutine function
+
+        Parameters
+        ----------
+        endpoint
+        request: coroutine function making the request
+        args
+        priority
+        kwargs
+
+        Returns
+        -------
+        the result of request
+        """
+        attempt = 0
+        while True:
+            await self.acquire_async(endpoint, priority)
+            try:
+                return await request(*args, **kwargs)
+            except Exception as e:
+                if not is_retriable(e) or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(endpoint, attempt, e))
+                attempt += 1
+
+    def queue_depth(self, endpoint):
+        with self._condition:
+            return len(self._queues[endpoint])
+
+    def stats(self):
+        """
+
+        Returns
+        -------
+        dict of endpoint to its counters and current queue depth
+        """
+        with self._condition:
+            return {
+                endpoint: dict(
+                    metrics,
+                    queue_depth=len(self._queues[endpoint]),
+                    wait_seconds=round(metrics["wait_seconds"], 3),
+                )
+                for endpoint, metrics in self._metrics.items()
+            }
+
+
+def get_shared_quota_scheduler(requests_per_second):
+    """
+    Return the process wide QuotaScheduler for these quotas, so that every
+    RouteFinder draws from the same buckets
+
+    Parameters
+    ----------
+    requests_per_second: dict of endpoint name to its quota, or a single quota
+        for every endpoint
+
+    Returns
+    -------
+
+    """
+    requests_per_second = endpoint_quotas(requests_per_second)
+    key = tuple(sorted(requests_per_second.items()))
+    with _shared_schedulers_lock:
+        if key not in _shared_schedulers:
+            _shared_schedulers[key] = QuotaScheduler(requests_per_second)
+        return _shared_schedulers[key]
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread safe token bucket. Tokens are refilled at requests_per_second up to
+    burst, and acquire() blocks until one is available.
+    """
+
+    def __init__(self, requests_per_second, burst=None):
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second must be positive")
+        self.requests_per_second = float(requests_per_second)
+        self.burst = float(burst if burst is not None else max(1, requests_per_second))
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._tokens = min(
+            self.burst, self._tokens + elapsed * self.requests_per_second
+        )
+        self._last_refill = now
+
+    def try_acquire(self):
+        """
+        Take a token if one is available, without waiting
+
+        Returns
+        -------
+        0 if a token was taken, otherwise the number of seconds until the next one
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.requests_per_second
+
+    def drain(self):
+        """
+        Drop the tokens saved up so far, e.g. after the API reported that the
+        quota was exceeded, so that the next ones arrive at the steady rate
+        """
+        with self._lock:
+            self._tokens = 0.0
+            self._last_refill = time.monotonic()
+
+    def acquire(self):
+        """
+        Block until a token is available and take it
+
+        Returns
+        -------
+        The number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait_time = self.try_acquire()
+            if wait_time == 0:
+                return waited
+            time.sleep(wait_time)
+            waited += wait_time
+
+    async def acquire_async(self):
+        """
+        Like acquire, but waits without blocking the event loop
+
+        Returns
+        -------
+        The number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait_time = self.try_acquire()
+            if wait_time == 0:
+                return waited
+            await asyncio.sleep(wait_time)
+            waited += wait_time
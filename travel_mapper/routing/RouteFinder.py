@@ -1,9 +1,33 @@
 from travel_mapper.mapping.RouteMapper import RouteMapper
-from googlemaps.convert import decode_polyline
-import googlemaps
-from datetime import datetime
+from travel_mapper.routing.GeocodeCache import get_shared_geocode_cache
+from travel_mapper.routing.DirectionsCache import get_shared_directions_cache
+from travel_mapper.routing.maps_clients import get_shared_maps_client
+from travel_mapper.routing.QuotaScheduler import (
+    get_shared_quota_scheduler,
+    INTERACTIVE,
+)
+from travel_mapper.constants import (
+    GEOCODE_MAX_WORKERS,
+    GOOGLE_MAPS_BASE_URL,
+    GOOGLE_MAPS_REQUESTS_PER_SECOND,
+    DEPARTURE_BUCKET_SECONDS,
+    OPTIMIZE_WAYPOINT_ORDER,
+    PLACE_SNAP_RADIUS_KM,
+)
+from travel_mapper.routing.RouteSessionStore import RouteSessionStore
+from travel_mapper.routing.models import Place, Route
+from travel_mapper.routing.geometry import haversine_km
+from travel_mapper.routing.ordering import (
+    optimize_order,
+    distance_matrix_km,
+    path_length,
+)
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from datetime import datetime
+import contextvars
 import logging
+import re
 import time
 
 logging.basicConfig(level=logging.INFO)
@@ -11,14 +35,140 @@ logging.basicConfig(level=logging.INFO)
 
 class RouteFinder:
     MAX_WAYPOINTS_API_CALL = 23
-
-    def __init__(self, google_maps_api_key):
+    TRANSIT_MODES = ("driving", "walking", "bicycling", "transit")
+    # the directions API only routes these modes from an origin to a destination
+    MODES_WITHOUT_WAYPOINTS = ("transit",)
+    # words of a free text mode of transport, as found in Trip.transit, that
+    # point at each of the modes other than driving. They are matched against
+    # whole words, so that e.g. "trail" is not taken for "rail"
+    TRANSIT_MODE_KEYWORDS = {
+        "transit": (
+            "transit",
+            "public",
+            "train",
+            "trains",
+            "rail",
+            "railway",
+            "bus",
+            "buses",
+            "subway",
+            "metro",
+            "tram",
+            "trams",
+        ),
+        "walking": ("walk", "walks", "walking", "foot", "hike", "hikes", "hiking"),
+        "bicycling": (
+            "bicycle",
+            "bicycling",
+            "bike",
+            "bikes",
+            "biking",
+            "cycle",
+            "cycling",
+        ),
+    }
+
+    def __init__(
+        self,
+        google_maps_api_key,
+        geocode_cache=None,
+        max_workers=GEOCODE_MAX_WORKERS,
+        requests_per_second=GOOGLE_MAPS_REQUESTS_PER_SECOND,
+        directions_cache=None,
+        departure_bucket_seconds=DEPARTURE_BUCKET_SECONDS,
+        base_url=GOOGLE_MAPS_BASE_URL,
+        optimize_waypoint_order=OPTIMIZE_WAYPOINT_ORDER,
+        scheduler=None,
+        priority=INTERACTIVE,
+        route_sessions=None,
+        snap_radius_km=PLACE_SNAP_RADIUS_KM,
+    ):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
         self.mapper = RouteMapper()
-        self.gmaps = googlemaps.Client(key=google_maps_api_key)
+        # base_url can point at a MapsStandInServer to run without the live API
+        self.base_url = base_url.rstrip("/")
+        # the client and its pooled connections are shared with every other
+        # RouteFinder using the same key in this process
+        self.gmaps = get_shared_maps_client(google_maps_api_key, self.base_url)
+        # geocode results are shared by every RouteFinder through a disk backed cache
+        if geocode_cache is None:
+            geocode_cache = get_shared_geocode_cache()
+        self.geocode_cache = geocode_cache
+        # new places this close to a cached one are taken to be the same place,
+        # so that the directions requested through them can be reused
+        self.snap_radius_km = snap_radius_km
+        # directions are cached per departure time bucket, so that repeat routes
+        # requested within the same bucket skip the API call
+        if directions_cache is None:
+            directions_cache = get_shared_directions_cache()
+        self.directions_cache = directions_cache
+        self.departure_bucket_seconds = departure_bucket_seconds
+        # the directions API only reorders waypoints within a single call, so trips
+        # that are split into several calls are ordered here first
+        self.optimize_waypoint_order = optimize_waypoint_order
+        # places are geocoded in parallel when max_workers > 1, while the shared
+        # scheduler keeps all RouteFinders in this process under the quota of each
+        # endpoint. requests_per_second is a single quota or one per endpoint
+        self.max_workers = max_workers
+        if scheduler is None:
+            scheduler = get_shared_quota_scheduler(requests_per_second)
+        self.scheduler = scheduler
+        # requests of interactive users are served before those of batch jobs
+        self.priority = priority
+        # last route of each planning session, see build_route_for_session
+        if route_sessions is None:
+            route_sessions = RouteSessionStore()
+        self.route_sessions = route_sessions
+        # addresses of the waypoints left out of the last route because they could
+        # not be geocoded or routed. They are tracked per thread or asyncio task,
+        # so that concurrent trips on the same finder don't mix them up
+        self._dropped_waypoints = contextvars.ContextVar(
+            "dropped_waypoints_{}".format(id(self))
+        )
+
+    @property
+    def dropped_waypoints(self):
+        dropped_waypoints = self._dropped_waypoints.get(None)
+        if dropped_waypoints is None:
+            dropped_waypoints = []
+            self._dropped_waypoints.set(dropped_waypoints)
+        return dropped_waypoints
 
-    def generate_route(self, list_of_places, itinerary, include_map=True):
+    @dropped_waypoints.setter
+    def dropped_waypoints(self, value):
+        self._dropped_waypoints.set(value)
+
+    @staticmethod
+    def map_in_context(executor, function, items):
+        """
+        Like executor.map, but each call runs in a copy of the caller's context,
+        so that its waypoints are dropped from the caller's route
+
+        Parameters
+        ----------
+        executor
+        function
+        items
+
+        Returns
+        -------
+        list of the results
+        """
+        futures = [
+            executor.submit(contextvars.copy_context().run, function, item)
+            for item in items
+        ]
+        return [future.result() for future in futures]
+
+    def generate_route(
+        self,
+        list_of_places,
+        itinerary,
+        include_map=True,
+        session_id=None,
+        geocode_queue=None,
+    ):
         """
 
         Parameters
@@ -26,34 +176,82 @@ class RouteFinder:
         list_of_places
         itinerary
         include_map
+        session_id: optional id of the planning session, see build_route_for_session
+        geocode_queue: optional GeocodeQueue the places were put in as they arrived
 
         Returns
         -------
 
         """
+        self.log_itinerary(itinerary)
+
+        t1 = time.time()
+        route, sampled_route, mapping_dict = self.build_route_segments(
+            list_of_places, session_id=session_id, geocode_queue=geocode_queue
+        )
+        t2 = time.time()
+        self.log_route_stats(t2 - t1)
+
+        if include_map:
+            self.generate_map(list_of_places, route, sampled_route)
+
+        return route, sampled_route, mapping_dict
+
+    def log_itinerary(self, itinerary):
         self.logger.info("# " * 20)
         self.logger.info("PROPOSED ITINERARY")
         self.logger.info("# " * 20)
         self.logger.info(itinerary)
 
-        t1 = time.time()
-        directions, sampled_route, mapping_dict = self.build_route_segments(
-            list_of_places
+    def log_route_stats(self, build_time):
+        """
+
+        Parameters
+        ----------
+        build_time: seconds spent building the route
+
+        Returns
+        -------
+
+        """
+        self.logger.info("Time to build route : {}".format((round(build_time, 2))))
+        self.logger.info("Geocode cache stats : {}".format(self.geocode_cache.stats()))
+        self.logger.info(
+            "Directions cache stats : {}".format(self.directions_cache.stats())
         )
-        t2 = time.time()
-        self.logger.info("Time to build route : {}".format((round(t2 - t1, 2))))
+        self.logger.info("Quota stats : {}".format(self.scheduler.stats()))
+        if self.dropped_waypoints:
+            self.logger.warning(
+                "Waypoints left out of the route: {}".format(self.dropped_waypoints)
+            )
 
-        if include_map:
-            t1 = time.time()
-            self.mapper.add_list_of_places(list_of_places)
-            self.mapper.generate_route_map(directions, sampled_route)
-            t2 = time.time()
-            self.logger.info("Time to generate map : {}".format((round(t2 - t1, 2))))
+    def generate_map(self, list_of_places, route, sampled_route):
+        """
 
-        return directions, sampled_route, mapping_dict
+        Parameters
+        ----------
+        list_of_places
+        route
+        sampled_route
+
+        Returns
+        -------
+
+        """
+        t1 = time.time()
+        self.mapper.add_list_of_places(list_of_places)
+        self.mapper.generate_route_map(route, sampled_route)
+        t2 = time.time()
+        self.logger.info("Time to generate map : {}".format((round(t2 - t1, 2))))
 
     def build_route_segments(
-        self, list_of_places, verbose=True, distance_per_point_in_km=0.25
+        self,
+        list_of_places,
+        verbose=True,
+        distance_per_point_in_km=0.25,
+        session_id=None,
+        transit_type=None,
+        geocode_queue=None,
     ):
         """
 
@@ -61,18 +259,40 @@ class RouteFinder:
         ----------
         list_of_places
         verbose
-        sample_route_points
+        distance_per_point_in_km
+        session_id: optional id of the planning session. If given the route is
+            built by build_route_for_session
+        transit_type: one of TRANSIT_MODES, by default the mode of transport of
+            the trip
+        geocode_queue: optional GeocodeQueue already resolving the places of the
+            trip, e.g. as the agent wrote them
 
         Returns
         -------
-
+        the Route, the Route resampled every distance_per_point_in_km and the
+        dict of geocoded Places
         """
-        number_of_stops = len(list_of_places["waypoints"])
+        if transit_type is None:
+            transit_type = self.transit_mode(list_of_places.get("transit"))
+        geocodes = None
+        if geocode_queue is not None:
+            # the places found are in the geocode cache by now, which is where
+            # sessions look them up
+            geocodes = geocode_queue.geocodes(
+                [list_of_places["start"], list_of_places["end"]]
+                + list_of_places["waypoints"]
+            )
+        if session_id is not None:
+            return self.build_route_for_session(
+                session_id,
+                list_of_places,
+                verbose,
+                distance_per_point_in_km,
+                transit_type,
+            )
 
-        segment_mapping_dicts = []
-        directions_list = []
-        routes_list = []
-        sampled_routes = []
+        self.dropped_waypoints = []
+        number_of_stops = len(list_of_places["waypoints"])
 
         # if this is true, we need to make several API calls to collect the entire route
         if number_of_stops > self.MAX_WAYPOINTS_API_CALL:
@@ -81,54 +301,42 @@ class RouteFinder:
                     number_of_stops, self.MAX_WAYPOINTS_API_CALL
                 )
             )
-            starting_point = list_of_places["start"]
-            segment_id = 0
-            for segment_start in range(0, number_of_stops, self.MAX_WAYPOINTS_API_CALL):
-                segment_end = segment_start + self.MAX_WAYPOINTS_API_CALL
-
-                segment_waypoints = list_of_places["waypoints"][
-                    segment_start:segment_end
-                ]
-
-                if segment_end >= number_of_stops:
-                    # this is the final segment
-                    end_point = list_of_places["end"]
-                else:
-                    end_point = segment_waypoints[-1]
-
-                start_point = starting_point
-
-                mapping_dict = self.build_mapping_dict(
-                    start_point, end_point, waypoints=segment_waypoints[:-1]
-                )
-
+            # the endpoints of every segment are known up front, so all the places
+            # are geocoded together and the segments are then fetched concurrently
+            all_places = [list_of_places["start"], list_of_places["end"]]
+            all_places += list_of_places["waypoints"]
+            if geocodes is None:
+                geocodes = self.geocode_places(all_places)
+            segment_mapping_dicts = self.plan_segments(list_of_places, geocodes)
+
+            def route_segment(segment_id):
                 if verbose:
                     self.logger.info("# " * 10)
                     self.logger.info(
                         "Getting directions for segment {}".format(segment_id)
                     )
-
-                directions, route = self.build_directions_and_route(
-                    mapping_dict, verbose=verbose
+                route = self.build_directions_and_route(
+                    segment_mapping_dicts[segment_id],
+                    transit_type=transit_type,
+                    verbose=verbose,
                 )
                 sampled_route = self.sample_route_with_legs(
                     route, distance_per_point_in_km
                 )
+                return route, sampled_route
 
-                directions_list += directions
-                routes_list += route
-                sampled_routes.append(sampled_route)
-
-                segment_mapping_dicts.append(mapping_dict)
-
-                starting_point = end_point
-                segment_id += 1
+            n_workers = max(1, min(self.max_workers, len(segment_mapping_dicts)))
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                segment_results = self.map_in_context(
+                    executor, route_segment, range(len(segment_mapping_dicts))
+                )
 
-            # combine and assemble as single mapping dict and route list from the segments
+            # combine and assemble as single mapping dict and route from the segments
+            route = Route.concatenate(route for route, _ in segment_results)
             mapping_dict, sampled_route = self.assemble_final_route_from_segments(
-                segment_mapping_dicts, sampled_routes
+                segment_mapping_dicts,
+                [sampled_route for _, sampled_route in segment_results],
             )
-            directions = directions_list
 
         # if we can just do one API call to Google Maps, then the process is simpler
         else:
@@ -137,13 +345,535 @@ class RouteFinder:
                 list_of_places["start"],
                 list_of_places["end"],
                 waypoints=list_of_places["waypoints"],
+                geocodes=geocodes,
             )
 
             self.logger.info("Calling Google Maps API to get directions")
-            directions, route = self.build_directions_and_route(mapping_dict)
+            route = self.build_directions_and_route(
+                mapping_dict, transit_type=transit_type, verbose=verbose
+            )
             sampled_route = self.sample_route_with_legs(route, distance_per_point_in_km)
 
-        return directions, sampled_route, mapping_dict
+        return route, sampled_route, mapping_dict
+
+    @classmethod
+    def transit_mode(cls, transit):
+        """
+        Mode of the directions API for a free text mode of transport
+
+        Parameters
+        ----------
+        transit: e.g. the transit field of a Trip, or None
+
+        Returns
+        -------
+        one of TRANSIT_MODES, driving if nothing else matches
+        """
+        transit = (transit or "").lower()
+        if transit in cls.TRANSIT_MODES:
+            return transit
+        words = set(re.findall(r"[a-z]+", transit))
+        for mode, keywords in cls.TRANSIT_MODE_KEYWORDS.items():
+            if words.intersection(keywords):
+                return mode
+        return "driving"
+
+    def compare_modes(
+        self,
+        list_of_places,
+        modes=None,
+        verbose=True,
+        distance_per_point_in_km=0.25,
+        session_id=None,
+    ):
+        """
+        Route a trip in several modes of transport concurrently and keep the
+        fastest. The places are geocoded once for all the modes, and the
+        directions of each mode are cached separately
+
+        Parameters
+        ----------
+        list_of_places
+        modes: modes of transport, free text or TRANSIT_MODES. By default the
+            mode of the trip and driving
+        verbose
+        distance_per_point_in_km
+        session_id
+
+        Returns
+        -------
+        the Route, the resampled Route and the dict of geocoded Places in the
+        best mode, and the summaries of every mode, best first
+        """
+        modes = self.modes_to_compare(list_of_places, modes)
+        self.geocode_places(
+            [list_of_places["start"], list_of_places["end"]]
+            + list_of_places["waypoints"]
+        )
+
+        def route_mode(mode):
+            # each mode runs in its own context, with its own dropped waypoints
+            result = self.build_route_segments(
+                list_of_places,
+                verbose=verbose,
+                distance_per_point_in_km=distance_per_point_in_km,
+                session_id=session_id,
+                transit_type=mode,
+            )
+            return result, self.dropped_waypoints
+
+        with ThreadPoolExecutor(max_workers=len(modes)) as executor:
+            results = dict(zip(modes, self.map_in_context(executor, route_mode, modes)))
+        return self.pick_best_mode(results)
+
+    def modes_to_compare(self, list_of_places, modes=None):
+        """
+
+        Parameters
+        ----------
+        list_of_places
+        modes
+
+        Returns
+        -------
+        list of distinct TRANSIT_MODES
+        """
+        if modes is None:
+            modes = [list_of_places.get("transit"), "driving"]
+        return list(dict.fromkeys(self.transit_mode(mode) for mode in modes))
+
+    def pick_best_mode(self, results):
+        """
+
+        Parameters
+        ----------
+        results: dict of mode to the output of build_route_segments and the
+            waypoints dropped from it
+
+        Returns
+        -------
+        the Route, the resampled Route and the dict of geocoded Places in the
+        best mode, and the summaries of every mode, best first
+        """
+        summaries = []
+        for mode, ((route, _, _), dropped_waypoints) in results.items():
+            summaries.append(
+                {
+                    "mode": mode,
+                    "distance_km": route.distance / 1000,
+                    "duration_hrs": route.duration / 3600,
+                    "dropped_waypoints": dropped_waypoints,
+                }
+            )
+        # routes that visit every stop come first, then the fastest
+        summaries.sort(
+            key=lambda summary: (
+                len(summary["dropped_waypoints"]) > 0
+                or not results[summary["mode"]][0][0],
+                summary["duration_hrs"],
+            )
+        )
+        for summary in summaries:
+            self.logger.info(
+                "{mode}: {distance_km:.1f} km, {duration_hrs:.1f} hrs, "
+                "{n_dropped} waypoints dropped".format(
+                    n_dropped=len(summary["dropped_waypoints"]), **summary
+                )
+            )
+
+        (route, sampled_route, mapping_dict), self.dropped_waypoints = results[
+            summaries[0]["mode"]
+        ]
+        return route, sampled_route, mapping_dict, summaries
+
+    def build_route_for_session(
+        self,
+        session_id,
+        list_of_places,
+        verbose=True,
+        distance_per_point_in_km=0.25,
+        transit_type="driving",
+    ):
+        """
+        Build the route of a trip that the user of a planning session may be
+        editing, diffing it against the last route of the session: geocodes and
+        legs that are still part of the trip are reused and directions are only
+        requested for the legs that changed.
+
+        The waypoints are visited in the order of list_of_places, or if
+        optimize_waypoint_order is set, in the order of the last route with the
+        new waypoints inserted where they add the least distance. Routes in
+        different modes are kept apart
+
+        Parameters
+        ----------
+        session_id
+        list_of_places
+        verbose
+        distance_per_point_in_km
+        transit_type
+
+        Returns
+        -------
+        the Route, the Route resampled every distance_per_point_in_km and the
+        dict of geocoded Places
+        """
+        self.dropped_waypoints = []
+        session_key = (session_id, transit_type)
+        session = self.route_sessions.get(session_key)
+        geocodes = self.session_geocodes(session, list_of_places)
+        geocodes.update(
+            self.geocode_places([p for p in geocodes if geocodes[p] is None])
+        )
+        stops = self.plan_session_stops(session, list_of_places, geocodes)
+        runs = self.missing_runs(
+            stops,
+            session["legs"] if session else {},
+            self.max_run_points(transit_type),
+        )
+        route_legs, dropped = self.bisect_directions(
+            self.session_points(stops, geocodes),
+            transit_type=transit_type,
+            runs=runs,
+            legs=self.index_legs(stops, session["legs"] if session else {}),
+        )
+        return self.finish_session_route(
+            session_key,
+            session,
+            list_of_places,
+            stops,
+            geocodes,
+            route_legs,
+            dropped,
+            verbose,
+            distance_per_point_in_km,
+        )
+
+    @staticmethod
+    def session_geocodes(session, list_of_places):
+        """
+
+        Parameters
+        ----------
+        session: session dict, or None
+        list_of_places
+
+        Returns
+        -------
+        dict of every place of the trip to its Place from the session, or None
+        for the places that still need to be geocoded
+        """
+        known = session["geocodes"] if session else {}
+        places = [list_of_places["start"], list_of_places["end"]]
+        places += list_of_places["waypoints"]
+        return {place: known.get(place) for place in places}
+
+    def plan_session_stops(self, session, list_of_places, geocodes):
+        """
+
+        Parameters
+        ----------
+        session: session dict, or None
+        list_of_places
+        geocodes: dict of place to Place, or None for the places that were not found
+
+        Returns
+        -------
+        the places of the trip in visiting order, without the waypoints that
+        could not be geocoded
+        """
+        start, end = list_of_places["start"], list_of_places["end"]
+        # raises if the start or the end could not be geocoded
+        self.mapping_dict_from_geocodes(start, end, [], geocodes)
+        waypoints = []
+        for waypoint in list_of_places["waypoints"]:
+            if geocodes[waypoint] is not None:
+                waypoints.append(waypoint)
+            else:
+                self.logger.warning(
+                    "Dropping waypoint {}, it could not be geocoded".format(waypoint)
+                )
+                self.dropped_waypoints.append(waypoint)
+
+        if not self.optimize_waypoint_order:
+            return [start] + waypoints + [end]
+
+        previous = session["stops"][1:-1] if session else []
+        current, previous_set = set(waypoints), set(previous)
+        kept = [w for w in previous if w in current]
+        added = [w for w in waypoints if w not in previous_set]
+        if len(added) > len(kept):
+            # mostly a new trip, order it from scratch
+            return (
+                [start] + self.order_waypoints(start, end, waypoints, geocodes) + [end]
+            )
+
+        stops = [start] + kept + [end]
+        for waypoint in added:
+            stops = self.insert_stop(stops, waypoint, geocodes)
+        return stops
+
+    @staticmethod
+    def insert_stop(stops, place, geocodes):
+        """
+        Insert a place between the consecutive stops where it adds the least
+        straight line distance
+
+        Parameters
+        ----------
+        stops: places in visiting order
+        place
+        geocodes: dict of place to Place
+
+        Returns
+        -------
+        new list of stops
+        """
+        lat, lng = np.array([geocodes[stop].location for stop in stops]).T
+        place_lat, place_lng = geocodes[place].location
+        to_place = haversine_km(lat, lng, place_lat, place_lng)
+        direct = haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:])
+        i = int(np.argmin(to_place[:-1] + to_place[1:] - direct))
+        return stops[: i + 1] + [place] + stops[i + 1 :]
+
+    @staticmethod
+    def missing_runs(stops, legs, max_points):
+        """
+
+        Parameters
+        ----------
+        stops: places in visiting order
+        legs: dict of (from, to) places to the Legs that are already known
+        max_points: most stops in a single directions call, see max_run_points
+
+        Returns
+        -------
+        list of runs of consecutive stop indices joined by unknown legs, each
+        short enough for a single directions call
+        """
+        runs = []
+        run = None
+        for i, edge in enumerate(zip(stops[:-1], stops[1:])):
+            if edge in legs:
+                run = None
+                continue
+            if run is None or len(run) == max_points:
+                run = [i]
+                runs.append(run)
+            run.append(i + 1)
+        return runs
+
+    @staticmethod
+    def session_points(stops, geocodes):
+        """
+
+        Parameters
+        ----------
+        stops: places in visiting order
+        geocodes: dict of place to Place
+
+        Returns
+        -------
+        the stops as place_id strings
+        """
+        return ["place_id:" + geocodes[stop].place_id for stop in stops]
+
+    @staticmethod
+    def index_legs(stops, legs):
+        """
+
+        Parameters
+        ----------
+        stops: places in visiting order
+        legs: dict of (from, to) places to the Legs that are already known
+
+        Returns
+        -------
+        dict of (i, i + 1) stop indices to the known Leg between them
+        """
+        return {
+            (i, i + 1): legs[edge]
+            for i, edge in enumerate(zip(stops[:-1], stops[1:]))
+            if edge in legs
+        }
+
+    def finish_session_route(
+        self,
+        session_key,
+        session,
+        list_of_places,
+        stops,
+        geocodes,
+        route_legs,
+        dropped,
+        verbose,
+        distance_per_point_in_km,
+    ):
+        """
+        Assemble the route of a session from the reused and the fetched legs,
+        and save it as the last route of the session
+
+        Parameters
+        ----------
+        session_key: session id and mode of transport
+        session: session dict, or None
+        list_of_places
+        stops: places in visiting order
+        geocodes: dict of place to Place
+        route_legs: Legs through the stops that were kept, in order, see
+            bisect_directions
+        dropped: indices of the stops that could not be routed
+        verbose
+        distance_per_point_in_km
+
+        Returns
+        -------
+        the Route, the Route resampled every distance_per_point_in_km and the
+        dict of geocoded Places
+        """
+        for i in dropped:
+            self.logger.warning(
+                "Dropping waypoint {} from the route, no directions could be "
+                "found to or from it".format(stops[i])
+            )
+            self.dropped_waypoints.append(stops[i])
+
+        stops = [stop for i, stop in enumerate(stops) if i not in dropped]
+        edges = list(zip(stops[:-1], stops[1:]))
+        route = Route(route_legs)
+        if len(route_legs) == len(edges):
+            previous_legs = session["legs"] if session else {}
+            self.logger.info(
+                "Session {} ({}): reused {} of {} legs".format(
+                    *session_key,
+                    sum(edge in previous_legs for edge in edges),
+                    len(edges),
+                )
+            )
+            self.route_sessions.set(
+                session_key,
+                stops,
+                {place: geocode for place, geocode in geocodes.items() if geocode},
+                dict(zip(edges, route_legs)),
+            )
+        else:
+            # no directions between the start and the end, the session keeps
+            # its last route
+            self.logger.warning("Session {} ({}): no route found".format(*session_key))
+        if verbose:
+            self.print_route(route)
+
+        mapping_dict = self.mapping_dict_from_geocodes(
+            list_of_places["start"], list_of_places["end"], stops[1:-1], geocodes
+        )
+        sampled_route = self.sample_route_with_legs(route, distance_per_point_in_km)
+        return route, sampled_route, mapping_dict
+
+    def plan_segments(self, list_of_places, geocodes):
+        """
+        Split a trip into segments that each fit in a single directions call,
+        leaving out the waypoints that could not be geocoded and, if
+        optimize_waypoint_order is set, reordering the others first
+
+        Parameters
+        ----------
+        list_of_places
+        geocodes: dict of place to Place, or None for the places that were not found
+
+        Returns
+        -------
+        list of mapping dicts, one per segment in route order
+        """
+        # waypoints that can't be geocoded must not become segment endpoints
+        found_waypoints = []
+        for waypoint in list_of_places["waypoints"]:
+            if geocodes[waypoint] is not None:
+                found_waypoints.append(waypoint)
+            else:
+                self.logger.warning(
+                    "Dropping waypoint {}, it could not be geocoded".format(waypoint)
+                )
+                self.dropped_waypoints.append(waypoint)
+
+        if self.optimize_waypoint_order:
+            found_waypoints = self.order_waypoints(
+                list_of_places["start"],
+                list_of_places["end"],
+                found_waypoints,
+                geocodes,
+            )
+
+        segments = self.split_into_segments(
+            dict(list_of_places, waypoints=found_waypoints)
+        )
+        return [
+            self.mapping_dict_from_geocodes(start, end, waypoints, geocodes)
+            for start, end, waypoints in segments
+        ]
+
+    def order_waypoints(self, start, end, waypoints, geocodes):
+        """
+        Reorder the waypoints to shorten the straight line length of the trip,
+        keeping its start and end
+
+        Parameters
+        ----------
+        start
+        end
+        waypoints
+        geocodes: dict of place to Place for all the places
+
+        Returns
+        -------
+        list of waypoints in visiting order
+        """
+        if len(waypoints) < 2:
+            return list(waypoints)
+
+        places = [start] + list(waypoints) + [end]
+        dist = distance_matrix_km([geocodes[place].location for place in places])
+        order = optimize_order(dist)
+        self.logger.info(
+            "Reordered {} waypoints, straight line length {:.0f} km ==> {:.0f} km".format(
+                len(waypoints),
+                path_length(np.arange(len(places)), dist),
+                path_length(order, dist),
+            )
+        )
+        return [places[i] for i in order[1:-1]]
+
+    def split_into_segments(self, list_of_places):
+        """
+        Split a trip into segments that each fit in a single directions call
+
+        Parameters
+        ----------
+        list_of_places
+
+        Returns
+        -------
+        list of (start, end, waypoints) tuples, in route order
+        """
+        number_of_stops = len(list_of_places["waypoints"])
+        segments = []
+        starting_point = list_of_places["start"]
+        for segment_start in range(0, number_of_stops, self.MAX_WAYPOINTS_API_CALL):
+            segment_end = segment_start + self.MAX_WAYPOINTS_API_CALL
+
+            segment_waypoints = list_of_places["waypoints"][segment_start:segment_end]
+
+            if segment_end >= number_of_stops:
+                # this is the final segment, all its waypoints are visited before the end
+                end_point = list_of_places["end"]
+            else:
+                # the last waypoint becomes the end of this segment
+                end_point = segment_waypoints[-1]
+                segment_waypoints = segment_waypoints[:-1]
+
+            segments.append((starting_point, end_point, segment_waypoints))
+            starting_point = end_point
+
+        return segments
 
     def convert_to_coords(self, input_address):
         """
@@ -154,11 +884,73 @@ class RouteFinder:
 
         Returns
         -------
+        the Place of the best geocode result, or None if the address was not found
+        """
+        place = self.geocode_cache.get_place(input_address)
+        if place is None:
+            geocode_result = self.scheduler.call(
+                "geocode", self.gmaps.geocode, input_address, priority=self.priority
+            )
+            place = self.parse_geocode(input_address, geocode_result)
+
+        return place
+
+    def parse_geocode(self, input_address, geocode_result):
+        """
+
+        Parameters
+        ----------
+        input_address
+        geocode_result
+
+        Returns
+        -------
+        the Place of the best geocode result, or None if the address was not found
+        """
+        # empty results are not cached, the address may resolve on a later attempt
+        if not geocode_result:
+            return None
+        place = Place.from_geocode(geocode_result[0])
+        if self.snap_radius_km:
+            known_place = self.geocode_cache.nearest_place(place, self.snap_radius_km)
+            if known_place is not None and known_place.place_id != place.place_id:
+                self.logger.info(
+                    "Snapping {} to the known place {}".format(
+                        input_address, known_place.address
+                    )
+                )
+                place = known_place
+        self.geocode_cache.set_place(input_address, place)
+        return place
+
+    def geocode_places(self, places, concurrent=None):
+        """
+
+        Parameters
+        ----------
+        places
+        concurrent
 
+        Returns
+        -------
+        dict of place to Place, or None for the places that were not found
         """
-        return self.gmaps.geocode(input_address)
+        if concurrent is None:
+            concurrent = self.max_workers > 1
+
+        unique_places = list(dict.fromkeys(places))
+        if concurrent and len(unique_places) > 1:
+            n_workers = min(self.max_workers, len(unique_places))
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                geocode_results = list(
+                    executor.map(self.convert_to_coords, unique_places)
+                )
+        else:
+            geocode_results = [self.convert_to_coords(p) for p in unique_places]
 
-    def build_mapping_dict(self, start, end, waypoints):
+        return dict(zip(unique_places, geocode_results))
+
+    def build_mapping_dict(self, start, end, waypoints, concurrent=None, geocodes=None):
         """
 
         Parameters
@@ -166,26 +958,63 @@ class RouteFinder:
         start
         end
         waypoints
+        concurrent
+        geocodes: optional dict of place to Place, for places that have already
+            been looked up
 
         Returns
         -------
+        dict of Places, with keys start, end and waypoint_{i}
+        """
+        waypoints = waypoints or []
+        if geocodes is None:
+            geocodes = self.geocode_places(
+                [start, end] + waypoints, concurrent=concurrent
+            )
+        return self.mapping_dict_from_geocodes(start, end, waypoints, geocodes)
 
+    def mapping_dict_from_geocodes(self, start, end, waypoints, geocodes):
         """
+
+        Parameters
+        ----------
+        start
+        end
+        waypoints
+        geocodes: dict of place to Place, or None for the places that were not found
+
+        Returns
+        -------
+        dict of Places, with keys start, end and waypoint_{i}
+        """
+        for location, name in ((start, "start"), (end, "end")):
+            if geocodes[location] is None:
+                raise ValueError(
+                    "Could not geocode the {} of the trip: {}".format(name, location)
+                )
+
         mapping_dict = {}
-        mapping_dict["start"] = self.convert_to_coords(start)[0]
-        mapping_dict["end"] = self.convert_to_coords(end)[0]
+        mapping_dict["start"] = geocodes[start]
+        mapping_dict["end"] = geocodes[end]
 
-        if waypoints:
-            for i, waypoint in enumerate(waypoints):
-                mapping_dict["waypoint_{}".format(i)] = self.convert_to_coords(
-                    waypoint
-                )[0]
+        waypoint_count = 0
+        for waypoint in waypoints:
+            if geocodes[waypoint] is None:
+                self.logger.warning(
+                    "Dropping waypoint {}, it could not be geocoded".format(waypoint)
+                )
+                self.dropped_waypoints.append(waypoint)
+                continue
+            mapping_dict["waypoint_{}".format(waypoint_count)] = geocodes[waypoint]
+            waypoint_count += 1
 
         return mapping_dict
 
     @staticmethod
     def get_route(directions_result):
         """
+        Parse a Google Maps directions result, dropping everything but the leg
+        endpoints, distances, durations and decoded paths
 
         Parameters
         ----------
@@ -193,27 +1022,25 @@ class RouteFinder:
 
         Returns
         -------
-
+        Route
         """
-        waypoints = {}
+        return Route.from_directions(directions_result)
 
-        for leg_number, leg in enumerate(directions_result[0]["legs"]):
-            leg_route = {}
-
-            distance, duration = leg["distance"]["text"], leg["duration"]["text"]
-            leg_route["distance"] = distance
-            leg_route["duration"] = duration
-            leg_route_points = []
+    @staticmethod
+    def get_legacy_route(route):
+        """
+        View of a Route as the dict of legs used before routes were parsed into
+        objects, with the points formatted as "lat,lng" strings
 
-            for step in leg["steps"]:
-                decoded_points = decode_polyline(step["polyline"]["points"])
-                for p in decoded_points:
-                    leg_route_points.append(f'{p["lat"]},{p["lng"]}')
+        Parameters
+        ----------
+        route
 
-            leg_route["route"] = leg_route_points
-            waypoints[leg_number] = leg_route
+        Returns
+        -------
 
-        return waypoints
+        """
+        return route.to_legacy_dict()
 
     def build_directions_and_route(
         self, mapping_dict, start_time=None, transit_type=None, verbose=True
@@ -229,7 +1056,7 @@ class RouteFinder:
 
         Returns
         -------
-
+        Route through the places of the mapping dict
         """
         if not start_time:
             start_time = datetime.now()
@@ -237,119 +1064,435 @@ class RouteFinder:
         if not transit_type:
             transit_type = "driving"
 
+        start, end, waypoints = self.directions_points(mapping_dict)
+
+        if waypoints and transit_type in self.MODES_WITHOUT_WAYPOINTS:
+            # each leg is requested on its own, by the bisection below
+            route = Route()
+            requested = False
+        else:
+            requested = True
+            route = self.request_directions(
+                start,
+                end,
+                waypoints=waypoints,
+                transit_type=transit_type,
+                optimize_waypoints=True,
+                start_time=start_time,
+            )
+            if not route:
+                self.log_bisection_start(waypoints)
+
+        if not route:
+            # if we get here, the google maps call has failed. This is probably because
+            # some of the waypoints could not be routed. Rather than stepping through
+            # every edge, bisect the route to isolate the bad stops and keep using
+            # multi waypoint requests for the healthy parts
+            legs, dropped = self.bisect_directions(
+                [start] + waypoints + [end],
+                transit_type=transit_type,
+                start_time=start_time,
+                failed=requested,
+            )
+            self.record_dropped_waypoints(mapping_dict, dropped)
+            route = Route(legs)
+
+        if verbose:
+            self.print_route(route)
+
+        return route
+
+    @staticmethod
+    def directions_points(mapping_dict):
+        """
+
+        Parameters
+        ----------
+        mapping_dict
+
+        Returns
+        -------
+        start, end and list of waypoints of the mapping dict as place_id strings
+        """
         # use of place_id makes the calls more efficient
         # see https://developers.google.com/maps/documentation/directions/get-directions#Waypoints
-        waypoints = [
-            "place_id:" + mapping_dict[x]["place_id"]
-            for x in mapping_dict.keys()
-            if "waypoint" in x
-        ]
-        start = "place_id:" + mapping_dict["start"]["place_id"]
-        end = "place_id:" + mapping_dict["end"]["place_id"]
-
-        # waypoints = [
-        #     mapping_dict[x]["place_id"]
-        #     for x in mapping_dict.keys()
-        #     if "waypoint" in x
-        # ]
-        # start = mapping_dict["start"]["formatted_address"]
-        # end = mapping_dict["end"]["formatted_address"]
-
-        directions_result = self.gmaps.directions(
-            start,
-            end,
-            waypoints=waypoints,
-            mode=transit_type,
-            units="metric",
-            optimize_waypoints=True,
-            traffic_model="best_guess",
-            departure_time=start_time,
+        waypoint_keys = [x for x in mapping_dict.keys() if "waypoint" in x]
+        waypoints = ["place_id:" + mapping_dict[x].place_id for x in waypoint_keys]
+        start = "place_id:" + mapping_dict["start"].place_id
+        end = "place_id:" + mapping_dict["end"].place_id
+        return start, end, waypoints
+
+    def log_bisection_start(self, waypoints):
+        self.logger.warning(
+            "WARNING, some of the waypoints {} seem to "
+            "have caused issues with the google maps api".format(waypoints)
         )
 
-        # test
-        # directions_result = []
+        self.logger.warning(
+            "Will attempt to isolate the problem waypoints by bisecting the route"
+        )
 
-        if directions_result:
-            full_route = self.get_route(directions_result)
+    def record_dropped_waypoints(self, mapping_dict, dropped):
+        """
 
-        else:
-            # if we get here, the google maps call has failed. This is probably because
-            # the waypoints were not found. We can still make a map by just using the
-            # start and end locations but we need to warn the user that the map won't contain
-            # the waypoints
+        Parameters
+        ----------
+        mapping_dict
+        dropped: indices into the start, waypoints, end sequence of the mapping dict
 
+        Returns
+        -------
+
+        """
+        labels = ["start"] + [x for x in mapping_dict.keys() if "waypoint" in x]
+        labels += ["end"]
+        for i in dropped:
+            dropped_address = mapping_dict[labels[i]].address
             self.logger.warning(
-                "WARNING, some of the waypoints {} seem to"
-                "have caused issues with the google maps api".format(waypoints)
+                "Dropping waypoint {} from the route, no directions could be "
+                "found to or from it".format(dropped_address)
             )
+            self.dropped_waypoints.append(dropped_address)
 
-            self.logger.warning(
-                "Will attempt to step through the directions point by point".format(
-                    start, end
-                )
+    @staticmethod
+    def print_route(route):
+        print("# " * 10)
+        print("Fetched directions")
+        print("# " * 10)
+
+        # print out some stats for the legs of the proposed trip
+        for i, leg in enumerate(route):
+            print(
+                "Stop:" + str(i),
+                leg.start.address,
+                "==> ",
+                leg.end.address,
+                "distance (km): ",
+                leg.distance_km,
+                "traveling Time (hrs): ",
+                leg.duration_hrs,
             )
 
-            all_points = [start] + waypoints + [end]
-            start_time = datetime.now()
-            final_route_dict = {}
-            directions_list = []
-            for i in range(1, len(all_points)):
-                # iterate edge by edge and get the directions between
-                # the points. For some reason this seems better able to
-                # deal with remote waypoints than if we enter "waypoints"
-                # into the directions call
-                p1 = all_points[i]
-                p0 = all_points[i - 1]
-
-                directions_result = self.gmaps.directions(
-                    p0,
-                    p1,
-                    units="metric",
-                    mode=transit_type,
-                    departure_time=start_time,
-                )
-                if directions_result:
-                    route_dict = self.get_route(directions_result)
-                    final_route_dict[i - 1] = route_dict[0]
-                directions_list += directions_result
+    def request_directions(
+        self,
+        origin,
+        destination,
+        waypoints=None,
+        transit_type="driving",
+        optimize_waypoints=False,
+        start_time=None,
+    ):
+        """
+        Rate limited call to the Google Maps directions API, served from the
+        directions cache when the same route was requested in the same
+        departure time bucket
+
+        Parameters
+        ----------
+        origin
+        destination
+        waypoints
+        transit_type
+        optimize_waypoints
+        start_time
 
-            directions_result = directions_list
-            full_route = final_route_dict
+        Returns
+        -------
+        Route, empty if no directions were found
+        """
+        cache_key, params = self.directions_params(
+            origin, destination, waypoints, transit_type, optimize_waypoints, start_time
+        )
+        route = self.directions_cache.get_route(cache_key)
+        if route is not None:
+            return route
 
-        if verbose:
-            print("# " * 10)
-            print("Fetched directions")
-            print("# " * 10)
-
-            if len(directions_result) == 1:
-                # print out some stats for the legs of the proposed trip
-                for i, leg in enumerate(directions_result[0]["legs"]):
-                    print(
-                        "Stop:" + str(i),
-                        leg["start_address"],
-                        "==> ",
-                        leg["end_address"],
-                        "distance (km): ",
-                        leg["distance"]["value"] / 1000,
-                        "traveling Time (hrs): ",
-                        leg["duration"]["value"] / 3600,
-                    )
+        directions_result = self.scheduler.call(
+            "directions", self.gmaps.directions, priority=self.priority, **params
+        )
+        return self.parse_directions(cache_key, directions_result)
+
+    def directions_params(
+        self,
+        origin,
+        destination,
+        waypoints,
+        transit_type,
+        optimize_waypoints,
+        start_time,
+    ):
+        """
+
+        Parameters
+        ----------
+        origin
+        destination
+        waypoints
+        transit_type
+        optimize_waypoints
+        start_time
+
+        Returns
+        -------
+        the directions cache key and the keyword arguments of
+        googlemaps.Client.directions for this request
+        """
+        waypoints = list(waypoints or [])
+        departure_time = self.directions_cache.departure_bucket(
+            start_time or datetime.now(), self.departure_bucket_seconds
+        )
+        cache_key = self.directions_cache.make_key(
+            [origin] + waypoints + [destination],
+            transit_type,
+            optimize_waypoints,
+            departure_time,
+        )
+        params = {
+            "origin": origin,
+            "destination": destination,
+            "waypoints": waypoints or None,
+            "mode": transit_type,
+            "units": "metric",
+            "optimize_waypoints": optimize_waypoints,
+            # the traffic model is only accepted for driving directions
+            "traffic_model": "best_guess" if transit_type == "driving" else None,
+            "departure_time": departure_time,
+        }
+        return cache_key, params
+
+    def parse_directions(self, cache_key, directions_result):
+        """
+
+        Parameters
+        ----------
+        cache_key
+        directions_result
+
+        Returns
+        -------
+        Route, empty if no directions were found
+        """
+        # the raw payload is dropped as soon as it is parsed. Failed requests are
+        # not cached so that they are retried next time
+        route = Route.from_directions(directions_result)
+        if route:
+            self.directions_cache.set_route(cache_key, route)
+
+        return route
+
+    def bisect_directions(
+        self,
+        points,
+        transit_type="driving",
+        start_time=None,
+        failed=False,
+        runs=None,
+        legs=None,
+    ):
+        """
+        Find directions through points when a single call with all of them fails,
+        see bisection_steps
+
+        Parameters
+        ----------
+        points: place strings, from start to end
+        transit_type
+        start_time
+        failed: whether the request through all the points was already made
+            and failed, see bisection_steps
+        runs: optional runs of point indices to fetch, see bisection_steps
+        legs: optional dict of the Legs that are already known, see
+            bisection_steps
+
+        Returns
+        -------
+        list of Legs through the points that were kept, in order, and the sorted
+        indices of the points that were dropped
+        """
+
+        def fetch(run):
+            return self.request_directions(
+                points[run[0]],
+                points[run[-1]],
+                waypoints=[points[i] for i in run[1:-1]],
+                transit_type=transit_type,
+                start_time=start_time,
+            )
+
+        steps = self.bisection_steps(
+            points, self.max_run_points(transit_type), failed, runs, legs
+        )
+        try:
+            pending = next(steps)
+            while True:
+                n_workers = max(1, min(self.max_workers, len(pending)))
+                with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                    pending = steps.send(list(executor.map(fetch, pending)))
+        except StopIteration as stop:
+            return stop.value
+
+    def max_run_points(self, transit_type):
+        """
+
+        Parameters
+        ----------
+        transit_type
+
+        Returns
+        -------
+        the most points, origin and destination included, that a single
+        directions request in this mode can route through
+        """
+        if transit_type in self.MODES_WITHOUT_WAYPOINTS:
+            return 2
+        return self.MAX_WAYPOINTS_API_CALL + 2
+
+    def bisection_steps(
+        self, points, max_run_points=None, failed=False, runs=None, legs=None
+    ):
+        """
+        Generator driving the bisection of a failed directions request, without
+        making any request itself.
+
+        Each value it yields is a level of runs of point indices to fetch, and the
+        Routes found for them must be sent back. Failed runs are split in two and
+        retried at the next level until the failures are isolated to single
+        edges. A waypoint on a failed edge is then dropped and the route is
+        bridged over it. With one bad waypoint, after the first request failed,
+        this makes about 8 requests for 10 points (11 at most) and 11 for 25
+        points (16 at most), in 4 to 6 levels, where one request per edge would
+        make 9 and 24.
+
+        Parameters
+        ----------
+        points: place strings, from start to end
+        max_run_points: if given, the points are first split into runs of at
+            most this many points
+        failed: whether these first runs were already requested and failed, in
+            which case they are split without being requested again
+        runs: optional first runs of point indices to fetch, instead of all the
+            points. The edges between the points outside them must be in legs
+        legs: optional dict of (i, i + 1) point indices to the Legs that are
+            already known, e.g. from the last route of a session
+
+        Returns
+        -------
+        list of Legs through the points that were kept, in order, and the sorted
+        indices of the points that were dropped, as the value of StopIteration
+        """
+        n_points = len(points)
+        legs = dict(legs or {})
+        dropped = set()
+        step = (max_run_points or n_points) - 1
+        if runs is not None:
+            pending = [list(run) for run in runs]
+        else:
+            pending = [
+                list(range(i, min(i + step, n_points - 1) + 1))
+                for i in range(0, n_points - 1, step)
+            ]
+
+        # points with a leg found, which are routable, so that on a failed edge
+        # the other point is the bad one. The start and end are taken to be
+        # routable, since they can't be dropped anyway
+        routable = {0, n_points - 1}
+        for edge in legs:
+            routable.update(edge)
+        # failed edges not settled yet
+        unresolved = []
+        while pending or unresolved:
+            if not pending:
+                results = []
+            elif failed:
+                results, failed = [None] * len(pending), False
             else:
-                # if the directions result has been built from multiple calls
-                for i, leg in enumerate(directions_result):
-                    leg = leg["legs"][0]
-                    print(
-                        "Stop:" + str(i),
-                        leg["start_address"],
-                        "==> ",
-                        leg["end_address"],
-                        "distance (km): ",
-                        leg["distance"]["value"] / 1000,
-                        "traveling Time (hrs): ",
-                        leg["duration"]["value"] / 3600,
+                results = yield pending
+
+            next_pending = []
+            for run, route in zip(pending, results):
+                if route:
+                    for edge, leg in zip(zip(run[:-1], run[1:]), route):
+                        legs[edge] = leg
+                    routable.update(run)
+                elif len(run) == 2:
+                    unresolved.append(tuple(run))
+                else:
+                    mid = len(run) // 2
+                    next_pending += [run[: mid + 1], run[mid:]]
+
+            n_dropped = len(dropped)
+            deferred = []
+            for p0, p1 in unresolved:
+                if p0 in dropped or p1 in dropped:
+                    continue
+                # start and end can never be dropped
+                candidates = [i for i in (p1, p0) if 0 < i < n_points - 1]
+                if not candidates:
+                    self.logger.warning(
+                        "No directions found between {} and {}".format(
+                            points[p0], points[p1]
+                        )
                     )
+                    return [], sorted(dropped)
+                point = self.point_to_drop((p0, p1), candidates, routable)
+                if point is None:
+                    deferred.append((p0, p1))
+                else:
+                    dropped.add(point)
+            if deferred and not next_pending and len(dropped) == n_dropped:
+                # nothing left to learn the bad points from, which only happens
+                # if the same points both were and were not routed
+                p0, p1 = deferred.pop(0)
+                dropped.add(p1 if 0 < p1 < n_points - 1 else p0)
+            unresolved = deferred
+
+            if len(dropped) > n_dropped:
+                # drop the removed points from runs still waiting to be fetched and
+                # bridge the gaps they leave with new requests
+                active = [i for i in range(n_points) if i not in dropped]
+                next_pending = [
+                    [i for i in run if i not in dropped] for run in next_pending
+                ]
+                next_pending = [run for run in next_pending if len(run) > 1]
+                covered = set(unresolved)
+                for run in next_pending:
+                    covered.update(zip(run[:-1], run[1:]))
+                for edge in zip(active[:-1], active[1:]):
+                    if edge not in legs and edge not in covered:
+                        next_pending.append(list(edge))
+
+            pending = next_pending
+
+        active = [i for i in range(n_points) if i not in dropped]
+        return [legs[edge] for edge in zip(active[:-1], active[1:])], sorted(dropped)
+
+    @staticmethod
+    def point_to_drop(edge, candidates, routable):
+        """
+        Pick the point to drop for a failed edge of the bisection: the one that is
+        not known to be routable. When neither is, e.g. on a stretch of failed
+        edges, the edge waits until the bad points around it are dropped and the
+        bridges over them are fetched, so that a routable point between two bad
+        ones is kept
+
+        Parameters
+        ----------
+        edge: (i, j) point indices of the failed edge
+        candidates: the points of the edge that may be dropped
+        routable: indices of the points with a leg found, and of the start and
+            end
 
-        return directions_result, full_route
+        Returns
+        -------
+        index of the point to drop, or None to wait
+        """
+        p0, p1 = edge
+        # if both are routable the edge itself can't be routed, and either goes
+        if p0 in routable and p1 in candidates:
+            return p1
+        if p1 in routable and p0 in candidates:
+            return p0
+        return None
 
     @staticmethod
     def assemble_final_route_from_segments(segment_mapping_dicts, sampled_routes):
@@ -365,18 +1508,16 @@ class RouteFinder:
 
         """
         final_mapping_dict = {}
-        final_sampled_route = {}
 
         final_segment_id = len(segment_mapping_dicts) - 1
         waypoint_count = 0
-        sampled_waypoint_count = 0
 
         for i, segment in enumerate(segment_mapping_dicts):
             # at the start of the route, get the start of the segment
             if i == 0:
                 final_mapping_dict["start"] = segment["start"]
             # at the end of the route, get the final point
-            elif i == final_segment_id:
+            if i == final_segment_id:
                 final_mapping_dict["end"] = segment["end"]
 
             # add all the waypoints in the correct order
@@ -387,60 +1528,28 @@ class RouteFinder:
                     ]
                     waypoint_count += 1
 
-            sampled_route = sampled_routes[i]
-            for k, v in sampled_route.items():
-                final_sampled_route[sampled_waypoint_count] = v
-                sampled_waypoint_count += 1
+            # the end of an intermediate segment is itself a waypoint of the trip
+            if i != final_segment_id:
+                final_mapping_dict["waypoint_{}".format(waypoint_count)] = segment[
+                    "end"
+                ]
+                waypoint_count += 1
 
-        return final_mapping_dict, final_sampled_route
+        return final_mapping_dict, Route.concatenate(sampled_routes)
 
     @staticmethod
     def sample_route_with_legs(route, distance_per_point_in_km=0.25):
         """
+        Resample each leg of a route so that its points are evenly spaced,
+        distance_per_point_in_km apart
 
         Parameters
         ----------
         route
-        npoints
+        distance_per_point_in_km
 
         Returns
         -------
-
+        Route
         """
-        # get total distance
-        all_distances = sum([float(route[i]["distance"].split(" ")[0].replace(",","")) for i in route])
-
-        # find distance per point
-        npoints = int(np.ceil(all_distances / distance_per_point_in_km))
-
-        # get actual points per leg
-        points_per_leg = [len(v["route"]) for k, v in route.items()]
-        total_points = sum(points_per_leg)
-
-        # get fraction of total points that need to be represented on each leg
-        n_sampled_per_leg = [
-            max(1, np.round(npoints * (x / total_points), 0)) for x in points_per_leg
-        ]
-
-        sampled_points = {}
-        for leg_id, route_info in route.items():
-            total_points = int(points_per_leg[leg_id])
-            total_sampled_points = int(n_sampled_per_leg[leg_id])
-            step_size = int(max(total_points // total_sampled_points, 1.0))
-            route_sampled = [
-                route_info["route"][idx] for idx in range(0, total_points, step_size)
-            ]
-
-            distance = route_info["distance"]
-            duration = route_info["duration"]
-
-            sampled_points[leg_id] = {
-                "route": [
-                    (float(x.split(",")[0]), float(x.split(",")[1]))
-                    for x in route_sampled
-                ],
-                "duration": duration,
-                "distance": distance,
-            }
-
-        return sampled_points
+        return route.resample(distance_per_point_in_km)
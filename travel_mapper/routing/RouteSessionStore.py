@@ -0,0 +1,110 @@
+from travel_mapper.constants import (
+    ROUTE_SESSIONS_MAX_ENTRIES,
+    ROUTE_SESSION_TTL_SECONDS,
+)
+from collections import OrderedDict
+import threading
+import time
+
+
+class RouteSessionStore:
+    """
+    In memory store of the last route built for each planning session, so that
+    a trip edited by the user can be re-routed from the parts that did not
+    change.
+
+    A session is a dict with the stops of the route in visiting order, the
+    geocoded Places by place string and the Legs by (from, to) pair of place
+    strings. Legs are left out of their session ttl_seconds after they were
+    first saved, as their travel times go stale, even when the session keeps
+    reusing them. Sessions not saved again for ttl_seconds expire, and the
+    least recently used ones are evicted beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        max_entries=ROUTE_SESSIONS_MAX_ENTRIES,
+        ttl_seconds=ROUTE_SESSION_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """
+
+        Parameters
+        ----------
+        session_id
+
+        Returns
+        -------
+        the session dict without its stale legs, or None if there is none or it
+        expired
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            updated, session, leg_times = entry
+            if self.ttl_seconds is not None and now - updated > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            if self.ttl_seconds is None:
+                return session
+            return dict(
+                session,
+                legs={
+                    edge: leg
+                    for edge, leg in session["legs"].items()
+                    if now - leg_times[edge] <= self.ttl_seconds
+                },
+            )
+
+    def set(self, session_id, stops, geocodes, legs):
+        """
+
+        Parameters
+        ----------
+        session_id
+        stops: place strings in visiting order
+        geocodes: dict of place string to Place
+        legs: dict of (from, to) place strings to Leg
+
+        Returns
+        -------
+
+        """
+        now = time.time()
+        with self._lock:
+            # legs carried over from the last route keep the time they were
+            # first saved at
+            entry = self._sessions.get(session_id)
+            previous_legs, previous_times = (
+                (entry[1]["legs"], entry[2]) if entry else ({}, {})
+            )
+            leg_times = {
+                edge: previous_times[edge] if previous_legs.get(edge) is leg else now
+                for edge, leg in legs.items()
+            }
+            self._sessions[session_id] = (
+                now,
+                {"stops": list(stops), "geocodes": geocodes, "legs": legs},
+                leg_times,
+            )
+            self._sessions.move_to_end(session_id)
+            while (
+                self.max_entries is not None and len(self._sessions) > self.max_entries
+            ):
+                self._sessions.popitem(last=False)
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,203 @@
+from travel_mapper.routing.GeocodeCache import GeocodeCache
+from travel_mapper.routing.maps_clients import warm_up_maps_client_once
+from travel_mapper.constants import SPECULATION_TIMEOUT_SECONDS
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import googlemaps
+import threading
+import logging
+import re
+
+logging.basicConfig(level=logging.INFO)
+
+# a capitalized word, e.g. "York", or an abbreviation such as "D.C." or "St."
+WORD = r"(?:[A-Z](?:\.[A-Z])+\.?|[A-Z][a-z]?\.(?= )|[A-Z][\w'-]*)"
+# a place name as typed in a query: capitalized words on one line, possibly
+# separated by commas, e.g. "Berkeley, CA" or "Stratford upon Avon"
+PLACE = r"{0}(?:,?[ \t]+(?:(?:of|de|del|la|le|upon|on)[ \t]+)?{0})*".format(WORD)
+ENDPOINT_PATTERNS = [
+    re.compile(r"(?i:\bfrom)\s+(?P<start>{0})\s+(?i:to)\s+(?P<end>{0})".format(PLACE)),
+    re.compile(
+        r"(?i:\bbetween)\s+(?P<start>{0})\s+(?i:and)\s+(?P<end>{0})".format(PLACE)
+    ),
+    re.compile(r"(?i:\bstart(?:ing)?\s+(?:in|at|from))\s+(?P<start>{})".format(PLACE)),
+    re.compile(r"(?i:\bend(?:ing)?\s+(?:in|at))\s+(?P<end>{})".format(PLACE)),
+]
+
+
+class SpeculativeGeocoder:
+    """
+    Geocode the start and end of a trip as stated in the user's query, while
+    the agent is still writing the itinerary, so that geocoding them is off the
+    critical path.
+
+    speculate() extracts the likely endpoints and geocodes them in the
+    background. Once the agent has produced the trip, reconcile() matches its
+    start and end with the speculated places and seeds the geocode cache with
+    those that agree, so that the RouteFinder finds them there.
+    """
+
+    def __init__(self, route_finder, max_workers=2):
+        """
+
+        Parameters
+        ----------
+        route_finder: RouteFinder whose client and geocode cache are used
+        max_workers
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.route_finder = route_finder
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # concurrent speculations on the same place share a single request
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def extract_endpoints(query):
+        """
+
+        Parameters
+        ----------
+        query
+
+        Returns
+        -------
+        dict with the start and end places named in the query, None for those
+        that could not be found
+        """
+        endpoints = {"start": None, "end": None}
+        for pattern in ENDPOINT_PATTERNS:
+            match = pattern.search(query)
+            if match is None:
+                continue
+            for key, place in match.groupdict().items():
+                if endpoints[key] is None:
+                    endpoints[key] = place.rstrip(".,")
+        return endpoints
+
+    def speculate(self, query):
+        """
+        Start geocoding the endpoints named in the query
+
+        Parameters
+        ----------
+        query
+
+        Returns
+        -------
+        dict of start and end to the place named in the query and the future of
+        its Place, or None
+        """
+        gmaps = self.route_finder.gmaps
+        if isinstance(gmaps, googlemaps.Client):
+            # the directions requests will reuse this connection, which only
+            # needs opening on the first query
+            warm_up_maps_client_once(gmaps)
+
+        speculation = {}
+        for key, place in self.extract_endpoints(query).items():
+            speculation[key] = None if place is None else (place, self._geocode(place))
+        self.logger.info(
+            "Speculatively geocoding {}".format(
+                [s[0] for s in speculation.values() if s is not None]
+            )
+        )
+        return speculation
+
+    def _geocode(self, place):
+        key = GeocodeCache.normalize_address(place)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self.executor.submit(
+                    self.route_finder.convert_to_coords, place
+                )
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._done(key))
+            return future
+
+    def _done(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    @staticmethod
+    def same_place(address, guess, place):
+        """
+        Whether an address given by the agent names the place speculated from
+        the query: all its words must appear in what the user wrote or in the
+        geocoded address, e.g. "Berkeley, CA" for "Berkeley CA" geocoded to
+        "Berkeley, CA, USA", but not "Paris, Texas" for "Paris"
+
+        Parameters
+        ----------
+        address
+        guess: place as named in the query
+        place: geocoded Place of the guess
+
+        Returns
+        -------
+
+        """
+        words = set(GeocodeCache.normalize_address(address).split())
+        guess_words = set(GeocodeCache.normalize_address(guess).split())
+        known_words = guess_words | set(
+            GeocodeCache.normalize_address(place.address).split()
+        )
+        return bool(words & guess_words) and words <= known_words
+
+    def reconcile(
+        self, speculation, list_of_places, timeout=SPECULATION_TIMEOUT_SECONDS
+    ):
+        """
+        Seed the geocode cache with the speculated places that match the start
+        and end of the trip
+
+        Parameters
+        ----------
+        speculation: output of speculate
+        list_of_places: trip produced by the agent
+        timeout: longest wait for a speculated place still being geocoded
+
+        Returns
+        -------
+        number of endpoints that were speculated right
+        """
+        n_hits = 0
+        for key, guess in speculation.items():
+            if guess is None or not list_of_places:
+                continue
+            name, future = guess
+            address = list_of_places[key]
+            try:
+                place = future.result(timeout=timeout)
+            except TimeoutError:
+                place = None
+            except Exception as e:
+                self.logger.warning("Speculative geocoding failed: {}".format(e))
+                place = None
+
+            if place is not None and self.same_place(address, name, place):
+                n_hits += 1
+                if self.route_finder.geocode_cache.get_place(address) is None:
+                    self.route_finder.geocode_cache.set_place(address, place)
+            else:
+                self.logger.info(
+                    "Speculated {} {} but the trip has {}".format(key, name, address)
+                )
+        with self._lock:
+            self.hits += n_hits
+            self.misses += sum(guess is not None for guess in speculation.values())
+            self.misses -= n_hits
+        return n_hits
+
+    def stats(self):
+        """
+
+        Returns
+        -------
+        dict with the number of endpoints speculated right and wrong
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
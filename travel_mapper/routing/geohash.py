@@ -0,0 +1,97 @@
+from travel_mapper.routing.geometry import EARTH_RADIUS_KM
+import math
+
+# base 32 alphabet of geohashes, without a, i, l and o
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(lat, lng, precision=6):
+    """
+    Geohash of a location: the cells of a grid that halves in longitude and
+    latitude in turn with every bit, so that nearby locations share a prefix
+
+    Parameters
+    ----------
+    lat
+    lng
+    precision: number of characters, 5 bits each
+
+    Returns
+    -------
+    geohash string
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    n_bits = 0
+    even = True
+    while len(geohash) < precision:
+        # even bits split the longitude, odd ones the latitude
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        n_bits += 1
+        if n_bits == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            n_bits = 0
+    return "".join(geohash)
+
+
+def cell_size(precision):
+    """
+
+    Parameters
+    ----------
+    precision
+
+    Returns
+    -------
+    height and width in degrees of the cells of this precision
+    """
+    n_bits = 5 * precision
+    lng_bits = (n_bits + 1) // 2
+    lat_bits = n_bits // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lng_bits
+
+
+def cells_within(lat, lng, radius_km, precision=6):
+    """
+    Geohashes of the cells that may hold locations within radius_km of a
+    location
+
+    Parameters
+    ----------
+    lat
+    lng
+    radius_km
+    precision
+
+    Returns
+    -------
+    set of geohash strings
+    """
+    height, width = cell_size(precision)
+    km_per_degree = math.pi * EARTH_RADIUS_KM / 180
+    radius_lat = radius_km / km_per_degree
+    # the cells narrow towards the poles, where every longitude is near
+    cos_lat = math.cos(math.radians(min(abs(lat) + radius_lat, 90.0)))
+    radius_lng = 180.0 if cos_lat < 1e-6 else radius_km / (km_per_degree * cos_lat)
+    n_rows = int(math.ceil(radius_lat / height))
+    n_columns = min(int(math.ceil(radius_lng / width)), int(180 / width))
+
+    cells = set()
+    for row in range(-n_rows, n_rows + 1):
+        cell_lat = max(-90.0, min(90.0 - 1e-9, lat + row * height))
+        for column in range(-n_columns, n_columns + 1):
+            # wrap around the antimeridian
+            cell_lng = (lng + column * width + 180.0) % 360.0 - 180.0
+            cells.add(encode(cell_lat, cell_lng, precision))
+    return cells
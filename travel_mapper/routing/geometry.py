@@ -0,0 +1,147 @@
+import numpy as np
+import heapq
+
+# mean radius of the earth
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Great circle distance between points given in degrees, works elementwise
+    on arrays
+
+    Parameters
+    ----------
+    lat1
+    lng1
+    lat2
+    lng2
+
+    Returns
+    -------
+    distance in km
+    """
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def cumulative_distance_km(path):
+    """
+
+    Parameters
+    ----------
+    path: (N, 2) array of lat, lng
+
+    Returns
+    -------
+    array of N distances along the path, starting at 0
+    """
+    steps = haversine_km(path[:-1, 0], path[:-1, 1], path[1:, 0], path[1:, 1])
+    return np.concatenate(([0.0], np.cumsum(steps)))
+
+
+def resample_path(path, n_intervals):
+    """
+    Interpolate n_intervals + 1 points evenly spaced along a path, keeping
+    both of its ends
+
+    Parameters
+    ----------
+    path: (N, 2) array of lat, lng
+    n_intervals
+
+    Returns
+    -------
+    (n_intervals + 1, 2) array of lat, lng
+    """
+    if len(path) < 2:
+        return path.copy()
+
+    distance_along = cumulative_distance_km(path)
+    if distance_along[-1] == 0:
+        return path[[0, -1]]
+
+    targets = np.linspace(0, distance_along[-1], n_intervals + 1)
+    return np.column_stack(
+        (
+            np.interp(targets, distance_along, path[:, 0]),
+            np.interp(targets, distance_along, path[:, 1]),
+        )
+    )
+
+
+def _farthest_from_chord(xy, i, j):
+    """
+    Find the point between i and j farthest from the segment joining them
+
+    Parameters
+    ----------
+    xy: (N, 2) array of projected coordinates in km
+    i
+    j
+
+    Returns
+    -------
+    distance in km and index of the farthest point
+    """
+    inner = xy[i + 1 : j]
+    start, chord = xy[i], xy[j] - xy[i]
+    chord_length_sq = chord @ chord
+    if chord_length_sq == 0:
+        distances = np.hypot(*(inner - start).T)
+    else:
+        t = np.clip((inner - start) @ chord / chord_length_sq, 0, 1)
+        distances = np.hypot(*(inner - start - t[:, None] * chord).T)
+    k = int(np.argmax(distances))
+    return distances[k], i + 1 + k
+
+
+def simplify_path(path, tolerance_km=0.0, max_points=None):
+    """
+    Douglas-Peucker simplification that refines the most significant segment
+    first, so that it can stop either when every dropped point is within
+    tolerance_km of the simplified line or when max_points are kept
+
+    Parameters
+    ----------
+    path: (N, 2) array of lat, lng
+    tolerance_km
+    max_points
+
+    Returns
+    -------
+    (M, 2) array of lat, lng, a subset of the path including both ends
+    """
+    n_points = len(path)
+    max_points = n_points if max_points is None else max(2, max_points)
+    if n_points <= 2 or (tolerance_km <= 0 and max_points >= n_points):
+        return path.copy()
+
+    # an equirectangular projection is good enough to rank points for display
+    km_per_degree = np.radians(EARTH_RADIUS_KM)
+    xy = np.column_stack(
+        (
+            path[:, 1] * np.cos(np.radians(path[:, 0].mean())) * km_per_degree,
+            path[:, 0] * km_per_degree,
+        )
+    )
+
+    keep = [0, n_points - 1]
+    distance, k = _farthest_from_chord(xy, 0, n_points - 1)
+    heap = [(-distance, 0, n_points - 1, k)]
+
+    while heap and len(keep) < max_points:
+        neg_distance, i, j, k = heapq.heappop(heap)
+        if -neg_distance <= tolerance_km:
+            break
+        keep.append(k)
+        for a, b in ((i, k), (k, j)):
+            if b - a > 1:
+                distance, farthest = _farthest_from_chord(xy, a, b)
+                heapq.heappush(heap, (-distance, a, b, farthest))
+
+    return path[np.sort(keep)]
@@ -0,0 +1,202 @@
+from travel_mapper.constants import (
+    GOOGLE_MAPS_BASE_URL,
+    GOOGLE_MAPS_MAX_CONNECTIONS,
+    GOOGLE_MAPS_POOL_HOSTS,
+    GOOGLE_MAPS_KEEP_ALIVE,
+    GOOGLE_MAPS_TIMEOUT_SECONDS,
+)
+from requests.adapters import HTTPAdapter
+import googlemaps
+import requests
+import threading
+import logging
+import weakref
+import os
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+# clients already warmed up in this process, whose pools keep the connection
+_warmed_clients = weakref.WeakSet()
+
+
+class NonRetryingClient(googlemaps.Client):
+    """
+    googlemaps.Client that raises server errors as
+    googlemaps.exceptions.HTTPError instead of retrying them itself, so that the
+    QuotaScheduler is the only layer retrying requests
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # status of the last response of each thread, read when the client
+        # retries it
+        self._last_status = threading.local()
+        self.session.hooks["response"].append(self._record_status)
+
+    def _record_status(self, response, *args, **kwargs):
+        self._last_status.code = response.status_code
+
+    def _request(
+        self, url, params, first_request_time=None, retry_counter=0, *args, **kwargs
+    ):
+        # googlemaps.Client retries by calling _request again straight away, so
+        # a retry is the error of the previous response, or a retriable body
+        if retry_counter > 0:
+            status = getattr(self._last_status, "code", None)
+            if status in googlemaps.client._RETRIABLE_STATUSES:
+                raise googlemaps.exceptions.HTTPError(status)
+            raise googlemaps.exceptions._RetriableRequest()
+        return super()._request(
+            url, params, first_request_time, retry_counter, *args, **kwargs
+        )
+
+
+def make_maps_client(
+    google_maps_api_key,
+    base_url=GOOGLE_MAPS_BASE_URL,
+    max_connections=GOOGLE_MAPS_MAX_CONNECTIONS,
+    pool_hosts=GOOGLE_MAPS_POOL_HOSTS,
+    keep_alive=GOOGLE_MAPS_KEEP_ALIVE,
+    timeout_seconds=GOOGLE_MAPS_TIMEOUT_SECONDS,
+):
+    """
+    googlemaps.Client on a requests session with a connection pool sized for
+    the threads of the RouteFinders that share it
+
+    Parameters
+    ----------
+    google_maps_api_key
+    base_url
+    max_connections: connections kept open per host, as many as threads making
+        requests concurrently
+    pool_hosts: number of hosts with a pool
+    keep_alive: keep connections open between requests. If False every request
+        opens a new one
+    timeout_seconds
+
+    Returns
+    -------
+    NonRetryingClient
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=max_connections)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+
+    # requests refused for the quota or failed with a server error are retried
+    # by the QuotaScheduler rather than by the client, so that the retries queue
+    # with every other request
+    return NonRetryingClient(
+        key=google_maps_api_key,
+        base_url=base_url,
+        timeout=timeout_seconds,
+        retry_over_query_limit=False,
+        requests_session=session,
+    )
+
+
+def get_shared_maps_client(
+    google_maps_api_key, base_url=GOOGLE_MAPS_BASE_URL, **kwargs
+):
+    """
+    Return the process wide client for this key and url, so that every
+    RouteFinder reuses the same open connections instead of paying a TLS
+    handshake on its first request. Keyword arguments are passed to
+    make_maps_client and are part of the key of the registry
+
+    Parameters
+    ----------
+    google_maps_api_key
+    base_url
+    kwargs
+
+    Returns
+    -------
+    googlemaps.Client
+    """
+    # the pid is part of the key as well, in case a child process is started
+    # without going through os.fork
+    key = (
+        google_maps_api_key,
+        base_url.rstrip("/"),
+        os.getpid(),
+        tuple(sorted(kwargs.items())),
+    )
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            _shared_clients[key] = make_maps_client(
+                google_maps_api_key, base_url.rstrip("/"), **kwargs
+            )
+        return _shared_clients[key]
+
+
+def warm_up_maps_client(client, background=True):
+    """
+    Open a connection to the API ahead of the first request, which then skips
+    the TLS handshake
+
+    Parameters
+    ----------
+    client: googlemaps.Client
+    background: don't wait for the connection to be opened
+
+    Returns
+    -------
+    the thread opening the connection if background, otherwise whether it
+    was opened
+    """
+
+    def warm_up():
+        try:
+            client.session.head(client.base_url, timeout=client.timeout)
+            return True
+        except requests.RequestException as e:
+            logger.warning("Could not warm up the maps client: {}".format(e))
+            return False
+
+    if not background:
+        return warm_up()
+    thread = threading.Thread(target=warm_up, daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up_maps_client_once(client, background=True):
+    """
+    Warm up the client unless it was already warmed up in this process, so that
+    callers that warm up on every query only send the first request
+
+    Parameters
+    ----------
+    client: googlemaps.Client
+    background: don't wait for the connection to be opened
+
+    Returns
+    -------
+    as warm_up_maps_client, or None if the client was already warmed up
+    """
+    with _shared_clients_lock:
+        if client in _warmed_clients:
+            return None
+        _warmed_clients.add(client)
+    return warm_up_maps_client(client, background=background)
+
+
+def _reset_after_fork():
+    """
+    Drop the clients inherited from the parent process, whose connections are
+    shared with it, and the lock in case it was held during the fork
+    """
+    global _shared_clients_lock
+    _shared_clients.clear()
+    _warmed_clients.clear()
+    _shared_clients_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
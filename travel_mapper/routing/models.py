@@ -0,0 +1,336 @@
+from travel_mapper.routing.polyline import decode_polylines, encode_polyline
+from travel_mapper.routing.geometry import (
+    resample_path,
+    simplify_path,
+)
+import numpy as np
+
+
+class Place:
+    """
+    A geocoded location, keeping only the fields the route pipeline uses
+    """
+
+    __slots__ = ("address", "place_id", "lat", "lng")
+
+    def __init__(self, address, lat, lng, place_id=None):
+        self.address = address
+        self.place_id = place_id
+        self.lat = lat
+        self.lng = lng
+
+    @classmethod
+    def from_geocode(cls, geocode_result):
+        """
+
+        Parameters
+        ----------
+        geocode_result: a single result of the Google Maps geocode API
+
+        Returns
+        -------
+
+        """
+        location = geocode_result["geometry"]["location"]
+        return cls(
+            address=geocode_result["formatted_address"],
+            lat=location["lat"],
+            lng=location["lng"],
+            place_id=geocode_result["place_id"],
+        )
+
+    @classmethod
+    def from_dict(cls, place_dict):
+        return cls(**place_dict)
+
+    def to_dict(self):
+        return {
+            "address": self.address,
+            "lat": self.lat,
+            "lng": self.lng,
+            "place_id": self.place_id,
+        }
+
+    @property
+    def location(self):
+        return [self.lat, self.lng]
+
+    def __eq__(self, other):
+        return isinstance(other, Place) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "Place({!r}, {}, {})".format(self.address, self.lat, self.lng)
+
+
+class Leg:
+    """
+    One leg of a route between two stops. The path is a (N, 2) float64 array of
+    lat, lng points, distance is in metres and duration in seconds.
+    """
+
+    __slots__ = (
+        "start",
+        "end",
+        "distance",
+        "duration",
+        "distance_text",
+        "duration_text",
+        "path",
+    )
+
+    def __init__(
+        self, start, end, distance, duration, distance_text, duration_text, path
+    ):
+        self.start = start
+        self.end = end
+        self.distance = distance
+        self.duration = duration
+        self.distance_text = distance_text
+        self.duration_text = duration_text
+        self.path = path
+
+    @classmethod
+    def from_directions_leg(cls, leg):
+        """
+        Parse a leg of a Google Maps directions result, decoding the polylines of
+        all its steps into one path
+
+        Parameters
+        ----------
+        leg
+
+        Returns
+        -------
+
+        """
+        return cls(
+            start=Place(
+                leg["start_address"],
+                leg["start_location"]["lat"],
+                leg["start_location"]["lng"],
+            ),
+            end=Place(
+                leg["end_address"],
+                leg["end_location"]["lat"],
+                leg["end_location"]["lng"],
+            ),
+            distance=leg["distance"]["value"],
+            duration=leg["duration"]["value"],
+            distance_text=leg["distance"]["text"],
+            duration_text=leg["duration"]["text"],
+            path=decode_polylines(
+                [step["polyline"]["points"] for step in leg["steps"]]
+            ),
+        )
+
+    @classmethod
+    def from_dict(cls, leg_dict):
+        leg_dict = dict(leg_dict)
+        leg_dict["start"] = Place.from_dict(leg_dict["start"])
+        leg_dict["end"] = Place.from_dict(leg_dict["end"])
+        leg_dict["path"] = decode_polylines([leg_dict.pop("polyline")])
+        return cls(**leg_dict)
+
+    def to_dict(self):
+        """
+        JSON serializable form of the leg, with the path as an encoded polyline
+
+        Returns
+        -------
+
+        """
+        return {
+            "start": self.start.to_dict(),
+            "end": self.end.to_dict(),
+            "distance": self.distance,
+            "duration": self.duration,
+            "distance_text": self.distance_text,
+            "duration_text": self.duration_text,
+            "polyline": encode_polyline(self.path),
+        }
+
+    def with_path(self, path):
+        """
+
+        Parameters
+        ----------
+        path
+
+        Returns
+        -------
+        copy of this leg following a different path
+        """
+        return Leg(
+            self.start,
+            self.end,
+            self.distance,
+            self.duration,
+            self.distance_text,
+            self.duration_text,
+            path,
+        )
+
+    @property
+    def distance_km(self):
+        return self.distance / 1000
+
+    @property
+    def duration_hrs(self):
+        return self.duration / 3600
+
+    def __repr__(self):
+        return "Leg({!r} ==> {!r}, {}, {})".format(
+            self.start.address, self.end.address, self.distance_text, self.duration_text
+        )
+
+
+class Route:
+    """
+    Ordered legs of a trip
+    """
+
+    __slots__ = ("legs",)
+
+    def __init__(self, legs=None):
+        self.legs = list(legs or [])
+
+    @classmethod
+    def from_directions(cls, directions_result):
+        """
+        Parse the legs of every result of a Google Maps directions call. Nothing of
+        the raw payload is kept.
+
+        Parameters
+        ----------
+        directions_result
+
+        Returns
+        -------
+
+        """
+        return cls(
+            Leg.from_directions_leg(leg)
+            for directions in directions_result
+            for leg in directions["legs"]
+        )
+
+    @classmethod
+    def concatenate(cls, routes):
+        return cls(leg for route in routes for leg in route.legs)
+
+    @classmethod
+    def from_dict(cls, route_dict):
+        return cls(Leg.from_dict(leg) for leg in route_dict["legs"])
+
+    def to_dict(self):
+        return {"legs": [leg.to_dict() for leg in self.legs]}
+
+    def __len__(self):
+        return len(self.legs)
+
+    def __iter__(self):
+        return iter(self.legs)
+
+    def __getitem__(self, i):
+        return self.legs[i]
+
+    def __bool__(self):
+        return bool(self.legs)
+
+    @property
+    def distance(self):
+        return sum(leg.distance for leg in self.legs)
+
+    @property
+    def duration(self):
+        return sum(leg.duration for leg in self.legs)
+
+    @property
+    def stops(self):
+        """
+        The start of every leg and the end of the last one
+
+        Returns
+        -------
+
+        """
+        if not self.legs:
+            return []
+        return [leg.start for leg in self.legs] + [self.legs[-1].end]
+
+    def resample(self, distance_per_point_in_km):
+        """
+        Resample each leg so that its points are evenly spaced,
+        distance_per_point_in_km apart
+
+        Parameters
+        ----------
+        distance_per_point_in_km
+
+        Returns
+        -------
+
+        """
+        # the number of points comes from the road distance reported by the API,
+        # and they are placed along the polyline by interpolation
+        return Route(
+            leg.with_path(
+                resample_path(
+                    leg.path,
+                    max(1, int(np.ceil(leg.distance_km / distance_per_point_in_km))),
+                )
+            )
+            for leg in self.legs
+        )
+
+    def simplify(self, tolerance_km=0.0, max_points=None):
+        """
+        Simplify every leg, sharing a budget of max_points between the legs in
+        proportion to their length
+
+        Parameters
+        ----------
+        tolerance_km
+        max_points
+
+        Returns
+        -------
+
+        """
+        budgets = [None] * len(self.legs)
+        if max_points is not None and self.legs:
+            total_distance = self.distance
+            for i, leg in enumerate(self.legs):
+                if total_distance:
+                    share = leg.distance / total_distance
+                else:
+                    share = 1 / len(self.legs)
+                budgets[i] = max(2, int(max_points * share))
+
+        return Route(
+            leg.with_path(
+                simplify_path(leg.path, tolerance_km=tolerance_km, max_points=budget)
+            )
+            for leg, budget in zip(self.legs, budgets)
+        )
+
+    def to_legacy_dict(self):
+        """
+        The route in the dict of legs format used before these classes existed,
+        with each point as a "lat,lng" string
+
+        Returns
+        -------
+
+        """
+        return {
+            i: {
+                "distance": leg.distance_text,
+                "duration": leg.duration_text,
+                "route": ["{},{}".format(lat, lng) for lat, lng in leg.path.tolist()],
+            }
+            for i, leg in enumerate(self.legs)
+        }
+
+    def __repr__(self):
+        return "Route({} legs, {} km)".format(len(self.legs), self.distance / 1000)
@@ -0,0 +1,265 @@
+from travel_mapper.routing.geometry import EARTH_RADIUS_KM
+import numpy as np
+
+# improvements smaller than this, in km, are treated as rounding noise
+IMPROVEMENT_TOLERANCE_KM = 1e-9
+# number of closest points considered for each point by 2-opt
+NEIGHBOURS = 10
+
+
+def distance_matrix_km(coords):
+    """
+
+    Parameters
+    ----------
+    coords: (N, 2) array of lat, lng
+
+    Returns
+    -------
+    (N, N) array of great circle distances in km
+    """
+    # from the chord between unit vectors, with a single (N, N) array updated in
+    # place rather than the several temporaries of haversine_km
+    lat, lng = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2)).T
+    unit = np.column_stack(
+        (np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat))
+    )
+    dist = unit @ unit.T
+    # half chord squared is (1 - cos(angle)) / 2
+    np.subtract(1, dist, out=dist)
+    dist /= 2
+    np.clip(dist, 0, 1, out=dist)
+    np.sqrt(dist, out=dist)
+    np.arcsin(dist, out=dist)
+    dist *= 2 * EARTH_RADIUS_KM
+    # rounding leaves about 0.1 m on the diagonal
+    np.fill_diagonal(dist, 0)
+    return dist
+
+
+def path_length(order, dist):
+    """
+
+    Parameters
+    ----------
+    order: indices of the points, in visiting order
+    dist: distance matrix
+
+    Returns
+    -------
+    total length of the open path
+    """
+    order = np.asarray(order)
+    return float(dist[order[:-1], order[1:]].sum())
+
+
+def nearest_neighbour_order(dist):
+    """
+    Open path from the first point to the last one, always moving on to the
+    closest point not visited yet
+
+    Parameters
+    ----------
+    dist: (N, N) distance matrix
+
+    Returns
+    -------
+    array of point indices, starting at 0 and ending at N - 1
+    """
+    n = len(dist)
+    if n <= 3:
+        return np.arange(n)
+
+    visited = np.zeros(n, dtype=bool)
+    visited[[0, n - 1]] = True
+    order = [0]
+    for _ in range(n - 2):
+        distances = np.where(visited, np.inf, dist[order[-1]])
+        next_point = int(np.argmin(distances))
+        visited[next_point] = True
+        order.append(next_point)
+    order.append(n - 1)
+    return np.array(order)
+
+
+def nearest_neighbours(dist, k):
+    """
+
+    Parameters
+    ----------
+    dist: (N, N) distance matrix
+    k
+
+    Returns
+    -------
+    (N, min(k, N - 1)) array with the indices of the closest other points
+    """
+    n = len(dist)
+    k = min(k, n - 1)
+    # the k + 1 closest points include the point itself, unless it has
+    # duplicates. Either way the point itself or the farthest one is left out
+    candidates = np.argpartition(dist, k, axis=1)[:, : k + 1]
+    rows = np.arange(n)[:, None]
+    distances = np.where(candidates == rows, np.inf, dist[rows, candidates])
+    keep = np.argsort(distances, axis=1)[:, :k]
+    return np.take_along_axis(candidates, keep, axis=1)
+
+
+def two_opt(order, dist, neighbours=None):
+    """
+    Repeatedly reverse the section of the path that most shortens it, until no
+    reversal helps. The first and last points stay in place.
+
+    Only the reversals that connect a point to one of its closest points are
+    considered, which finds nearly all the useful ones at a fraction of the cost
+    of checking every pair of edges
+
+    Parameters
+    ----------
+    order: array of point indices
+    dist: distance matrix
+    neighbours: output of nearest_neighbours, computed if not given
+
+    Returns
+    -------
+    improved order
+    """
+    order = np.array(order)
+    n = len(order)
+    if n <= 3:
+        return order
+
+    if neighbours is None:
+        neighbours = nearest_neighbours(dist, NEIGHBOURS)
+    k = neighbours.shape[1]
+    positions = np.empty(n, dtype=np.int64)
+    while True:
+        positions[order] = np.arange(n)
+        # reversing order[a + 1 : b + 1] replaces the edges leaving positions a and
+        # b with edges from order[a] to order[b] and from order[a + 1] to order[b + 1]
+        first = np.repeat(np.arange(n - 1), k)
+        second = positions[neighbours[order[:-1]].ravel()]
+        a = np.minimum(first, second)
+        b = np.maximum(first, second)
+        valid = (a < b) & (b < n - 1)
+        a, b = a[valid], b[valid]
+        if not len(a):
+            return order
+
+        delta = (
+            dist[order[a], order[b]]
+            + dist[order[a + 1], order[b + 1]]
+            - dist[order[a], order[a + 1]]
+            - dist[order[b], order[b + 1]]
+        )
+        best = np.argmin(delta)
+        if delta[best] >= -IMPROVEMENT_TOLERANCE_KM:
+            return order
+        a, b = a[best], b[best]
+        order[a + 1 : b + 1] = order[a + 1 : b + 1][::-1].copy()
+
+
+def or_opt(order, dist, max_segment_length=3, neighbours=None):
+    """
+    Repeatedly move the run of up to max_segment_length consecutive points,
+    possibly reversed, that most shortens the path, until no move helps. The
+    first and last points stay in place.
+
+    As in two_opt, a run is only moved next to one of the closest points of its
+    ends
+
+    Parameters
+    ----------
+    order: array of point indices
+    dist: distance matrix
+    max_segment_length
+    neighbours: output of nearest_neighbours, computed if not given
+
+    Returns
+    -------
+    improved order, and whether any run was moved
+    """
+    order = np.array(order)
+    n = len(order)
+    moved = False
+    if n <= 3:
+        return order, moved
+
+    if neighbours is None:
+        neighbours = nearest_neighbours(dist, NEIGHBOURS)
+    positions = np.empty(n, dtype=np.int64)
+    while True:
+        positions[order] = np.arange(n)
+
+        # every run order[start : end + 1] that leaves the first and last point
+        starts, ends = [], []
+        for length in range(1, min(max_segment_length, n - 2) + 1):
+            run_starts = np.arange(1, n - length)
+            starts.append(run_starts)
+            ends.append(run_starts + length - 1)
+        starts, ends = np.concatenate(starts), np.concatenate(ends)
+        first, last = order[starts], order[ends]
+        removal_gain = (
+            dist[order[starts - 1], first]
+            + dist[last, order[ends + 1]]
+            - dist[order[starts - 1], order[ends + 1]]
+        )
+
+        # the run goes between order[p] and order[p + 1], on either side of a
+        # neighbour of one of its ends
+        near = positions[np.hstack((neighbours[first], neighbours[last]))]
+        p = np.hstack((near, near - 1))
+        run = np.repeat(np.arange(len(starts)), p.shape[1])
+        p = p.ravel()
+        # the edge must survive taking the run out
+        valid = (p >= 0) & (p < n - 1) & ((p < starts[run] - 1) | (p > ends[run]))
+        run, p = run[valid], p[valid]
+        if not len(p):
+            return order, moved
+
+        heads, tails = order[p], order[p + 1]
+        base = dist[heads, tails]
+        forward = dist[heads, first[run]] + dist[last[run], tails] - base
+        backward = dist[heads, last[run]] + dist[first[run], tails] - base
+        delta = np.minimum(forward, backward) - removal_gain[run]
+
+        best = np.argmin(delta)
+        if delta[best] >= -IMPROVEMENT_TOLERANCE_KM:
+            return order, moved
+
+        start, end, p = starts[run[best]], ends[run[best]], p[best]
+        segment = order[start : end + 1]
+        if backward[best] < forward[best]:
+            segment = segment[::-1]
+        rest = np.concatenate((order[:start], order[end + 1 :]))
+        insert_at = p + 1 if p < start else p - (end - start)
+        order = np.concatenate((rest[:insert_at], segment, rest[insert_at:]))
+        moved = True
+
+
+def optimize_order(dist, max_rounds=50):
+    """
+    Order points to approximately minimize the length of an open path between
+    the first and the last of them, which stay fixed: nearest neighbour
+    construction followed by rounds of 2-opt and Or-opt until neither helps
+
+    Parameters
+    ----------
+    dist: (N, N) distance matrix, e.g. from distance_matrix_km
+    max_rounds
+
+    Returns
+    -------
+    array of point indices, starting at 0 and ending at N - 1
+    """
+    order = nearest_neighbour_order(dist)
+    if len(order) <= 3:
+        return order
+
+    neighbours = nearest_neighbours(dist, NEIGHBOURS)
+    for _ in range(max_rounds):
+        order = two_opt(order, dist, neighbours)
+        order, moved = or_opt(order, dist, neighbours=neighbours)
+        if not moved:
+            break
+    return order
@@ -0,0 +1,122 @@
+import numpy as np
+
+# Google encodes coordinates as integers with 5 decimal places
+POLYLINE_PRECISION = 1e5
+
+
+def _decode_values(encoded):
+    """
+    Decode the signed integers of an encoded polyline string.
+
+    Each value is a run of 5 bit chunks, least significant first, where every
+    chunk but the last has the 0x20 continuation bit set.
+
+    Parameters
+    ----------
+    encoded
+
+    Returns
+    -------
+    int64 array of values and bool array marking the last byte of each value
+    """
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64)
+    chunks -= 63
+    is_last = (chunks & 0x20) == 0
+
+    value_starts = np.flatnonzero(np.concatenate(([True], is_last[:-1])))
+    value_ids = np.cumsum(is_last) - is_last
+    shifts = 5 * (np.arange(len(chunks)) - value_starts[value_ids])
+    values = np.add.reduceat((chunks & 0x1F) << shifts, value_starts)
+
+    # undo the zig-zag encoding of the sign
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    return values, is_last
+
+
+def decode_polyline(encoded):
+    """
+    Vectorized version of googlemaps.convert.decode_polyline
+
+    Parameters
+    ----------
+    encoded
+
+    Returns
+    -------
+    float64 array of shape (N, 2) holding lat, lng pairs
+    """
+    return decode_polylines([encoded])
+
+
+def decode_polylines(encoded_list):
+    """
+    Decode several polylines, e.g. the steps of a leg, into a single array.
+
+    The strings are decoded in one pass. Since every polyline starts from an
+    absolute coordinate, the running sum is reset at each polyline boundary.
+
+    Parameters
+    ----------
+    encoded_list
+
+    Returns
+    -------
+    float64 array of shape (N, 2) holding lat, lng pairs
+    """
+    encoded_list = [e for e in encoded_list if e]
+    if not encoded_list:
+        return np.empty((0, 2), dtype=np.float64)
+
+    values, is_last = _decode_values("".join(encoded_list))
+    deltas = values.reshape(-1, 2)
+
+    # number of points in each polyline, from the values ending in each string
+    byte_offsets = np.cumsum([0] + [len(e) for e in encoded_list[:-1]])
+    points_per_polyline = np.add.reduceat(is_last, byte_offsets) // 2
+
+    coords = np.cumsum(deltas, axis=0)
+    first_points = np.cumsum(points_per_polyline)[:-1]
+    if len(first_points):
+        # the running total at the end of the previous polylines is subtracted
+        # from every point of the polyline that follows them
+        corrections = np.vstack(([[0, 0]], coords[first_points - 1]))
+        coords -= np.repeat(corrections, points_per_polyline, axis=0)
+
+    return coords / POLYLINE_PRECISION
+
+
+def encode_polyline(path):
+    """
+    Vectorized version of googlemaps.convert.encode_polyline
+
+    Parameters
+    ----------
+    path: (N, 2) array of lat, lng
+
+    Returns
+    -------
+    encoded polyline string
+    """
+    path = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+    if not len(path):
+        return ""
+
+    values = np.round(path * POLYLINE_PRECISION).astype(np.int64)
+    values = np.diff(values, axis=0, prepend=[[0, 0]]).ravel()
+    values = np.where(values < 0, ~(values << 1), values << 1)
+
+    # split each value into 5 bit chunks, least significant first, setting the
+    # continuation bit on every chunk but the last
+    n_chunks = np.ones(len(values), dtype=np.int64)
+    while True:
+        more = (values >> (5 * n_chunks)) > 0
+        if not more.any():
+            break
+        n_chunks += more
+
+    positions = np.arange(n_chunks.max())
+    chunks = (values[:, None] >> (5 * positions)) & 0x1F
+    chunks |= np.where(positions < n_chunks[:, None] - 1, 0x20, 0)
+    chunks += 63
+
+    return chunks[positions < n_chunks[:, None]].astype(np.uint8).tobytes().decode()
@@ -17,6 +17,7 @@ def test(query=None):
         openai_api_key=secrets["OPENAI_API_KEY"],
         google_maps_key=secrets["GOOGLE_MAPS_API_KEY"],
         google_palm_api_key=secrets["GOOGLE_PALM_API_KEY"],
+        google_maps_base_url=secrets["GOOGLE_MAPS_BASE_URL"],
     )
 
     mapper.parse(query, make_map=True)
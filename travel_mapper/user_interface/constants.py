@@ -4,3 +4,4 @@ I want to visit national parks and cities with good food.
 I want use a rental car and drive for no more than 3 hours on any given day. 
 """
 VALID_MESSAGE = "Plan is valid"
+MODEL_CHOICES = ["gpt-3.5-turbo", "gpt-4", "models/text-bison-001"]
@@ -5,7 +5,8 @@ import gradio as gr
 from travel_mapper.TravelMapper import TravelMapperForUI, load_secrets, assert_secrets
 from travel_mapper.user_interface.capture_logs import PrintLogCapture
 from travel_mapper.user_interface.utils import generate_generic_leafmap
-from travel_mapper.user_interface.constants import EXAMPLE_QUERY
+from travel_mapper.user_interface.constants import EXAMPLE_QUERY, MODEL_CHOICES
+from travel_mapper.routing.maps_clients import warm_up_maps_client_once
 
 
 def read_logs():
@@ -28,9 +29,22 @@ def main():
         openai_api_key=secrets["OPENAI_API_KEY"],
         google_maps_key=secrets["GOOGLE_MAPS_API_KEY"],
         google_palm_api_key=secrets["GOOGLE_PALM_API_KEY"],
+        google_maps_base_url=secrets["GOOGLE_MAPS_BASE_URL"],
+        # build the chains of every model the user can pick before serving, those
+        # that fail to build are skipped and fail when picked instead
+        preload_models=MODEL_CHOICES,
     )
+    # connect to the maps API while the UI is starting up
+    warm_up_maps_client_once(travel_mapper.route_finder.gmaps)
     sys.stdout = PrintLogCapture("output.log")
 
+    async def generate_with_leafmap(query, model_name, request: gr.Request):
+        # routes are kept per browser session, so that a trip edited by the user
+        # only re-routes the legs that changed
+        return await travel_mapper.generate_with_leafmap_async(
+            query, model_name, session_id=request.session_hash
+        )
+
     # build the UI in gradio
     app = gr.Blocks()
 
@@ -48,7 +62,7 @@ def main():
 
                         radio_map = gr.Radio(
                             value="gpt-3.5-turbo",
-                            choices=["gpt-3.5-turbo", "gpt-4", "models/text-bison-001"],
+                            choices=MODEL_CHOICES,
                             label="models",
                         )
 
@@ -77,7 +91,7 @@ def main():
 
                         radio_no_map = gr.Radio(
                             value="gpt-3.5-turbo",
-                            choices=["gpt-3.5-turbo", "gpt-4", "models/text-bison-001"],
+                            choices=MODEL_CHOICES,
                             label="Model choices",
                         )
 
@@ -93,7 +107,7 @@ def main():
                 text_button = gr.Button("Generate")
 
         map_button.click(
-            travel_mapper.generate_with_leafmap,
+            generate_with_leafmap,
             inputs=[text_input_map, radio_map],
             outputs=[map_output, itinerary_output, query_validation_text],
         )
@@ -1,6 +1,7 @@
 import leafmap.foliumap as leafmap
 import folium
 from travel_mapper.user_interface.constants import VALID_MESSAGE
+from travel_mapper.constants import MAP_SIMPLIFY_TOLERANCE_KM, MAP_MAX_ROUTE_POINTS
 
 
 def validation_message(validiation_agent_response):
@@ -41,40 +42,34 @@ def generate_generic_leafmap():
     return map.to_gradio()
 
 
-def generate_leafmap(directions_list, sampled_route):
+def generate_leafmap(
+    route,
+    sampled_route,
+    simplify_tolerance_km=MAP_SIMPLIFY_TOLERANCE_KM,
+    max_route_points=MAP_MAX_ROUTE_POINTS,
+):
     """
 
     Parameters
     ----------
-    directions_list
-    sampled_route
+    route: Route, used for the stop markers
+    sampled_route: Route, used for the lines
+    simplify_tolerance_km
+    max_route_points: total number of route points drawn, shared between the
+        legs by length
 
     Returns
     -------
 
     """
-    map_start_loc_lat = directions_list[0]["legs"][0]["start_location"]["lat"]
-    map_start_loc_lon = directions_list[0]["legs"][0]["start_location"]["lng"]
-    map_start_loc = [map_start_loc_lat, map_start_loc_lon]
-
-    marker_points = []
-
-    # extract the location points from the previous directions function
-    for segment in directions_list:
-        for leg in segment["legs"]:
-            leg_start_loc = leg["start_location"]
-            marker_points.append(
-                ([leg_start_loc["lat"], leg_start_loc["lng"]], leg["start_address"])
-            )
-
-    last_stop = directions_list[-1]["legs"][-1]
-    last_stop_coords = last_stop["end_location"]
-    marker_points.append(
-        (
-            [last_stop_coords["lat"], last_stop_coords["lng"]],
-            last_stop["end_address"],
-        )
-    )
+    if not route:
+        # e.g. a session route whose stops could not be routed
+        return generate_generic_leafmap()
+
+    map_start_loc = route[0].start.location
+
+    # extract the location points from the route
+    marker_points = [(stop.location, stop.address) for stop in route.stops]
 
     map = leafmap.Map(location=map_start_loc, tiles="OpenStreetMap", zoom_start=8)
 
@@ -87,13 +82,16 @@ def generate_leafmap(directions_list, sampled_route):
             icon=folium.Icon(color="red", icon="info-sign"),
         ).add_to(map)
 
-    for leg_id, route_points in sampled_route.items():
-        leg_distance = route_points["distance"]
-        leg_duration = route_points["duration"]
+    sampled_route = sampled_route.simplify(
+        tolerance_km=simplify_tolerance_km, max_points=max_route_points
+    )
+    for leg_id, leg in enumerate(sampled_route):
+        leg_distance = leg.distance_text
+        leg_duration = leg.duration_text
 
         f_group = folium.FeatureGroup("Leg {}".format(leg_id))
         folium.vector_layers.PolyLine(
-            route_points["route"],
+            leg.path.tolist(),
             popup="<b>Route segment {}</b>".format(leg_id),
             tooltip="Distance: {}, Duration: {}".format(leg_distance, leg_duration),
             color="blue",